@@ -0,0 +1,273 @@
+# encoding: utf-8
+# Copyright 2026 California Institute of Technology. ALL RIGHTS
+# RESERVED. U.S. Government Sponsorship acknowledged.
+
+u'''End-to-end benchmark of the sync tools.
+
+Generates (or reuses) a synthetic corpus, then runs each phase of a full sync against an in-memory directory
+and reports, for each, how long it took, how many items it handled per second, how many LDAP round trips it
+made, and the most memory the process used meanwhile.  The phases are:
+
+parse
+    Fetch and parse users, sites, and committees.
+sync, resync
+    ``dmccsync`` into an empty directory, then again with nothing to do.
+reconcile
+    ``dmccsync --reconcile`` after a few people's email addresses changed.
+groups, regroup
+    ``dmccgroupsync``, then again with nothing to do.
+passwords
+    ``secureoldpasswords`` over everyone, a tenth of whom have a weak password.
+
+Results can be saved as JSON and compared with a saved baseline to catch regressions.
+'''
+
+from corpus import generateCorpus, usersFile, sitesFile, committeesFile
+from ldapwriter import defaultWindow
+from memoryldap import MemoryDirectory
+from rdfloader import SourceLoader, defaultWorkers
+import dmccsync, dmccmakegroups, oldpasswords
+import argparse, base64, contextlib, hashlib, json, ldap, logging, os, os.path, random, resource, shutil, sys
+import tempfile, threading, time
+
+_ldapUrl = 'ldap://benchmark.invalid'
+_adminUser, _adminPass = 'uid=admin,ou=system', 'secret'
+_base = 'dc=edrn,dc=jpl,dc=nasa,dc=gov'
+_defaultPeople = 1000
+_defaultTolerance = 0.25
+
+# How often to sample memory use while a phase runs, in seconds
+_sampleInterval = 0.01
+
+
+def _residentBytes():
+    '''Get how much memory this process has resident now, or failing that the most it ever had.'''
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * resource.getpagesize()
+    except (IOError, OSError, ValueError, IndexError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class _MemorySampler(threading.Thread):
+    '''Samples resident memory until stopped, keeping the peak.'''
+    def __init__(self):
+        super(_MemorySampler, self).__init__()
+        self.daemon = True
+        self.peak = _residentBytes()
+        self._done = threading.Event()
+    def run(self):
+        while not self._done.wait(_sampleInterval):
+            self.peak = max(self.peak, _residentBytes())
+    def stop(self):
+        self._done.set()
+        self.join()
+        self.peak = max(self.peak, _residentBytes())
+        return self.peak
+
+
+class PhaseResult(object):
+    '''What one benchmark phase did: its ``name``, how many ``seconds`` it took, how many ``items`` it
+    handled, the LDAP ``requests`` it made by kind, and its ``peakBytes`` of resident memory.'''
+    def __init__(self, name, seconds, items, requests, peakBytes):
+        self.name, self.seconds, self.items, self.requests, self.peakBytes = name, seconds, items, requests, peakBytes
+    def roundTrips(self):
+        return sum(self.requests.itervalues())
+    def rate(self):
+        '''Items per second.'''
+        return self.items / self.seconds if self.seconds > 0 else float(self.items)
+    def asDict(self):
+        return dict(name=self.name, seconds=self.seconds, items=self.items, rate=self.rate(),
+            roundTrips=self.roundTrips(), requests=dict(self.requests), peakBytes=self.peakBytes)
+
+
+@contextlib.contextmanager
+def _quiet():
+    '''Keep the tools' printing and logging from swamping the output, and from slowing them down.'''
+    stdout, devnull = sys.stdout, open(os.devnull, 'w')
+    sys.stdout = devnull
+    logging.disable(logging.INFO)
+    try:
+        yield
+    finally:
+        logging.disable(logging.NOTSET)
+        sys.stdout = stdout
+        devnull.close()
+
+
+def _ssha(password, rng):
+    salt = ''.join(chr(rng.randint(0, 255)) for i in xrange(8))
+    return '{SSHA}' + base64.b64encode(hashlib.sha1(password + salt).digest() + salt)
+
+
+def _people(directory):
+    return [dn for dn, attrs in directory.search(_base, ldap.SCOPE_ONELEVEL, '(objectClass=edrnPerson)', ['1.1'])]
+
+
+class Benchmark(object):
+    '''Runs the benchmark phases over the corpus files ``paths`` (users, sites, committees) against a fresh
+    ``MemoryDirectory`` with the given ``latency`` per request.'''
+    def __init__(self, paths, latency=0.0, window=defaultWindow, jobs=defaultWorkers, processes=None, seed=0):
+        self.usersPath, self.sitesPath, self.committeesPath = paths
+        self.window, self.jobs, self.processes = window, jobs, processes
+        self.directory = MemoryDirectory(latency)
+        self.rng = random.Random(seed)
+        self.results = []
+    def _phase(self, name, operation):
+        before = self.directory.requests.copy()
+        sampler = _MemorySampler()
+        sampler.start()
+        start = time.time()
+        try:
+            with _quiet():
+                with self.directory.installed():
+                    items = operation()
+        finally:
+            seconds = time.time() - start
+            peak = sampler.stop()
+        requests = self.directory.requests.copy()
+        requests.subtract(before)
+        result = PhaseResult(name, seconds, items, dict((k, v) for k, v in requests.iteritems() if v), peak)
+        self.results.append(result)
+        return result
+    def _options(self):
+        return ['-u', _adminUser, '-p', _adminPass, '-l', _ldapUrl, '-w', str(self.window), '-j', str(self.jobs)]
+    def parse(self):
+        loader = SourceLoader(workers=self.jobs)
+        persons, sites, committees = loader.load([self.usersPath], [self.sitesPath], [self.committeesPath])
+        return len(persons) + len(sites) + len(committees)
+    def sync(self):
+        before = self.directory.requests['add']
+        dmccsync.main(['dmccsync'] + self._options() + [self.usersPath])
+        return self.directory.requests['add'] - before
+    def resync(self):
+        dmccsync.main(['dmccsync'] + self._options() + [self.usersPath])
+        return len(_people(self.directory))
+    def prepareReconcile(self):
+        people = _people(self.directory)
+        for dn in self.rng.sample(people, max(1, len(people) // 100)):
+            self.directory.modify(dn, [(ldap.MOD_REPLACE, 'mail', ['changed.%d@example.com' % self.rng.randint(0,
+                1 << 30)])])
+    def reconcile(self):
+        changes = dmccsync.reconcile(self.usersPath, _ldapUrl, _adminUser, _adminPass, window=self.window)
+        return len(changes)
+    def groups(self):
+        before = len(self.directory)
+        dmccmakegroups.main(['dmccgroupsync'] + self._options() + [self.usersPath, self.sitesPath,
+            self.committeesPath])
+        return len(self.directory) - before
+    def regroup(self):
+        dmccmakegroups.main(['dmccgroupsync'] + self._options() + [self.usersPath, self.sitesPath,
+            self.committeesPath])
+        return len(self.directory.search(_base, ldap.SCOPE_ONELEVEL, '(objectClass=groupOfUniqueNames)', ['1.1']))
+    def preparePasswords(self):
+        for dn in _people(self.directory):
+            password = 'changeme' if self.rng.random() < 0.1 else 'strong-%d' % self.rng.randint(0, 1 << 30)
+            self.directory.modify(dn, [(ldap.MOD_REPLACE, 'userPassword', [_ssha(password, self.rng)])])
+    def passwords(self):
+        oldpasswords.fixPasswords(_adminUser, _adminPass, _ldapUrl, '(objectClass=edrnPerson)', ldap.SCOPE_ONELEVEL,
+            _base, processes=self.processes)
+        return len(_people(self.directory))
+    phases = ('parse', 'sync', 'resync', 'reconcile', 'groups', 'regroup', 'passwords')
+    def run(self, phases=None):
+        '''Run the named ``phases`` (all by default) in order; return their ``PhaseResult``s.  Any setup a
+        phase needs, like changing the directory behind the tools' backs, isn't counted in its results.'''
+        for name in phases or self.phases:
+            if name not in self.phases: raise ValueError(u'Unknown phase "%s"' % name)
+            prepare = getattr(self, 'prepare' + name.capitalize(), None)
+            if prepare is not None: prepare()
+            self._phase(name, getattr(self, name))
+        return self.results
+
+
+def runBenchmark(people=_defaultPeople, corpusDirectory=None, latency=0.0, window=defaultWindow,
+    jobs=defaultWorkers, processes=None, seed=0, phases=None):
+    '''Benchmark the sync tools on a corpus of ``people`` people in ``corpusDirectory`` (generated there if
+    it doesn't have one, or in a temporary directory if None).  Return the ``PhaseResult``s, starting with
+    the corpus generation if there was one.'''
+    temporary = corpusDirectory is None
+    if temporary: corpusDirectory = tempfile.mkdtemp(prefix='dmccbench')
+    try:
+        paths = tuple(os.path.join(corpusDirectory, i) for i in (usersFile, sitesFile, committeesFile))
+        generated = None
+        if not all(os.path.isfile(i) for i in paths):
+            start = time.time()
+            paths = generateCorpus(corpusDirectory, people, seed=seed)
+            generated = PhaseResult('generate', time.time() - start, people, {}, _residentBytes())
+        benchmark = Benchmark(paths, latency, window, jobs, processes, seed)
+        results = benchmark.run(phases)
+        return ([generated] if generated else []) + results
+    finally:
+        if temporary: shutil.rmtree(corpusDirectory, ignore_errors=True)
+
+
+def report(results, out=sys.stdout):
+    '''Write a table of ``results``.'''
+    print >>out, u'%-10s %10s %10s %12s %12s %10s' % (u'phase', u'seconds', u'items', u'items/s', u'round trips',
+        u'peak MiB')
+    for r in results:
+        print >>out, u'%-10s %10.3f %10d %12.1f %12d %10.1f' % (r.name, r.seconds, r.items, r.rate(), r.roundTrips(),
+            r.peakBytes / 1048576.0)
+
+
+def regressions(results, baseline, tolerance=_defaultTolerance):
+    '''Compare ``results`` with ``baseline``, a list of dicts as from ``PhaseResult.asDict``.  Return a
+    message for each phase whose rate fell, or whose round trips or peak memory rose, by more than
+    ``tolerance``.'''
+    messages, previous = [], dict((i['name'], i) for i in baseline)
+    for r in results:
+        old = previous.get(r.name)
+        if old is None: continue
+        if r.rate() < old['rate'] * (1 - tolerance):
+            messages.append(u'%s: %.1f items/s, down from %.1f' % (r.name, r.rate(), old['rate']))
+        if r.roundTrips() > old['roundTrips'] * (1 + tolerance):
+            messages.append(u'%s: %d round trips, up from %d' % (r.name, r.roundTrips(), old['roundTrips']))
+        if r.peakBytes > old['peakBytes'] * (1 + tolerance):
+            messages.append(u'%s: peak %.1f MiB, up from %.1f' % (r.name, r.peakBytes / 1048576.0,
+                old['peakBytes'] / 1048576.0))
+    return messages
+
+
+_argParser = argparse.ArgumentParser(description=u'Benchmark dmccsync, dmccgroupsync, and secureoldpasswords')
+_argParser.add_argument('-n', '--people', type=int, default=_defaultPeople,
+    help=u'How many people in a generated corpus; default %(default)s')
+_argParser.add_argument('-d', '--corpus', help=u'Directory of corpus RDF, generated there if not already present')
+_argParser.add_argument('-l', '--latency', type=float, default=0.0,
+    help=u'Milliseconds the directory takes to answer each request; default %(default)s')
+_argParser.add_argument('-w', '--window', type=int, default=defaultWindow,
+    help=u'LDAP writes in flight at once; default %(default)s')
+_argParser.add_argument('-j', '--jobs', type=int, default=defaultWorkers,
+    help=u'RDF sources to fetch and parse at once; default %(default)s')
+_argParser.add_argument('-P', '--processes', type=int,
+    help=u'Worker processes for checking passwords; default one per CPU')
+_argParser.add_argument('-r', '--seed', type=int, default=0, help=u'Random seed; default %(default)s')
+_argParser.add_argument('-o', '--json', help=u'Save results as JSON to this file')
+_argParser.add_argument('-b', '--baseline', help=u'Compare with results saved earlier with --json')
+_argParser.add_argument('-t', '--tolerance', type=float, default=_defaultTolerance,
+    help=u'Fraction by which a phase may get worse than the baseline; default %(default)s')
+_argParser.add_argument('phases', nargs='*', metavar='phase',
+    help=u'Phases to run, from %s; default all of them' % u', '.join(Benchmark.phases))
+
+
+def main():
+    args = _argParser.parse_args()
+    for phase in args.phases:
+        if phase not in Benchmark.phases: _argParser.error(u'Unknown phase "%s"' % phase)
+    results = runBenchmark(args.people, args.corpus, args.latency / 1000.0, args.window, args.jobs, args.processes,
+        args.seed, args.phases)
+    report(results)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump([r.asDict() for r in results], f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            messages = regressions(results, json.load(f), args.tolerance)
+        for message in messages:
+            print >>sys.stderr, u'Regression in ' + message
+        return not messages
+    return True
+
+
+if __name__ == '__main__':
+    sys.exit(0 if main() else -1)
@@ -0,0 +1,74 @@
+# encoding: utf-8
+# Copyright 2026 California Institute of Technology. ALL RIGHTS
+# RESERVED. U.S. Government Sponsorship acknowledged.
+
+u'''What changed in the DMCC RDF since the last run.
+
+A ``FingerprintState`` is a small SQLite file holding the fingerprint of every person, site, and committee as
+of the last successful run, keyed by uid for people and RDF id for sites and committees.  ``diff`` compares
+freshly parsed entities with it and gives a ``ChangeFeed`` of those added, changed, and removed; once the
+changes have been written to LDAP, ``update`` makes them the new state.  A run whose RDF hasn't changed thus
+has nothing to write, and one where a few entities have changed writes only those.
+'''
+
+import sqlite3
+
+_schema = u'''
+create table if not exists fingerprints (kind text not null, key text not null, fingerprint text not null,
+    primary key (kind, key));
+'''
+
+# How each kind of entity is keyed
+_keyAttributes = {'person': 'uid', 'site': 'id', 'committee': 'id'}
+
+
+class ChangeFeed(object):
+    '''The ``added`` and ``changed`` entities of one ``kind``, and the keys of the ``removed`` ones, since the
+    last run.'''
+    def __init__(self, kind, added, changed, removed, fingerprints):
+        self.kind, self.added, self.changed, self.removed = kind, added, changed, removed
+        self.fingerprints = fingerprints
+    def entities(self):
+        '''Give the added and changed entities together.'''
+        return self.added + self.changed
+    def __len__(self):
+        return len(self.added) + len(self.changed) + len(self.removed)
+    def __str__(self):
+        return "%d added, %d changed, %d removed" % (len(self.added), len(self.changed), len(self.removed))
+
+
+class FingerprintState(object):
+    '''Fingerprints of the entities seen by the last successful run, kept in the SQLite file at ``path``.'''
+    def __init__(self, path):
+        self.db = sqlite3.connect(path)
+        self.db.executescript(_schema)
+    def close(self):
+        self.db.close()
+    def diff(self, kind, entities):
+        '''Compare ``entities`` of ``kind`` ("person", "site", or "committee") with the state and return the
+        ``ChangeFeed`` between them.  Of entities with the same key, only the first counts.'''
+        key = _keyAttributes[kind]
+        previous = dict(self.db.execute(u'select key, fingerprint from fingerprints where kind = ?', (kind,)))
+        added, changed, fingerprints = [], [], {}
+        for entity in entities:
+            name = getattr(entity, key)
+            if name in fingerprints: continue
+            fingerprint = fingerprints[name] = entity.fingerprint()
+            old = previous.pop(name, None)
+            if old is None:
+                added.append(entity)
+            elif old != fingerprint:
+                changed.append(entity)
+        return ChangeFeed(kind, added, changed, sorted(previous), fingerprints)
+    def update(self, *feeds):
+        '''Make the entities in ``feeds`` the state, as once their changes are safely in LDAP.'''
+        with self.db:
+            for feed in feeds:
+                key = _keyAttributes[feed.kind]
+                self.db.executemany(u'insert or replace into fingerprints values (?, ?, ?)', ((feed.kind,
+                    getattr(entity, key), feed.fingerprints[getattr(entity, key)]) for entity in feed.entities()))
+                self.db.executemany(u'delete from fingerprints where kind = ? and key = ?',
+                    ((feed.kind, name) for name in feed.removed))
+    def count(self, kind):
+        '''Tell how many entities of ``kind`` the state holds.'''
+        return self.db.execute(u'select count(*) from fingerprints where kind = ?', (kind,)).fetchone()[0]
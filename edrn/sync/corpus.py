@@ -0,0 +1,187 @@
+# encoding: utf-8
+# Copyright 2026 California Institute of Technology. ALL RIGHTS
+# RESERVED. U.S. Government Sponsorship acknowledged.
+
+u'''Synthetic DMCC RDF for trying the sync tools at scale.
+
+``generateCorpus`` writes users, sites, and committees RDF shaped like what DMCC publishes, for any number of
+people.  Sites get a long-tailed spread of staff and most have a PI; committees draw members from across the
+whole network, and about a quarter are collaborative groups.  A few people have no email address, odd phone
+numbers, or given names that aren't ASCII, as in the real feeds.  The same ``seed`` always gives the same corpus.
+Everything is written as it's generated, so even a million people take little memory.
+'''
+
+from xml.sax.saxutils import escape, quoteattr
+import argparse, bisect, codecs, os, os.path, random, sys
+
+_personURI = u'http://edrn.nci.nih.gov/data/registered-person/%d'
+_siteURI = u'http://edrn.nci.nih.gov/data/sites/%d'
+_committeeURI = u'http://edrn.nci.nih.gov/data/committees/%d'
+
+_givenNames = (u'Christopher', u'Paul', u'Heather', u'Dan', u'Sean', u'Laurie', u'Jerry', u'María', u'Sudhir',
+    u'Ying', u'Olga', u'Kwame', u'Ana', u'David', u'Sharon', u'Björn', u'Priya', u'Hiroshi', u'Fatima', u'John')
+_surnames = (u'Mattmann', u'Ramirez', u'Kincaid', u'Crichton', u'Kelly', u'Locascio', u'Haney', u'Srivastava',
+    u'Zhang', u'Novak', u'Mensah', u'Silva', u'Nguyen', u'Cohen', u'Mueller', u'Patel', u'Tanaka', u'Haddad',
+    u'Smith', u'Odegard')
+_domains = (u'jpl.nasa.gov', u'nih.gov', u'uchsc.edu', u'nist.gov', u'mdanderson.org', u'fhcrc.org')
+_memberTypes = (u'Associate Member A - EDRN Funded', u'Associate Member B', u'Associate Member C',
+    u'Biomarker Developmental Laboratories', u'Biomarker Reference Laboratories',
+    u'Clinical Epidemiology and Validation Center', u'Data Management and Coordinating Center')
+_organs = (u'Breast and Gynecologic', u'Prostate and Urologic', u'G.I. and Other Associated',
+    u'Lung and Upper Aerodigestive')
+_committeeTypes = ((u'Committee', 2), (u'Subcommittee', 5), (u'Team', 1), (u'Working Group', 1))
+
+_usersHeader = u'''<?xml version="1.0" encoding="UTF-8"?>
+<rdf:RDF
+   xmlns:_3="http://xmlns.com/foaf/0.1/"
+   xmlns:_4="http://edrn.nci.nih.gov/rdf/schema.rdf#"
+   xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#"
+>
+'''
+_sitesHeader = u'''<?xml version="1.0" encoding="UTF-8"?>
+<rdf:RDF
+   xmlns:_3="http://edrn.nci.nih.gov/rdf/schema.rdf#"
+   xmlns:_4="http://purl.org/dc/terms/"
+   xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#"
+>
+'''
+_committeesHeader = u'''<?xml version="1.0" encoding="UTF-8"?>
+<rdf:RDF
+   xmlns:_3="http://edrn.nci.nih.gov/xml/rdf/edrn.rdf#"
+   xmlns:_4="http://purl.org/dc/terms/"
+   xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#"
+>
+'''
+_footer = u'</rdf:RDF>\n'
+
+# Names of the files ``generateCorpus`` writes
+usersFile, sitesFile, committeesFile = 'users.rdf', 'sites.rdf', 'committees.rdf'
+
+
+def _defaultSites(people):
+    return max(1, people // 10)
+
+
+def _defaultCommittees(people):
+    return max(4, min(people // 50, 5000))
+
+
+def _siteBoundaries(rng, people, sites):
+    '''Split ``people`` among ``sites`` with a long tail of sizes; return the first person of each site.'''
+    weights = [rng.paretovariate(1.5) for i in xrange(sites)]
+    total = sum(weights)
+    starts, start = [], 0
+    for weight in weights:
+        starts.append(start)
+        start = min(people, start + max(0, int(round(people * weight / total))))
+    return starts
+
+
+def _writePeople(out, rng, people, starts):
+    out.write(_usersHeader)
+    for i in xrange(people):
+        given, surname = rng.choice(_givenNames), rng.choice(_surnames)
+        site = bisect.bisect_right(starts, i) - 1
+        out.write(u'  <rdf:Description rdf:about=%s>\n' % quoteattr(_personURI % i))
+        out.write(u'    <rdf:type rdf:resource="http://edrn.nci.nih.gov/rdf/types.rdf#Person"/>\n')
+        out.write(u'    <_3:accountName>%s%d</_3:accountName>\n' % (escape(given[0].lower()), i))
+        out.write(u'    <_3:givenname>%s</_3:givenname>\n' % escape(given))
+        out.write(u'    <_3:surname>%s</_3:surname>\n' % escape(surname))
+        if rng.random() > 0.02:
+            out.write(u'    <_3:mbox>mailto:%s.%d@%s</_3:mbox>\n' % (escape(surname.lower()), i, rng.choice(_domains)))
+        phone = rng.random()
+        if phone < 0.9:
+            out.write(u'    <_3:phone>%03d-%03d-%04d</_3:phone>\n' % (rng.randint(201, 989), rng.randint(200, 999),
+                rng.randint(0, 9999)))
+        elif phone < 0.97:
+            out.write(u'    <_3:phone>+1 (%03d) %03d.%04d x%d</_3:phone>\n' % (rng.randint(201, 989),
+                rng.randint(200, 999), rng.randint(0, 9999), rng.randint(1, 999)))
+        out.write(u'    <_4:site rdf:resource=%s/>\n' % quoteattr(_siteURI % site))
+        out.write(u'    <_4:edrnTitle>Staff</_4:edrnTitle>\n')
+        out.write(u'  </rdf:Description>\n')
+    out.write(_footer)
+
+
+def _writeSites(out, rng, people, starts):
+    out.write(_sitesHeader)
+    for site, start in enumerate(starts):
+        end = starts[site + 1] if site + 1 < len(starts) else people
+        out.write(u'  <rdf:Description rdf:about=%s>\n' % quoteattr(_siteURI % site))
+        out.write(u'    <rdf:type rdf:resource="http://edrn.nci.nih.gov/rdf/types.rdf#Site"/>\n')
+        out.write(u'    <_4:title>Synthetic Research Center %d</_4:title>\n' % site)
+        out.write(u'    <_3:abbrevName>SRC%d</_3:abbrevName>\n' % site)
+        out.write(u'    <_3:memberType>%s</_3:memberType>\n' % escape(rng.choice(_memberTypes)))
+        out.write(u'    <_3:program>Biomarker research program %d</_3:program>\n' % site)
+        if end > start and rng.random() > 0.05:
+            out.write(u'    <_3:pi rdf:resource=%s/>\n' % quoteattr(_personURI % start))
+        for person in xrange(start, end):
+            out.write(u'    <_3:staff rdf:resource=%s/>\n' % quoteattr(_personURI % person))
+        out.write(u'  </rdf:Description>\n')
+    out.write(_footer)
+
+
+def _writeCommittees(out, rng, people, committees):
+    out.write(_committeesHeader)
+    types = [name for name, weight in _committeeTypes for i in xrange(weight)]
+    for committee in xrange(committees):
+        out.write(u'  <rdf:Description rdf:about=%s>\n' % quoteattr(_committeeURI % committee))
+        out.write(u'    <rdf:type rdf:resource="http://edrn.nci.nih.gov/rdf/types.rdf#Committee"/>\n')
+        if committee % 4 == 0:
+            title = u'%s %d Cancers Research Group' % (_organs[committee // 4 % len(_organs)], committee)
+            committeeType = u'Collaborative Group'
+        else:
+            committeeType = rng.choice(types)
+            title = u'Synthetic %s %d' % (committeeType, committee)
+        out.write(u'    <_4:title>%s</_4:title>\n' % escape(title))
+        out.write(u'    <_3:committeeType>%s</_3:committeeType>\n' % escape(committeeType))
+        size = min(people, max(3, int(rng.lognormvariate(3.0, 0.8))))
+        members = rng.sample(xrange(people), size)
+        out.write(u'    <_3:chair rdf:resource=%s/>\n' % quoteattr(_personURI % members[0]))
+        if size > 10:
+            out.write(u'    <_3:coChair rdf:resource=%s/>\n' % quoteattr(_personURI % members[1]))
+        for member in members[2 if size > 10 else 1:]:
+            out.write(u'    <_3:member rdf:resource=%s/>\n' % quoteattr(_personURI % member))
+        out.write(u'  </rdf:Description>\n')
+    out.write(_footer)
+
+
+def generateCorpus(directory, people, sites=None, committees=None, seed=0):
+    u'''Write users, sites, and committees RDF for ``people`` people into ``directory``.  Unless given, there
+    are a tenth as many ``sites`` and a fiftieth as many ``committees`` (at least 4, at most 5000).  Return
+    the paths of the users, sites, and committees files.'''
+    if people < 1: raise ValueError(u'There must be at least one person, not %d' % people)
+    sites = _defaultSites(people) if sites is None else sites
+    committees = _defaultCommittees(people) if committees is None else committees
+    if sites < 1 or committees < 1: raise ValueError(u'There must be at least one site and one committee')
+    if not os.path.isdir(directory): os.makedirs(directory)
+    rng = random.Random(seed)
+    starts = _siteBoundaries(rng, people, sites)
+    paths = tuple(os.path.join(directory, name) for name in (usersFile, sitesFile, committeesFile))
+    for path, write, args in zip(paths, (_writePeople, _writeSites, _writeCommittees),
+        ((people, starts), (people, starts), (people, committees))):
+        with codecs.open(path, 'w', 'utf-8') as out:
+            write(out, rng, *args)
+    return paths
+
+
+_argParser = argparse.ArgumentParser(description=u'Generate synthetic DMCC users, sites, and committees RDF')
+_argParser.add_argument('-s', '--sites', type=int, help=u'How many sites; default a tenth of the people')
+_argParser.add_argument('-c', '--committees', type=int,
+    help=u'How many committees; default a fiftieth of the people, at least 4 and at most 5000')
+_argParser.add_argument('-r', '--seed', type=int, default=0, help=u'Random seed; default %(default)s')
+_argParser.add_argument('directory', help=u'Where to write the RDF')
+_argParser.add_argument('people', type=int, help=u'How many people')
+
+
+def main():
+    args = _argParser.parse_args()
+    try:
+        for path in generateCorpus(args.directory, args.people, args.sites, args.committees, args.seed):
+            print path
+    except ValueError, ex:
+        _argParser.error(unicode(ex))
+    return True
+
+
+if __name__ == '__main__':
+    sys.exit(0 if main() else -1)
@@ -3,20 +3,42 @@
 # Copyright 2010 California Institute of Technology. ALL RIGHTS
 # RESERVED. U.S. Government Sponsorship acknowledged.
 
-u'''EDRN RDF Group Sync tool dmccgroupsync - parse user and site RDF from DMCC and build groups in EDRN IC cancer LDAPS server.
+u'''EDRN RDF Group Sync tool dmccgroupsync - parse user and site RDF from DMCC and build groups in EDRN IC
+cancer LDAPS server.
 '''
 
 import sys, getopt
+import collections
+import hashlib
 import warnings
 import ldap
 import ldap.modlist as modlist
+from ldif import LDIFWriter
+from changefeed import FingerprintState
+from dmccsync import exportPeople, ldifRecord
+from instrumentation import metrics
+from journal import journaling
 from rdf import RDFPersonList, RDFSiteList, RDFCollaborativeGroupList
-from syncldap import groupExists
+from rdfcache import SourceCache
+from rdfloader import SourceLoader, defaultWorkers
+from replicas import fanOut, uniqueServers
+from syncldap import ConnectionPool, DirectorySnapshot, normalizeDN
+from ldapwriter import PipelinedWriter, defaultWindow, throttle
+from .utils import outputFile
 
 warnings.filterwarnings("ignore")
 _verbose = False
+# Most member values to send in one modify, so that a huge change doesn't become one huge request
+_memberChunkSize = 1000
 _helpMessage = '''
-Usage: dmccgroupsync [-v] [-u LDAP DN] [-p password] [-l LDAP URL] RDF-USER-URL RDF-SITE-URL RDF-COMMITTEE-URL
+Usage: dmccgroupsync [-v] [-m] [-u LDAP DN] [-p password] [-l LDAP URL]... [-c cache dir] [-w window] [-j jobs]
+    [--max-rate=ops] [--max-latency=seconds] [--journal=dir | --changes=file] [--progress] [--metrics=file]
+    RDF-USER-URL... RDF-SITE-URL RDF-COMMITTEE-URL
+       dmccgroupsync --ldif=file [-c cache dir] [--progress] [--metrics=file]
+    RDF-USER-URL... RDF-SITE-URL RDF-COMMITTEE-URL
+
+People are read from every RDF-USER-URL given; those with the same uid in
+more than one are taken from the first.
 
 Options:
 -v, --verbose
@@ -27,7 +49,48 @@ Options:
 -p, --password
     The password for the user who has permission to add entries to the LDAP server.
 -l  --ldapUrl
-    The LDAP URL pointing to the server to synchronize with.
+    The LDAP URL pointing to the server to synchronize with. Give it more
+    than once to bring several servers in line at once: the RDF is read
+    once, and each server is compared and written to concurrently, with its
+    own progress, limits, and errors. If one fails, the rest carry on.
+-c, --cache
+    A directory in which to cache parsed RDF; unchanged RDF sources are then
+    neither downloaded nor parsed again.
+-w, --window
+    The most LDAP writes to keep in flight at once; defaults to 10. The run
+    starts with one and widens toward this while the server keeps up,
+    narrowing again when replies slow down. Writes the server turns away as
+    busy, unavailable, or out of time are retried after a pause.
+--max-rate
+    The most LDAP writes to send a second, however quickly the server copes.
+--max-latency
+    Narrow the window when LDAP writes take longer than this many seconds;
+    by default, four times the quickest seen, but at least 0.05.
+-j, --jobs
+    How many RDF sources to fetch and parse at once; defaults to 4.
+--journal
+    A directory in which to note each group written as the run goes. If the
+    run is interrupted, the next one on the same RDF skips them; the note is
+    deleted once a run finishes.
+--changes
+    A file in which to keep a fingerprint of every site and committee as of
+    the last run. Only the groups of sites and committees added or changed
+    since are looked up and written; if nothing has changed, the LDAP server
+    is not contacted at all. Changes that fail are tried again next run.
+-m, --prune-members
+    Remove group members who aren't in the RDF. Normally they're kept, since
+    people may be added to groups by hand.
+--progress
+    Show how far along the run is, with an estimate of the time left, on
+    standard error.
+--metrics
+    When done, save counts and timings of the run to this file: in the
+    Prometheus text format if it ends in .prom, for the node exporter's
+    textfile collector, and as JSON otherwise.
+--ldif
+    Rather than connecting to an LDAP server, write every person followed by
+    every group to this file (or standard output for -) as LDIF, for loading
+    a new directory offline with slapadd or ldapadd.
 
 Environment:
 None'''
@@ -41,82 +104,242 @@ class _Usage(Exception):
     def __init__(self, msg):
         self.msg = msg
         
-def makePIGroups(rdfUsersFile, rdfSiteFile, ldapUrl, adminUser, adminPass):
-    rdfPersons = RDFPersonList(rdfUsersFile)
-    rdfSites = RDFSiteList(rdfSiteFile, rdfPersons.persons)
-    
-    for site in rdfSites.sites:
+def makePIGroups(rdfUsersFile, rdfSiteFile, ldapUrl, adminUser, adminPass, cache=None, pool=None, snapshot=None,
+    window=defaultWindow, pruneMembers=False):
+    rdfPersons = RDFPersonList(rdfUsersFile, cache=cache)
+    rdfSites = RDFSiteList(rdfSiteFile, rdfPersons, cache=cache)
+    writeGroups(piGroups(rdfSites), ldapUrl, adminUser, adminPass, pool, snapshot, window, pruneMembers)
+
+def _piGroupName(site):
+    '''Name the PI group of ``site``, or return None if it has no PI.'''
+    if site.pi == None: return None
+    return (site.pi.lastname+" "+site.title).strip().replace(","," ")
+
+def piGroups(rdfSites):
+    '''Make a mapping of PI group name to staff from ``rdfSites``.'''
+    groups = collections.OrderedDict()
+    for site in rdfSites:
         # first need to create group name
-        if site.pi == None:
+        groupName = _piGroupName(site)
+        if groupName == None:
             print "Skipping ingestion of site: ["+site.title+"]: was not able to link to PI.\n"
             continue
         
-        groupName = site.pi.lastname+" "+site.title
-        groupName = groupName.strip().replace(","," ")
-        
         print "Processing PI group: ["+groupName+"]\n"
-        # now add group only if it doesn't exist yet
-        _addGroup(ldapUrl, adminUser, adminPass, groupName, site.staffList)
+        groups.setdefault(groupName, []).extend(site.staffList)
+    return groups
         
-def makeCollabGroups(rdfUsersFile, rdfCommitteesFile, ldapUrl, adminUser, adminPass):
-    rdfPersons = RDFPersonList(rdfUsersFile)
-    rdfCommittees = RDFCollaborativeGroupList(rdfCommitteesFile, rdfPersons.persons)
-    
-    for committee in rdfCommittees.groups:
-        if committee.groupType != None and committee.groupType == "Collaborative Group":
-            groupName = committee.title[0:committee.title.rfind("Cancers Research Group")].strip()
-            
+def makeCollabGroups(rdfUsersFile, rdfCommitteesFile, ldapUrl, adminUser, adminPass, cache=None, pool=None,
+    snapshot=None, window=defaultWindow, pruneMembers=False):
+    rdfPersons = RDFPersonList(rdfUsersFile, cache=cache)
+    rdfCommittees = RDFCollaborativeGroupList(rdfCommitteesFile, rdfPersons, cache=cache)
+    writeGroups(collabGroups(rdfCommittees), ldapUrl, adminUser, adminPass, pool, snapshot, window, pruneMembers)
+
+def _collabGroupName(committee):
+    '''Name the collaborative group of ``committee``, or return None if it isn't one.'''
+    if committee.groupType != None and committee.groupType == "Collaborative Group":
+        return committee.title[0:committee.title.rfind("Cancers Research Group")].strip()
+    return None
+
+def collabGroups(rdfCommittees):
+    '''Make a mapping of collaborative group name to staff from ``rdfCommittees``.'''
+    groups = collections.OrderedDict()
+    for committee in rdfCommittees:
+        groupName = _collabGroupName(committee)
+        if groupName != None:
             print "Processing collaborative group: ["+groupName+"]\n"
-            # now add group only if it doesn't exist yet
-            _addGroup(ldapUrl, adminUser, adminPass, groupName, committee.staffList)
+            groups.setdefault(groupName, []).extend(committee.staffList)
+    return groups
             
 
-def _addGroup(ldapUrl, adminUser, adminPass, groupName, staffList):
-    ldapConn = ldap.initialize(ldapUrl)
-    ldapConn.simple_bind_s(adminUser, adminPass)
-
-    if not groupExists(ldapConn, groupName):
-        # construct DN
-        dn = u"cn="+groupName+",dc=edrn,dc=jpl,dc=nasa,dc=gov"
-        attrs={}
-        attrs['objectclass'] = ['top', 'groupOfUniqueNames']
-        attrs['cn'] = str(groupName)
-        attrs['description'] = str(groupName)
-        
-        memberuidList = []
-        for staff in staffList:
-            if staff != None:
-                memberuidList.append(str("uid="+staff.uid+",dc=edrn,dc=jpl,dc=nasa,dc=gov"))
-        
-        attrs['uniquemember'] = memberuidList
+def writeGroups(groups, ldapUrl, adminUser, adminPass, pool, snapshot, window, pruneMembers, journal=None,
+    throttle=throttle):
+    '''Create or update each group in ``groups``, a mapping of group name to staff, using ``pool`` (or a
+    fresh one) and ``snapshot`` (or a freshly loaded one).  Groups with the same name were merged beforehand
+    so that no two writes in flight touch the same entry.  Groups already recorded in ``journal`` (an
+    ``edrn.sync.journal.Journal``) are skipped, and each one whose writes all succeed is recorded there.
+    Writes go through ``throttle`` (an ``edrn.sync.ldapwriter.Throttle``).'''
+    ownPool = pool is None
+    if ownPool:
+        pool = ConnectionPool(ldapUrl, adminUser, adminPass)
+    try:
+        if snapshot is None:
+            snapshot = DirectorySnapshot()
+            pool.run(snapshot.load)
+        def addGroups(ldapConn):
+            writer = PipelinedWriter(ldapConn, window, throttle)
+            progress = metrics.progress('groups', len(groups))
+            for groupName, staffList in groups.iteritems():
+                progress.advance()
+                done = None
+                if journal is not None:
+                    key = _groupKey(groupName, staffList)
+                    if key in journal:
+                        metrics.count('journal_skipped')
+                        continue
+                    done = lambda key=key: journal.record(key)
+                # now add group only if it doesn't exist yet
+                _addGroup(writer, groupName, staffList, snapshot, pruneMembers, done)
+            writer.flush()
+            progress.finish()
+        pool.run(addGroups)
+    finally:
+        if ownPool: pool.close()
+
+def writeGroupChanges(rdfSites, rdfCommittees, state, ldapUrls, adminUser, adminPass, window=defaultWindow,
+    pruneMembers=False):
+    '''Write only the groups of the sites and committees added or changed since the last run recorded in
+    ``state`` (an ``edrn.sync.changefeed.FingerprintState``) to each of the servers at ``ldapUrls`` at once,
+    reading only those groups from each directory.  Once every write to every server has succeeded, ``state``
+    is brought up to date, so a failed write is tried again next run.  Returns the site and committee
+    ``ChangeFeed``s and a mapping of URL to exception for servers that failed.'''
+    siteFeed, committeeFeed = state.diff('site', rdfSites), state.diff('committee', rdfCommittees)
+    print "Changes to sites since the last run: "+str(siteFeed)
+    print "Changes to committees since the last run: "+str(committeeFeed)
+    # Groups of removed sites and committees have always been left alone, so they change nothing here
+    affected = set(_piGroupName(site) for site in siteFeed.entities())
+    affected.update(_collabGroupName(committee) for committee in committeeFeed.entities())
+    affected.discard(None)
+    if affected:
+        # Every site or committee sharing an affected name contributes members to its group
+        groups = [collections.OrderedDict((name, staff) for name, staff in everything.iteritems() if name in affected)
+            for everything in (piGroups(rdfSites), collabGroups(rdfCommittees))]
+        errors = metrics.total('ldap_errors')
+        def write(ldapUrl, throttle):
+            pool = ConnectionPool(ldapUrl, adminUser, adminPass)
+            try:
+                snapshot = DirectorySnapshot()
+                pool.run(lambda ldapConn: snapshot.loadSubset(ldapConn, groupcns=affected))
+                for changed in groups:
+                    writeGroups(changed, ldapUrl, adminUser, adminPass, pool, snapshot, window, pruneMembers,
+                        throttle=throttle)
+            finally:
+                pool.close()
+        failures = fanOut(ldapUrls, write)
+        if failures or metrics.total('ldap_errors') != errors:
+            print "Some changes failed; they'll be tried again on the next run"
+            return siteFeed, committeeFeed, failures
+    state.update(siteFeed, committeeFeed)
+    return siteFeed, committeeFeed, {}
+
+def _groupEntry(groupName, staffList):
+    '''Make the DN and attributes of the LDAP entry for group ``groupName`` of ``staffList``, or return None if
+    the name won't go into an LDAP filter or DN as-is; such groups have always been skipped.'''
+    try:
+        str(groupName)
+    except UnicodeEncodeError:
+        return None
+    dn = u"cn="+groupName+",dc=edrn,dc=jpl,dc=nasa,dc=gov"
+    attrs={}
+    attrs['objectclass'] = ['top', 'groupOfUniqueNames']
+    attrs['cn'] = str(groupName)
+    attrs['description'] = str(groupName)
+    
+    # A person on the staff of two merged sites is still one member
+    memberuidList = collections.OrderedDict()
+    for staff in staffList:
+        if staff != None:
+            memberuidList[str("uid="+staff.uid+",dc=edrn,dc=jpl,dc=nasa,dc=gov")] = True
+    
+    attrs['uniquemember'] = memberuidList.keys()
+    return dn, attrs
+
+def _groupKey(groupName, staffList):
+    '''Name the writing of group ``groupName`` with ``staffList`` in a journal.'''
+    members = sorted(set(staff.uid for staff in staffList if staff != None))
+    return u'%s %s' % (hashlib.sha1(u'\n'.join(members).encode('utf-8')).hexdigest()[:16], groupName)
+
+def _countdown(count, done):
+    '''Make a callable to call as each of ``count`` writes succeeds; the last one calls ``done``, if any.'''
+    remaining = [count]
+    def succeeded():
+        remaining[0] -= 1
+        if remaining[0] == 0 and done is not None: done()
+    return succeeded
+
+def _addGroup(writer, groupName, staffList, snapshot, pruneMembers=False, done=None):
+    '''Send the writes that create group ``groupName`` with ``staffList``, or bring its members up to date,
+    through ``writer``; call ``done``, if given, once they've all succeeded.'''
+    entry = _groupEntry(groupName, staffList)
+    if entry is None: return
+    dn, attrs = entry
+    if not snapshot.groupExists(groupName):
+        memberuidList = attrs['uniquemember']
         ldif = modlist.addModlist(attrs)
         verboseLog("Creating group: ["+str(ldif)+"]\n")
-        try:
-            ldapConn.add_s(dn,ldif)
-        except ldap.LDAPError, e:
-            print e.message['info']        
+        succeeded = _countdown(1, done)
+        def created(dn, error):
+            if error is None:
+                snapshot.addedGroup(groupName, dn, memberuidList)
+                succeeded()
+            else:
+                print error.message['info']
+        writer.add(dn, ldif, created)
     else:
         # try to add the new members to it
         verboseLog("Group: ["+groupName+"] already exists: attempting to update members")
-        dn = u"cn="+groupName+",dc=edrn,dc=jpl,dc=nasa,dc=gov"
-        try:
-            results = ldapConn.search_ext_s('dc=edrn,dc=jpl,dc=nasa,dc=gov', ldap.SCOPE_ONELEVEL, '(cn=%s)' % groupName,
-                ['uniquemember'])
-        except UnicodeEncodeError:
+        desired = ['uid=' + str(staff.uid) + ',dc=edrn,dc=jpl,dc=nasa,dc=gov' for staff in staffList]
+        adds, removes = memberChanges(snapshot.getMembers(groupName), desired, pruneMembers)
+        if not adds and not removes:
+            verboseLog("Group: ["+groupName+"] members unchanged: skipping")
+            if done is not None: done()
             return
-        members = set()
-        for resultDN, attrs in results:
-            if dn != resultDN: continue
-            members = members.union(attrs['uniquemember'])
-        for staff in staffList:
-            members.add('uid=' + str(staff.uid) + ',dc=edrn,dc=jpl,dc=nasa,dc=gov')
-        mod_attrs = [(ldap.MOD_REPLACE, 'uniquemember', list(members))]
-        verboseLog("Replace group members for ["+groupName+"] with ["+str(members)+"]\n")
-        try:
-            ldapConn.modify_s(dn, mod_attrs)
-        except ldap.LDAPError, e:
-            print e.message['info']
-    ldapConn.unbind_s()            
+        verboseLog("Update group members for ["+groupName+"]: add ["+str(adds)+"], remove ["+str(removes)+"]\n")
+        chunks = [(op, values[i:i + _memberChunkSize], update) for op, values, update in (
+            (ldap.MOD_ADD, adds, snapshot.addedMembers), (ldap.MOD_DELETE, removes, snapshot.removedMembers))
+            for i in range(0, len(values), _memberChunkSize)]
+        succeeded = _countdown(len(chunks), done)
+        for op, chunk, update in chunks:
+            writer.modify(dn, [(op, 'uniquemember', chunk)], _memberRecorder(update, groupName, chunk, succeeded))
+
+def _memberRecorder(update, groupName, chunk, succeeded=None):
+    def record(dn, error):
+        if error is None:
+            update(groupName, chunk)
+            if succeeded is not None: succeeded()
+        else:
+            print error.message['info']
+    return record
+
+def exportGroups(groups, out):
+    '''Write an LDIF entry for each group in ``groups``, a mapping of group name to staff, to ``out``.  Returns
+    how many groups were written.'''
+    writer, written = LDIFWriter(out), 0
+    for groupName, staffList in groups.iteritems():
+        entry = _groupEntry(groupName, staffList)
+        if entry is None: continue
+        dn, attrs = entry
+        writer.unparse(str(dn), ldifRecord(attrs))
+        metrics.count('ldif_entries', kind='group')
+        written += 1
+    return written
+
+def exportDirectory(rdfUsersFiles, rdfSiteFile, rdfCommitteesFile, out, cache=None):
+    '''Write LDIF for every person in ``rdfUsersFiles`` and then every PI and collaborative group to ``out``.
+    People are written as they're parsed; only their RDF ids, uids, and surnames are kept to resolve group
+    members.  A collaborative group named the same as a PI group is written as one group with the members of
+    both.  Returns how many people and how many groups were written.'''
+    index = RDFPersonList(rdfUsersFiles[0], records=())
+    people = exportPeople(rdfUsersFiles, out, cache, index)
+    groups = piGroups(RDFSiteList(rdfSiteFile, index, cache=cache, lazy=True).stream())
+    for groupName, staffList in collabGroups(RDFCollaborativeGroupList(rdfCommitteesFile, index, cache=cache,
+        lazy=True).stream()).iteritems():
+        groups.setdefault(groupName, []).extend(staffList)
+    return people, exportGroups(groups, out)
+
+def memberChanges(current, desired, prune=False):
+    '''Work out the members to add to and remove from a group whose ``current`` members map normalized DN to
+    DN as stored (as from ``DirectorySnapshot.getMembers``) so that it has the ``desired`` member DNs.  Members
+    not in ``desired`` are kept, since people may be added to groups by hand, unless ``prune`` is True.
+    Returns a list of DNs to add and a list of DNs to remove.'''
+    adds, wanted = [], set()
+    for member in desired:
+        key = normalizeDN(member)
+        if key in wanted: continue
+        wanted.add(key)
+        if key not in current: adds.append(member)
+    removes = [member for normalized, member in current.iteritems() if normalized not in wanted] if prune else []
+    return adds, removes
 
 
 def main(argv=None):
@@ -124,15 +347,27 @@ def main(argv=None):
         argv = sys.argv
     try:
         try:
-            opts, args = getopt.getopt(argv[1:], 'hvu:p:l:', ['help', 'verbose', 'user=', 'password=', 'ldapUrl='])
+            opts, args = getopt.getopt(argv[1:], 'hvu:p:l:c:w:j:m',
+                ['help', 'verbose', 'user=', 'password=', 'ldapUrl=', 'cache=', 'window=', 'jobs=', 'prune-members',
+                'progress', 'metrics=', 'ldif=', 'journal=', 'changes=', 'max-rate=', 'max-latency='])
         except getopt.error, msg:
             raise _Usage(msg)
-        if len(args) == 0:
+        if len(args) < 3:
             raise _Usage(_helpMessage)
         
         ldapUser = None
         ldapPass = None
-        ldapUrl = None
+        ldapUrls = []
+        cache = None
+        window = defaultWindow
+        jobs = defaultWorkers
+        pruneMembers = False
+        showProgress = False
+        metricsFile = None
+        ldifFile = None
+        journalDir = None
+        changesFile = None
+        maxRate = maxLatency = None
         
         # Process options
         for option, value in opts:
@@ -146,16 +381,96 @@ def main(argv=None):
             elif option in ('-p', '--password'):
                 ldapPass = value
             elif option in ('-l', '--ldapUrl'):
-                ldapUrl = value
+                ldapUrls.append(value)
+            elif option in ('-c', '--cache'):
+                cache = SourceCache(value)
+            elif option in ('-w', '--window'):
+                try:
+                    window = int(value)
+                except ValueError:
+                    window = 0
+                if window < 1:
+                    raise _Usage(u'Window must be a positive number, not "%s"' % value)
+            elif option in ('-j', '--jobs'):
+                try:
+                    jobs = int(value)
+                except ValueError:
+                    jobs = 0
+                if jobs < 1:
+                    raise _Usage(u'Jobs must be a positive number, not "%s"' % value)
+            elif option in ('-m', '--prune-members'):
+                pruneMembers = True
+            elif option == '--progress':
+                showProgress = True
+            elif option == '--metrics':
+                metricsFile = value
+            elif option == '--ldif':
+                ldifFile = value
+            elif option == '--journal':
+                journalDir = value
+            elif option == '--changes':
+                changesFile = value
+            elif option == '--max-rate':
+                try:
+                    maxRate = float(value)
+                except ValueError:
+                    maxRate = 0
+                if maxRate <= 0:
+                    raise _Usage(u'Rate must be a positive number, not "%s"' % value)
+            elif option == '--max-latency':
+                try:
+                    maxLatency = float(value)
+                except ValueError:
+                    maxLatency = 0
+                if maxLatency <= 0:
+                    raise _Usage(u'Latency must be a positive number of seconds, not "%s"' % value)
+        
+        rdfUsersFiles = args[:-2]
+        rdfSiteFile = args[-2]
+        rdfCommitteesFile = args[-1]
+        if changesFile is not None and (journalDir is not None or ldifFile is not None):
+            raise _Usage(u'--changes only works when writing to a server, and resumes by itself without --journal')
+        if ldifFile is not None:
+            if journalDir is not None: raise _Usage(u'--journal only works when writing groups to a server')
+            with metrics.recording('dmccgroupsync', metricsFile, showProgress):
+                with outputFile(ldifFile) as out:
+                    people, groups = exportDirectory(rdfUsersFiles, rdfSiteFile, rdfCommitteesFile, out, cache)
+            print >>sys.stderr, "Wrote "+str(people)+" people and "+str(groups)+" groups to: ["+ldifFile+"]"
+            return
         
-        if ldapUser == None or ldapPass == None or ldapUrl == None:
+        if ldapUser == None or ldapPass == None or not ldapUrls:
             raise _Usage(_helpMessage)
+        ldapUrls = uniqueServers(ldapUrls)
+        if journalDir is not None and len(ldapUrls) > 1:
+            raise _Usage(u'--journal only works with one LDAP server')
             
-        rdfUsersFile = args[0]
-        rdfSiteFile = args[1]
-        rdfCommitteesFile = args[2]
-        makePIGroups(rdfUsersFile, rdfSiteFile, ldapUrl, ldapUser, ldapPass)
-        makeCollabGroups(rdfUsersFile, rdfCommitteesFile, ldapUrl, ldapUser, ldapPass)
+        with metrics.recording('dmccgroupsync', metricsFile, showProgress), throttle.limiting(maxLatency, maxRate):
+            # Read all the RDF at once, and the users only once for both kinds of group
+            loader = SourceLoader(cache, workers=jobs)
+            rdfPersons, rdfSites, rdfCommittees = loader.load(rdfUsersFiles, [rdfSiteFile], [rdfCommitteesFile])
+            if changesFile is not None:
+                state = FingerprintState(changesFile)
+                try:
+                    failures = writeGroupChanges(rdfSites, rdfCommittees, state, ldapUrls, ldapUser, ldapPass,
+                        window=window, pruneMembers=pruneMembers)[2]
+                finally:
+                    state.close()
+                return 1 if failures else None
+            # Work out the groups once for every server
+            groups = piGroups(rdfSites), collabGroups(rdfCommittees)
+            def write(ldapUrl, throttle):
+                pool = ConnectionPool(ldapUrl, ldapUser, ldapPass)
+                try:
+                    snapshot = DirectorySnapshot()
+                    pool.run(snapshot.load)
+                    with journaling(journalDir, 'dmccgroupsync', list(rdfSites) + list(rdfCommittees), ldapUrl,
+                        pruneMembers) as journal:
+                        for kind in groups:
+                            writeGroups(kind, ldapUrl, ldapUser, ldapPass, pool, snapshot, window, pruneMembers,
+                                journal, throttle)
+                finally:
+                    pool.close()
+            if fanOut(ldapUrls, write): return 1
 
     except _Usage, err:
         print >>sys.stderr, sys.argv[0].split('/')[-1] + ': ' + str(err.msg)
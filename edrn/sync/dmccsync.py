@@ -13,10 +13,19 @@ import ldap
 import re
 import time
 import ldap.modlist as modlist
+from ldif import LDIFWriter
 from xml.dom.minidom import Node
-from syncldap import personExists
-from rdf import RDFPersonList
-from .utils import generatePassword
+from changefeed import FingerprintState
+from instrumentation import metrics
+from journal import journaling
+from syncldap import ConnectionPool, DirectorySnapshot
+from ldapwriter import PipelinedWriter, defaultWindow, throttle
+from rdf import RDFPerson, RDFPersonList
+from rdfcache import SourceCache
+from rdfloader import SourceLoader, defaultWorkers
+from replicas import fanOut, uniqueServers
+from shards import runShards, shardOf
+from .utils import generatePassword, outputFile
 
 
 warnings.filterwarnings("ignore")
@@ -24,8 +33,16 @@ _verbose = False
 _defaultEmail = 'unknown@example.com'
 _defaultDesc = 'imported via EDRN dmccsync at '
 _defaultPhone = '555-555-5555'
+# Attributes that reconciling keeps in step with the RDF; the rest are only set when an entry is added
+_managedAttributes = ('cn', 'mail', 'telephoneNumber', 'sn')
 _helpMessage = '''
-Usage: dmccsync [-v] [-u LDAP DN] [-p password] [-l LDAP URL] RDF-URL...
+Usage: dmccsync [-v] [-r [-n] [-d]] [-u LDAP DN] [-p password] [-l LDAP URL]... [-c cache dir] [-w window] [-j jobs]
+    [--max-rate=ops] [--max-latency=seconds] [--journal=dir | --changes=file | --shards=n] [--progress]
+    [--metrics=file] RDF-URL...
+       dmccsync --ldif=file [-c cache dir] [--progress] [--metrics=file] RDF-URL...
+
+People are read from every RDF-URL given; those with the same uid in more
+than one are taken from the first.
 
 Options:
 -v, --verbose
@@ -36,7 +53,57 @@ Options:
 -p, --password
     The password for the user who has permission to add entries to the LDAP server.
 -l  --ldapUrl
-    The LDAP URL pointing to the server to synchronize with.
+    The LDAP URL pointing to the server to synchronize with. Give it more
+    than once to bring several servers in line at once: the RDF is read
+    once, and each server is compared and written to concurrently, with its
+    own progress, limits, and errors. If one fails, the rest carry on.
+-c, --cache
+    A directory in which to cache parsed RDF; unchanged RDF sources are then
+    neither downloaded nor parsed again.
+-w, --window
+    The most LDAP writes to keep in flight at once; defaults to 10. The run
+    starts with one and widens toward this while the server keeps up,
+    narrowing again when replies slow down. Writes the server turns away as
+    busy, unavailable, or out of time are retried after a pause.
+--max-rate
+    The most LDAP writes to send a second, however quickly the server copes.
+--max-latency
+    Narrow the window when LDAP writes take longer than this many seconds;
+    by default, four times the quickest seen, but at least 0.05.
+-j, --jobs
+    How many RDF sources to fetch and parse at once; defaults to 4.
+--journal
+    A directory in which to note each person added as the run goes. If the
+    run is interrupted, the next one on the same RDF skips them; the note is
+    deleted once a run finishes.
+--shards
+    Split the people into this many shards by uid and sync each in a
+    process of its own with its own LDAP connection, for building or
+    checking a large directory on a machine with several CPUs. The RDF and
+    the directory are read once beforehand. Works with one LDAP server.
+--changes
+    A file in which to keep a fingerprint of every person as of the last
+    run. Only people added, changed, or (with --deprovision) removed since
+    are looked up and written; if nothing has changed, the LDAP server is
+    not contacted at all. Changes that fail are tried again next run.
+-r, --reconcile
+    Rather than only adding missing people, also update the name, email, and
+    phone of people whose RDF has changed.
+-n, --plan
+    With --reconcile, just report what would change without changing anything.
+-d, --deprovision
+    With --reconcile, also delete people who are no longer in the RDF.
+--progress
+    Show how far along the run is, with an estimate of the time left, on
+    standard error.
+--metrics
+    When done, save counts and timings of the run to this file: in the
+    Prometheus text format if it ends in .prom, for the node exporter's
+    textfile collector, and as JSON otherwise.
+--ldif
+    Rather than connecting to an LDAP server, write an entry for every person
+    to this file (or standard output for -) as LDIF, for loading offline with
+    slapadd or ldapadd.
 
 Environment:
 None'''
@@ -50,19 +117,241 @@ class _Usage(Exception):
     def __init__(self, msg):
         self.msg = msg
 
-def sync(rdfUsersFile, ldapUrl, adminUser, adminPass):
-    pList = RDFPersonList(rdfUsersFile)
-    processed=0
-    for person in pList.persons:
-        if _addUserToLDAP(ldapUrl, adminUser, adminPass, person):
-            processed=processed+1
+def _personList(rdfUsers, cache, lazy=False):
+    '''Get the people of ``rdfUsers``, which is either the URL of user RDF or an already loaded person list.'''
+    if isinstance(rdfUsers, basestring):
+        return RDFPersonList(rdfUsers, cache=cache, lazy=lazy)
+    return rdfUsers
+
+def _knownLength(persons):
+    '''Tell how many ``persons`` there are, or None if they're still being parsed.'''
+    return None if isinstance(persons, RDFPersonList) and persons.isLazy() else len(persons)
+
+def sync(rdfUsersFile, ldapUrl, adminUser, adminPass, cache=None, pool=None, snapshot=None, window=defaultWindow,
+    journal=None, throttle=throttle):
+    '''Add the people in the RDF who aren't in the LDAP server yet.  People already recorded in ``journal`` (an
+    ``edrn.sync.journal.Journal``) are skipped, and each one added is recorded there.  Writes go through
+    ``throttle`` (an ``edrn.sync.ldapwriter.Throttle``).'''
+    # Parse people as we go, so LDAP writes start before RDF/XML has been read (N-Triples and Turtle are read
+    # whole before the first person is made)
+    pList = _personList(rdfUsersFile, cache, lazy=True)
+    ownPool = pool is None
+    if ownPool:
+        pool = ConnectionPool(ldapUrl, adminUser, adminPass)
+    processed=[0]
+    try:
+        if snapshot is None:
+            snapshot = DirectorySnapshot()
+            pool.run(snapshot.load)
+        def addPeople(ldapConn):
+            writer = PipelinedWriter(ldapConn, window, throttle)
+            progress = metrics.progress('people', _knownLength(pList))
+            for person in pList:
+                progress.advance()
+                if journal is not None and person.uid in journal:
+                    metrics.count('journal_skipped')
+                    continue
+                if snapshot.personExists(person.uid):
+                    verboseLog("Skipping record: [uid="+person.uid+"]: entry already exists in ["+ldapUrl+"]")
+                    continue
+                _addUserToLDAP(writer, person, snapshot, processed, journal)
+            writer.flush()
+            progress.finish()
+        pool.run(addPeople)
+    finally:
+        if ownPool: pool.close()
     
-    print "Added "+str(processed)+" entries to the LDAP server at: ["+ldapUrl+"]"
+    print "Added "+str(processed[0])+" entries to the LDAP server at: ["+ldapUrl+"]"
+
+class ChangeSet(object):
+    '''The LDAP operations needed to bring the directory in line with the RDF: ``adds`` of ``(uid, dn, attrs)``,
+    ``modifies`` of ``(uid, dn, modlist)``, and ``deletes`` of ``(uid, dn)``.'''
+    def __init__(self):
+        self.adds, self.modifies, self.deletes = [], [], []
+    def uids(self):
+        '''Give the uids of everyone these changes touch.'''
+        return [uid for uid, dn, attrs in self.adds + self.modifies] + [uid for uid, dn in self.deletes]
+    def attributeChanges(self):
+        return sum(len(modlist) for uid, dn, modlist in self.modifies)
+    def __len__(self):
+        return len(self.adds) + len(self.modifies) + len(self.deletes)
+    def __str__(self):
+        return "%d adds, %d modifies (%d attribute changes), %d deletes" % (len(self.adds), len(self.modifies),
+            self.attributeChanges(), len(self.deletes))
+
+def planChanges(persons, snapshot, deprovision=False, removable=None):
+    '''Work out the ``ChangeSet`` that makes the directory described by ``snapshot`` (which must keep the
+    ``_managedAttributes`` of people) match ``persons``.  People in the directory but not in ``persons`` are
+    only deleted if ``deprovision`` is True, and then, if a set of lower-case ``removable`` uids is given, only
+    if they're among them.'''
+    with metrics.timing('plan'):
+        return _planChanges(persons, snapshot, deprovision, removable)
+
+def _planChanges(persons, snapshot, deprovision, removable):
+    changes, seen = ChangeSet(), set()
+    for person in persons:
+        if person.uid.lower() in seen: continue
+        seen.add(person.uid.lower())
+        existing = snapshot.getPerson(person.uid)
+        dn, attrs = _personEntry(person, existing is None)
+        if existing is None:
+            changes.adds.append((person.uid, dn, attrs))
+            continue
+        dn, current = existing
+        mods = []
+        for attr in _managedAttributes:
+            # Don't clobber a real name with the placeholder used when the RDF name won't encode
+            if attr == 'cn' and attrs[attr] == 'UNKNOWN' and current.get('cn'): continue
+            if current.get(attr.lower(), []) != [attrs[attr]]:
+                mods.append((ldap.MOD_REPLACE, attr, [attrs[attr]]))
+        if mods: changes.modifies.append((person.uid, dn, mods))
+    if deprovision:
+        for uid, (dn, current) in snapshot.people.iteritems():
+            if uid not in seen and (removable is None or uid in removable): changes.deletes.append((uid, dn))
+    return changes
 
-def _addUserToLDAP(ldapUrl, adminUser, adminPass, rdfPerson):
-    ldapConn = ldap.initialize(ldapUrl)
-    ldapConn.simple_bind_s(adminUser, adminPass)
+def _recorder(done, progress, update, *args):
+    '''Make a writer callback that calls ``update(*args)`` and counts in ``done[0]`` when an operation succeeds,
+    and advances ``progress`` (if any) whether or not it does.'''
+    def record(dn, error):
+        if progress is not None: progress.advance()
+        if error is None:
+            update(*args)
+            done[0] += 1
+        else:
+            print error.message['info']
+    return record
+
+def applyChanges(changes, writer, snapshot, progress=None):
+    '''Send the operations in ``changes`` through ``writer``, keeping ``snapshot`` up to date as they
+    succeed and advancing ``progress`` (an ``edrn.sync.instrumentation.Progress``, if given) as results arrive.
+    Returns a list that will hold the number of successful operations once ``writer`` is flushed.'''
+    done = [0]
+    for uid, dn, attrs in changes.adds:
+        verboseLog("Adding record: [uid="+uid+"]")
+        writer.add(dn, modlist.addModlist(attrs), _recorder(done, progress, snapshot.addedPerson, uid, dn, attrs))
+    for uid, dn, mods in changes.modifies:
+        verboseLog("Updating record: [uid="+uid+"]: "+str(mods))
+        changed = dict((attr, values) for op, attr, values in mods)
+        writer.modify(dn, mods, _recorder(done, progress, snapshot.changedPerson, uid, changed))
+    for uid, dn in changes.deletes:
+        verboseLog("Deleting record: [uid="+uid+"]")
+        writer.delete(dn, _recorder(done, progress, snapshot.removedPerson, uid))
+    return done
+
+def reconcileSnapshot():
+    '''Make a ``DirectorySnapshot`` that keeps the attributes of people ``reconcile`` compares with the RDF.'''
+    return DirectorySnapshot(personAttributes=_managedAttributes)
+
+def reconcile(rdfUsersFile, ldapUrl, adminUser, adminPass, cache=None, pool=None, window=defaultWindow,
+    deprovision=False, planOnly=False, snapshot=None, removable=None, throttle=throttle):
+    '''Bring the people in the LDAP server in line with the RDF, adding, updating, and (if ``deprovision``)
+    deleting only what differs, or only the ``removable`` uids if given.  With ``planOnly``, just report the
+    changes.  Unless given a loaded ``snapshot`` made by ``reconcileSnapshot``, read the directory afresh.
+    Writes go through ``throttle``.  Returns the ``ChangeSet``.'''
+    pList = _personList(rdfUsersFile, cache)
+    ownPool = pool is None
+    if ownPool:
+        pool = ConnectionPool(ldapUrl, adminUser, adminPass)
+    try:
+        if snapshot is None:
+            snapshot = reconcileSnapshot()
+            pool.run(snapshot.load)
+        changes = planChanges(pList, snapshot, deprovision, removable)
+        print "Plan for ["+ldapUrl+"]: "+str(changes)
+        if planOnly: return changes
+        attempted, applied = [], [0]
+        def apply(ldapConn):
+            pending = changes
+            if attempted:
+                # The server went away part way through.  The snapshot has kept up with every write confirmed
+                # so far; read back the rest, whose results may have been lost, and plan again so nothing
+                # already done is sent twice.
+                snapshot.reloadPeople(ldapConn, attempted.pop())
+                pending = planChanges(pList, snapshot, deprovision, removable)
+                applied[0] = max(0, len(changes) - len(pending))
+                print "Plan after reconnecting to ["+ldapUrl+"]: "+str(pending)
+            attempted.append(pending.uids())
+            writer = PipelinedWriter(ldapConn, window, throttle)
+            progress = metrics.progress('changes', len(pending))
+            done = applyChanges(pending, writer, snapshot, progress)
+            try:
+                writer.flush()
+            finally:
+                applied[0] += done[0]
+            progress.finish()
+        pool.run(apply)
+    finally:
+        if ownPool: pool.close()
+    print "Applied "+str(applied[0])+" of "+str(len(changes))+" changes to the LDAP server at: ["+ldapUrl+"]"
+    return changes
+
+def syncChanges(persons, state, ldapUrls, adminUser, adminPass, window=defaultWindow, reconciling=False,
+    deprovision=False, planOnly=False):
+    '''Sync only the people in ``persons`` who were added or changed since the last run recorded in ``state``
+    (an ``edrn.sync.changefeed.FingerprintState``) to each of the servers at ``ldapUrls`` at once, reading only
+    their entries from each directory; with ``reconciling`` and ``deprovision``, also delete those removed
+    since.  Once every write to every server has succeeded, ``state`` is brought up to date, so a failed write
+    is tried again next run.  Returns the ``ChangeFeed`` and a mapping of URL to exception for servers that
+    failed.'''
+    feed = state.diff('person', persons)
+    print "Changes to people since the last run: "+str(feed)
+    if not feed: return feed, {}
+    errors = metrics.total('ldap_errors')
+    uids = [person.uid for person in feed.entities()] + feed.removed
+    def apply(ldapUrl, throttle):
+        pool = ConnectionPool(ldapUrl, adminUser, adminPass)
+        try:
+            snapshot = reconcileSnapshot() if reconciling else DirectorySnapshot()
+            pool.run(lambda ldapConn: snapshot.loadSubset(ldapConn, uids))
+            if reconciling:
+                reconcile(feed.entities(), ldapUrl, adminUser, adminPass, pool=pool, window=window,
+                    deprovision=deprovision, planOnly=planOnly, snapshot=snapshot,
+                    removable=set(uid.lower() for uid in feed.removed), throttle=throttle)
+            else:
+                sync(feed.entities(), ldapUrl, adminUser, adminPass, pool=pool, snapshot=snapshot, window=window,
+                    throttle=throttle)
+        finally:
+            pool.close()
+    failures = fanOut(ldapUrls, apply)
+    if planOnly: return feed, failures
+    if not failures and metrics.total('ldap_errors') == errors:
+        state.update(feed)
+    else:
+        print "Some changes failed; they'll be tried again on the next run"
+    return feed, failures
 
+def syncShards(persons, ldapUrl, adminUser, adminPass, shards, window=defaultWindow, reconciling=False,
+    deprovision=False, planOnly=False, snapshot=None, processes=True):
+    '''Add (or with ``reconciling``, reconcile) ``persons`` split into ``shards`` shards by uid, each synced
+    by a process of its own (or a thread, if not ``processes``) with its own connection.  Unless given a loaded
+    ``snapshot`` (made by ``reconcileSnapshot`` if ``reconciling``), read the directory once first.  Each
+    shard deletes only people in its own shard.  Returns a mapping of shard index to the traceback of each
+    shard that failed.'''
+    if snapshot is None:
+        snapshot = reconcileSnapshot() if reconciling else DirectorySnapshot()
+        pool = ConnectionPool(ldapUrl, adminUser, adminPass)
+        try:
+            pool.run(snapshot.load)
+        finally:
+            pool.close()
+    def work(mine, index, throttle):
+        pool = ConnectionPool(ldapUrl, adminUser, adminPass)
+        try:
+            if reconciling:
+                removable = set(uid for uid in snapshot.uids if shardOf(uid, shards) == index)
+                reconcile(mine, ldapUrl, adminUser, adminPass, pool=pool, window=window, deprovision=deprovision,
+                    planOnly=planOnly, snapshot=snapshot, removable=removable, throttle=throttle)
+            else:
+                sync(mine, ldapUrl, adminUser, adminPass, pool=pool, snapshot=snapshot, window=window,
+                    throttle=throttle)
+        finally:
+            pool.close()
+    return runShards(persons, shards, work, processes)
+
+def _personEntry(rdfPerson, password=True):
+    '''Make the DN and attributes of the LDAP entry for ``rdfPerson``, with a new random password unless not
+    ``password``.'''
     # construct DN
     dn = "uid="+rdfPerson.uid+",dc=edrn,dc=jpl,dc=nasa,dc=gov"
     attrs = {}
@@ -71,35 +360,67 @@ def _addUserToLDAP(ldapUrl, adminUser, adminPass, rdfPerson):
         attrs['cn'] = str(rdfPerson.firstname + " " +rdfPerson.lastname)
     except UnicodeEncodeError:
         attrs['cn'] = 'UNKNOWN'
-    attrs['userPassword'] = generatePassword()
+    if password: attrs['userPassword'] = generatePassword()
     attrs['uid'] = str(rdfPerson.uid)
     attrs['mail'] = str(rdfPerson.email)
     attrs['telephoneNumber'] = str(rdfPerson.phone)
     attrs['sn'] = str(rdfPerson.lastname)
     attrs['description'] = str(_defaultDesc+time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime()))
-    
+    return dn, attrs
+
+def ldifRecord(attrs):
+    '''Turn entry attributes as made by ``_personEntry`` into a record for ``ldif.LDIFWriter``, whose values are
+    all lists.'''
+    return dict((attr, values if isinstance(values, list) else [values]) for attr, values in attrs.iteritems())
+
+def exportPeople(rdfUsers, out, cache=None, index=None):
+    '''Write an LDIF entry for each person in the user RDF at the URLs ``rdfUsers`` to ``out`` as they're parsed,
+    keeping none of them but their uids, so that RDF/XML feeds of any size take little memory; N-Triples,
+    Turtle, and sources read through ``cache`` are read whole first.  People with the same uid as one already
+    written are skipped.  If ``index`` (an empty ``RDFPersonList``) is given, it's filled with just the
+    RDF id, uid, and surname of each person, enough to resolve group members afterwards.  Returns how many
+    people were written.'''
+    writer, seen = LDIFWriter(out), set()
+    progress = metrics.progress('people')
+    for url in rdfUsers:
+        for person in RDFPersonList(url, cache=cache, lazy=True).stream():
+            progress.advance()
+            if index is not None:
+                index.merge([RDFPerson(person.rdfId, None, None, person.uid, None, person.lastname, None)])
+            if person.uid.lower() in seen:
+                verboseLog("Skipping record: [uid="+person.uid+"]: already written")
+                continue
+            seen.add(person.uid.lower())
+            dn, attrs = _personEntry(person)
+            writer.unparse(dn, ldifRecord(attrs))
+            metrics.count('ldif_entries', kind='person')
+    progress.finish()
+    return len(seen)
+
+def _addUserToLDAP(writer, rdfPerson, snapshot, processed, journal=None):
+    '''Send an add of ``rdfPerson`` through ``writer``; once it succeeds, record it in the ``snapshot`` and
+    ``journal`` (if any) and count it in ``processed[0]``.'''
+    dn, attrs = _personEntry(rdfPerson)
     ldif = modlist.addModlist(attrs)
-    success=False
-    
-    if(not personExists(ldapConn, rdfPerson.uid)):
-        verboseLog("Syncing record: ["+str(ldif)+"]")
-        try:
-            ldapConn.add_s(dn,ldif)
-            success=True
-        except ldap.LDAPError, e:
-            print e.message['info']
-    else:
-        verboseLog("Skipping record: [uid="+rdfPerson.uid+"]: entry already exists in ["+ldapUrl+"]")
-        
-    ldapConn.unbind_s()
-    return success
+    def added(dn, error):
+        if error is None:
+            snapshot.addedPerson(rdfPerson.uid)
+            if journal is not None: journal.record(rdfPerson.uid)
+            processed[0] += 1
+        else:
+            print error.message['info']
+    verboseLog("Syncing record: ["+str(ldif)+"]")
+    writer.add(dn, ldif, added)
     
 def main(argv=None):
     if argv is None:
         argv = sys.argv
     try:
         try:
-            opts, args = getopt.getopt(argv[1:], 'hvu:p:l:', ['help', 'verbose', 'user=', 'password=', 'ldapUrl='])
+            opts, args = getopt.getopt(argv[1:], 'hvu:p:l:c:w:j:rnd',
+                ['help', 'verbose', 'user=', 'password=', 'ldapUrl=', 'cache=', 'window=', 'jobs=', 'reconcile',
+                'plan', 'deprovision', 'progress', 'metrics=', 'ldif=', 'journal=', 'changes=', 'max-rate=',
+                'max-latency=', 'shards='])
         except getopt.error, msg:
             raise _Usage(msg)
         if len(args) == 0:
@@ -107,7 +428,18 @@ def main(argv=None):
         
         ldapUser = None
         ldapPass = None
-        ldapUrl = None
+        ldapUrls = []
+        cache = None
+        window = defaultWindow
+        jobs = defaultWorkers
+        reconciling = planOnly = deprovision = False
+        showProgress = False
+        metricsFile = None
+        ldifFile = None
+        journalDir = None
+        changesFile = None
+        maxRate = maxLatency = None
+        shards = 1
         
         # Process options
         for option, value in opts:
@@ -121,13 +453,116 @@ def main(argv=None):
             elif option in ('-p', '--password'):
                 ldapPass = value
             elif option in ('-l', '--ldapUrl'):
-                ldapUrl = value
+                ldapUrls.append(value)
+            elif option in ('-c', '--cache'):
+                cache = SourceCache(value)
+            elif option in ('-w', '--window'):
+                try:
+                    window = int(value)
+                except ValueError:
+                    window = 0
+                if window < 1:
+                    raise _Usage(u'Window must be a positive number, not "%s"' % value)
+            elif option in ('-j', '--jobs'):
+                try:
+                    jobs = int(value)
+                except ValueError:
+                    jobs = 0
+                if jobs < 1:
+                    raise _Usage(u'Jobs must be a positive number, not "%s"' % value)
+            elif option in ('-r', '--reconcile'):
+                reconciling = True
+            elif option in ('-n', '--plan'):
+                planOnly = True
+            elif option in ('-d', '--deprovision'):
+                deprovision = True
+            elif option == '--progress':
+                showProgress = True
+            elif option == '--metrics':
+                metricsFile = value
+            elif option == '--ldif':
+                ldifFile = value
+            elif option == '--journal':
+                journalDir = value
+            elif option == '--changes':
+                changesFile = value
+            elif option == '--shards':
+                try:
+                    shards = int(value)
+                except ValueError:
+                    shards = 0
+                if shards < 1:
+                    raise _Usage(u'Shards must be a positive number, not "%s"' % value)
+            elif option == '--max-rate':
+                try:
+                    maxRate = float(value)
+                except ValueError:
+                    maxRate = 0
+                if maxRate <= 0:
+                    raise _Usage(u'Rate must be a positive number, not "%s"' % value)
+            elif option == '--max-latency':
+                try:
+                    maxLatency = float(value)
+                except ValueError:
+                    maxLatency = 0
+                if maxLatency <= 0:
+                    raise _Usage(u'Latency must be a positive number of seconds, not "%s"' % value)
+        
+        if journalDir is not None and (reconciling or ldifFile is not None):
+            raise _Usage(u'--journal only works when adding people to a server; --reconcile resumes by itself')
+        if changesFile is not None and (journalDir is not None or ldifFile is not None):
+            raise _Usage(u'--changes only works when writing to a server, and resumes by itself without --journal')
+        if ldifFile is not None:
+            if reconciling or planOnly or deprovision:
+                raise _Usage(u'--ldif writes every person, so --reconcile, --plan, and --deprovision do not apply')
+            with metrics.recording('dmccsync', metricsFile, showProgress):
+                with outputFile(ldifFile) as out:
+                    written = exportPeople(args, out, cache)
+            print >>sys.stderr, "Wrote "+str(written)+" entries to: ["+ldifFile+"]"
+            return
         
-        if ldapUser == None or ldapPass == None or ldapUrl == None:
+        if ldapUser == None or ldapPass == None or not ldapUrls:
             raise _Usage(_helpMessage)
+        ldapUrls = uniqueServers(ldapUrls)
+        if journalDir is not None and len(ldapUrls) > 1:
+            raise _Usage(u'--journal only works with one LDAP server')
+        if shards > 1 and (len(ldapUrls) > 1 or journalDir is not None or changesFile is not None):
+            raise _Usage(u'--shards works with one LDAP server, and without --journal or --changes')
+            
+        if (planOnly or deprovision) and not reconciling:
+            raise _Usage(u'--plan and --deprovision only work with --reconcile')
             
-        rdfUsersFile = ' '.join(args)
-        sync(rdfUsersFile, ldapUrl, ldapUser, ldapPass)
+        if changesFile is not None:
+            state = FingerprintState(changesFile)
+            try:
+                with metrics.recording('dmccsync', metricsFile, showProgress), throttle.limiting(maxLatency, maxRate):
+                    persons = SourceLoader(cache, workers=jobs).loadPersons(args)
+                    feed, failures = syncChanges(persons, state, ldapUrls, ldapUser, ldapPass, window=window,
+                        reconciling=reconciling, deprovision=deprovision, planOnly=planOnly)
+            finally:
+                state.close()
+            return 1 if failures else None
+        if shards > 1:
+            with metrics.recording('dmccsync', metricsFile, showProgress), throttle.limiting(maxLatency, maxRate):
+                persons = SourceLoader(cache, workers=jobs).loadPersons(args)
+                failures = syncShards(persons, ldapUrls[0], ldapUser, ldapPass, shards, window, reconciling,
+                    deprovision, planOnly)
+            return 1 if failures else None
+        with metrics.recording('dmccsync', metricsFile, showProgress), throttle.limiting(maxLatency, maxRate):
+            if len(set(args)) == 1 and len(ldapUrls) == 1 and journalDir is None:
+                # Just one source and one server, so sync can stream it; a journal needs the people first
+                rdfUsers = args[0]
+            else:
+                rdfUsers = SourceLoader(cache, workers=jobs).loadPersons(args)
+            def write(ldapUrl, throttle):
+                if reconciling:
+                    reconcile(rdfUsers, ldapUrl, ldapUser, ldapPass, cache, window=window, deprovision=deprovision,
+                        planOnly=planOnly, throttle=throttle)
+                else:
+                    with journaling(journalDir, 'dmccsync', rdfUsers, ldapUrl) as journal:
+                        sync(rdfUsers, ldapUrl, ldapUser, ldapPass, cache, window=window, journal=journal,
+                            throttle=throttle)
+            if fanOut(ldapUrls, write): return 1
     except _Usage, err:
         print >>sys.stderr, sys.argv[0].split('/')[-1] + ': ' + str(err.msg)
         return 2
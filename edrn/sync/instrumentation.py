@@ -0,0 +1,280 @@
+# encoding: utf-8
+# Copyright 2026 California Institute of Technology. ALL RIGHTS
+# RESERVED. U.S. Government Sponsorship acknowledged.
+
+'''Counters, timings, and progress for sync runs.
+
+The RDF and LDAP code reports what it does to the process-wide ``metrics``: counts of entities parsed and
+LDAP requests made, histograms of LDAP round-trip times, and the seconds spent in each phase of a run
+(fetching and parsing RDF, resolving references, reading and writing LDAP).  The command-line tools show
+live progress from it with ``--progress`` and save a summary with ``--metrics``, either as JSON or, for a
+file ending in ``.prom``, in the Prometheus text format for the node exporter's textfile collector.
+'''
+
+from utils import writeAtomically
+import collections, contextlib, json, sys, threading, time
+
+# Upper bounds of the round-trip histogram buckets, in seconds
+_latencyBuckets = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# How often progress is redrawn, in seconds
+_progressInterval = 0.5
+
+# Prefix of every metric name in Prometheus output
+_prefix = 'edrn_sync_'
+
+# Help text for the metrics the sync tools record; others are described by their names
+_descriptions = {
+    'rdf_entities_parsed': u'People, sites, and committees made from RDF.',
+    'rdf_cache_hits': u'RDF sources whose cached records were used.',
+    'rdf_cache_misses': u'RDF sources fetched and parsed because the cache had nothing current.',
+    'ldap_requests': u'LDAP requests sent, by operation.',
+    'ldap_errors': u'LDAP requests that failed, by operation.',
+    'ldap_reconnects': u'Times the LDAP server went away and the connections were made afresh.',
+    'ldap_round_trip_seconds': u'Seconds from sending each LDAP request to having its result.',
+    'ldap_backoffs': u'Times an overloaded LDAP server made writes pause and the window narrow.',
+    'ldap_retries': u'LDAP writes sent again after the server was overloaded.',
+    'passwords_checked': u'Passwords checked against the weak list, by hashing scheme.',
+    'passwords_fixed': u'Weak passwords replaced.',
+    'run_failures': u'Whether the run ended with an error.',
+    'server_failures': u'LDAP servers whose part of the run ended with an error, when writing to several.',
+    'shard_failures': u'Shards of people whose part of the run ended with an error.',
+}
+
+
+def _labelKey(labels):
+    return tuple(sorted(labels.iteritems()))
+
+
+class _Histogram(object):
+    '''Counts of observations at or under each bucket bound, plus their count and sum.'''
+    def __init__(self, bounds):
+        self.bounds, self.counts = bounds, [0] * len(bounds)
+        self.count, self.sum = 0, 0.0
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.bounds):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+    def merge(self, other):
+        self.count += other.count
+        self.sum += other.sum
+        self.counts = [mine + theirs for mine, theirs in zip(self.counts, other.counts)]
+    def cumulative(self):
+        total, result = 0, []
+        for bound, count in zip(self.bounds, self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+
+class Progress(object):
+    '''Shows how far along some work of ``total`` items (if known) is, with its rate and time left, redrawing
+    one line of ``out`` at most every half second, or with ``lines``, writing a fresh line each time, so that
+    several at once stay readable.  Does nothing unless ``enabled``.'''
+    def __init__(self, label, total=None, enabled=True, out=None, lines=False):
+        self.label, self.total, self.enabled, self.lines = label, total, enabled, lines
+        self.out = out if out is not None else sys.stderr
+        self.done, self._drawn = 0, 0.0
+        self.started = time.time()
+    def advance(self, amount=1):
+        self.done += amount
+        if self.enabled and time.time() - self._drawn >= _progressInterval:
+            self._draw()
+    def _draw(self, end=''):
+        now = time.time()
+        self._drawn = now
+        elapsed = now - self.started
+        rate = self.done / elapsed if elapsed > 0 else 0.0
+        line = u'%s: %d' % (self.label, self.done)
+        if self.total:
+            line += u'/%d (%d%%)' % (self.total, 100 * self.done // self.total)
+        line += u', %.1f/s' % rate
+        if self.total and rate > 0 and self.done < self.total:
+            line += u', ETA %s' % _duration((self.total - self.done) / rate)
+        elif not self.total or self.done >= self.total:
+            line += u', %s elapsed' % _duration(elapsed)
+        self.out.write(line + u'\n' if self.lines else u'\r' + line.ljust(79) + end)
+        self.out.flush()
+    def finish(self):
+        '''Draw the final state and end the line.'''
+        if self.enabled: self._draw(u'' if self.lines else u'\n')
+
+
+def _duration(seconds):
+    seconds = int(round(seconds))
+    return u'%d:%02d:%02d' % (seconds // 3600, seconds // 60 % 60, seconds % 60)
+
+
+class Metrics(object):
+    '''Counters, histograms, and phase timings for one run.  Safe to use from several threads.'''
+    def __init__(self):
+        self.showProgress = False
+        self._lock = threading.Lock()
+        self._scope = threading.local()
+        self.reset()
+    def reset(self):
+        '''Forget everything, as at the start of a run.'''
+        with self._lock:
+            self.started = time.time()
+            self.counters = collections.OrderedDict()
+            self.histograms = collections.OrderedDict()
+            self.phases = collections.OrderedDict()
+    def _scoped(self, labels):
+        scope = getattr(self._scope, 'labels', None)
+        return dict(scope, **labels) if scope else labels
+    @contextlib.contextmanager
+    def scoped(self, **labels):
+        '''Context manager within which, in this thread, every counter and histogram also gets ``labels`` and
+        progress is shown a line at a time, named after them, as when working on several servers at once.'''
+        previous = getattr(self._scope, 'labels', None)
+        self._scope.labels = dict(previous or {}, **labels)
+        try:
+            yield
+        finally:
+            self._scope.labels = previous
+    def count(self, name, amount=1, **labels):
+        '''Add ``amount`` to counter ``name`` with the given ``labels``.'''
+        key = (name, _labelKey(self._scoped(labels)))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+    def observe(self, name, value, **labels):
+        '''Record ``value`` seconds in histogram ``name`` with the given ``labels``.'''
+        key = (name, _labelKey(self._scoped(labels)))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None: histogram = self.histograms[key] = _Histogram(_latencyBuckets)
+            histogram.observe(value)
+    def addTime(self, phase, seconds):
+        '''Add ``seconds`` to the time spent in ``phase``.  Time in phases running in several threads at once is
+        summed, so phases may add up to more than the run took.'''
+        with self._lock:
+            self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+    @contextlib.contextmanager
+    def timing(self, phase):
+        '''Context manager that adds the time spent within it to ``phase``.'''
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.addTime(phase, time.time() - start)
+    @contextlib.contextmanager
+    def request(self, op, phase):
+        '''Context manager around one LDAP round trip of kind ``op``: count it, and any error it raises, record
+        how long it took in the round-trip histogram, and add that time to ``phase``.'''
+        self.count('ldap_requests', op=op)
+        start = time.time()
+        try:
+            yield
+        except Exception:
+            self.count('ldap_errors', op=op)
+            raise
+        finally:
+            elapsed = time.time() - start
+            self.observe('ldap_round_trip_seconds', elapsed, op=op)
+            self.addTime(phase, elapsed)
+    @contextlib.contextmanager
+    def recording(self, tool, path=None, progress=False):
+        '''Context manager for one run of ``tool``: start afresh, show progress if ``progress``, and on the way
+        out save a summary to ``path`` if given, counting a failure if the run raised an exception.'''
+        self.reset()
+        self.count('run_failures', 0)
+        self.showProgress = progress
+        try:
+            yield self
+        except:
+            self.count('run_failures')
+            raise
+        finally:
+            self.showProgress = False
+            if path: self.write(path, tool)
+    def progress(self, label, total=None):
+        '''Make a ``Progress`` for ``label`` that shows only if ``showProgress`` is set.'''
+        scope = getattr(self._scope, 'labels', None)
+        if scope:
+            return Progress(u'[%s] %s' % (u' '.join(v for k, v in sorted(scope.iteritems())), label), total,
+                self.showProgress, lines=True)
+        return Progress(label, total, self.showProgress)
+    def export(self):
+        '''Give the counters, histograms, and phase times so far, for ``merge`` in another process.'''
+        with self._lock:
+            return dict(self.counters), dict(self.histograms), dict(self.phases)
+    def merge(self, exported):
+        '''Add the counters, histograms, and phase times of ``export`` from another process to ours.'''
+        counters, histograms, phases = exported
+        with self._lock:
+            for key, value in counters.iteritems():
+                self.counters[key] = self.counters.get(key, 0) + value
+            for key, histogram in histograms.iteritems():
+                if key in self.histograms:
+                    self.histograms[key].merge(histogram)
+                else:
+                    self.histograms[key] = histogram
+            for phase, seconds in phases.iteritems():
+                self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+    def get(self, name, **labels):
+        '''Get the value of counter ``name`` with exactly the given ``labels``.'''
+        return self.counters.get((name, _labelKey(labels)), 0)
+    def total(self, name):
+        '''Get the sum of counter ``name`` over all its labels.'''
+        return sum(v for (n, labels), v in self.counters.items() if n == name)
+    def asDict(self, tool):
+        '''Summarize this run of ``tool`` as a dictionary ready for JSON.'''
+        with self._lock:
+            now = time.time()
+            return dict(
+                tool=tool, started=self.started, seconds=now - self.started,
+                phases=dict(self.phases),
+                counters=[dict(name=n, labels=dict(l), value=v) for (n, l), v in self.counters.iteritems()],
+                histograms=[dict(name=n, labels=dict(l), count=h.count, sum=h.sum,
+                    buckets=[[bound, count] for bound, count in h.cumulative()])
+                    for (n, l), h in self.histograms.iteritems()],
+            )
+    def prometheus(self, tool):
+        '''Summarize this run of ``tool`` in the Prometheus text exposition format.'''
+        summary, lines, described = self.asDict(tool), [], set()
+        def labels(values):
+            values = dict(values, tool=tool)
+            return u'{%s}' % u','.join(u'%s="%s"' % (k, unicode(v).replace('\\', '\\\\').replace('"', '\\"'))
+                for k, v in sorted(values.iteritems()))
+        def describe(name, kind, text):
+            if name in described: return
+            described.add(name)
+            lines.append(u'# HELP %s%s %s' % (_prefix, name, text))
+            lines.append(u'# TYPE %s%s %s' % (_prefix, name, kind))
+        describe('run_seconds', 'gauge', u'How long the last run took.')
+        lines.append(u'%srun_seconds%s %f' % (_prefix, labels({}), summary['seconds']))
+        describe('last_run_timestamp_seconds', 'gauge', u'When the last run started.')
+        lines.append(u'%slast_run_timestamp_seconds%s %f' % (_prefix, labels({}), summary['started']))
+        for phase, seconds in sorted(summary['phases'].iteritems()):
+            describe('phase_seconds', 'gauge', u'Seconds spent in each phase of the last run.')
+            lines.append(u'%sphase_seconds%s %f' % (_prefix, labels(dict(phase=phase)), seconds))
+        for counter in summary['counters']:
+            name = counter['name'] + u'_total'
+            describe(name, 'counter', _descriptions.get(counter['name'], counter['name'].replace('_', ' ') + u'.'))
+            lines.append(u'%s%s%s %d' % (_prefix, name, labels(counter['labels']), counter['value']))
+        for histogram in summary['histograms']:
+            name = histogram['name']
+            describe(name, 'histogram', _descriptions.get(name, name.replace('_', ' ') + u'.'))
+            for bound, count in histogram['buckets']:
+                lines.append(u'%s%s_bucket%s %d' % (_prefix, name, labels(dict(histogram['labels'], le=repr(bound))),
+                    count))
+            lines.append(u'%s%s_bucket%s %d' % (_prefix, name, labels(dict(histogram['labels'], le='+Inf')),
+                histogram['count']))
+            lines.append(u'%s%s_sum%s %f' % (_prefix, name, labels(histogram['labels']), histogram['sum']))
+            lines.append(u'%s%s_count%s %d' % (_prefix, name, labels(histogram['labels']), histogram['count']))
+        return u'\n'.join(lines) + u'\n'
+    def write(self, path, tool):
+        '''Save a summary of this run of ``tool`` to ``path``: Prometheus text format if it ends in ``.prom``,
+        JSON otherwise.  The file is replaced in one step so a collector never sees half of it.'''
+        if path.endswith('.prom'):
+            data = self.prometheus(tool).encode('utf-8')
+        else:
+            data = json.dumps(self.asDict(tool), indent=2)
+        writeAtomically(path, data)
+
+
+# What the sync tools report to
+metrics = Metrics()
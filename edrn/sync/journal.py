@@ -0,0 +1,105 @@
+# encoding: utf-8
+# Copyright 2026 California Institute of Technology. ALL RIGHTS
+# RESERVED. U.S. Government Sponsorship acknowledged.
+
+'''Journals of finished work, so an interrupted sync can pick up where it stopped.
+
+A ``Journal`` is an append-only file of keys, one per line, naming the people and groups a run has finished
+writing.  It lives in a directory the operator chooses, under a name made from the tool, the server it's
+writing to, and a fingerprint of the entities it parsed and that server, so a run restarted on the same RDF
+and server skips what's already done while a run on changed RDF starts afresh.  Runs against other servers
+keep journals of their own.  Appends are buffered and
+synced to disk every so often rather than on each key; a crash can lose only the last few, which are then
+simply done again.  The journal is deleted once a run succeeds.
+'''
+
+import contextlib, glob, hashlib, os, os.path, time
+
+# Sync the journal to disk after this many keys or this many seconds, whichever comes first
+_syncEvery = 1000
+_syncInterval = 1.0
+
+
+def fingerprint(entities, ldapUrl, *options):
+    '''Make a fingerprint of the parsed ``entities`` (people, sites, or committees) a run writes to the LDAP
+    server at ``ldapUrl``, and any ``options`` that change what it does with them.  The order of the entities
+    doesn't matter.'''
+    digest = hashlib.sha1()
+    digest.update(ldapUrl.encode('utf-8') + '\0')
+    for entityFingerprint in sorted(entity.fingerprint() for entity in entities):
+        digest.update(entityFingerprint + '\0')
+    digest.update('\0')
+    for option in options:
+        digest.update(unicode(option).encode('utf-8') + '\0')
+    return digest.hexdigest()
+
+
+class Journal(object):
+    '''The keys of work ``tool`` has finished on RDF with the given ``fingerprint``, kept in ``directory``.
+    Journals the tool left for other RDF are deleted, since they can't be resumed.  Test whether a key is done
+    with ``in``; ``record`` more as they're finished; ``finish`` when the whole run has succeeded.'''
+    def __init__(self, directory, tool, fingerprint):
+        if not os.path.isdir(directory): os.makedirs(directory)
+        self.path = os.path.join(directory, '%s-%s.journal' % (tool, fingerprint))
+        for stale in glob.glob(os.path.join(directory, '%s-*.journal' % tool)):
+            if stale != self.path: os.remove(stale)
+        self.completed = self._read()
+        self.resumed = len(self.completed)
+        self._out = open(self.path, 'ab')
+        self._unsynced, self._synced = 0, time.time()
+    def _read(self):
+        completed = set()
+        if not os.path.exists(self.path): return completed
+        with open(self.path, 'r+b') as f:
+            end = 0
+            for line in f:
+                # A line without its newline was cut short by a crash; it and anything after are dropped
+                if not line.endswith('\n'): break
+                completed.add(line[:-1].decode('utf-8'))
+                end += len(line)
+            f.truncate(end)
+        return completed
+    def __contains__(self, key):
+        return key in self.completed
+    def __len__(self):
+        return len(self.completed)
+    def record(self, key):
+        '''Note that the work named by ``key`` is finished.'''
+        self.completed.add(key)
+        self._out.write(key.encode('utf-8') + '\n')
+        self._unsynced += 1
+        if self._unsynced >= _syncEvery or time.time() - self._synced >= _syncInterval:
+            self.sync()
+    def sync(self):
+        '''Make sure every key recorded so far is on disk.'''
+        self._out.flush()
+        os.fsync(self._out.fileno())
+        self._unsynced, self._synced = 0, time.time()
+    def close(self):
+        '''Sync and close the journal, keeping it for the next run to resume from.'''
+        if self._out.closed: return
+        self.sync()
+        self._out.close()
+    def finish(self):
+        '''Close and delete the journal now that the run it records has succeeded.'''
+        self._out.close()
+        os.remove(self.path)
+
+
+@contextlib.contextmanager
+def journaling(directory, tool, entities, ldapUrl, *options):
+    '''Context manager giving a ``Journal`` in ``directory`` for ``tool`` writing ``entities`` to the LDAP server
+    at ``ldapUrl`` with ``options``, or None if ``directory`` is None.  The journal is deleted if the block
+    succeeds and kept if it raises.'''
+    if directory is None:
+        yield None
+        return
+    # Name the server in the journal's name too, so only its own stale journals are removed
+    server = hashlib.sha1(ldapUrl.encode('utf-8')).hexdigest()[:12]
+    journal = Journal(directory, '%s-%s' % (tool, server), fingerprint(entities, ldapUrl, *options))
+    try:
+        yield journal
+    except:
+        journal.close()
+        raise
+    journal.finish()
@@ -0,0 +1,275 @@
+# encoding: utf-8
+# Copyright 2026 California Institute of Technology. ALL RIGHTS
+# RESERVED. U.S. Government Sponsorship acknowledged.
+
+'''Pipelined LDAP writes.
+
+Rather than waiting a full round trip for each ``add_s`` or ``modify_s``, a ``PipelinedWriter`` sends
+operations with python-ldap's asynchronous API and keeps up to ``window`` of them in flight on one connection,
+collecting results as it goes.
+
+Given a ``Throttle``, the window becomes a ceiling: the writer starts with one operation in flight and widens
+the window while round trips stay under a latency target, narrows it when they don't, and when the server
+answers busy, unavailable, or out of time, halves it, waits, and sends the operation again.  The throttle can
+also hold writes to at most so many a second.  The tools share the process-wide ``throttle``, so what it
+learns carries over from one stage of a run to the next.
+'''
+
+from instrumentation import metrics
+import array, collections, contextlib, ldap, random, sys, threading, time
+
+# Default number of operations in flight at once
+defaultWindow = 10
+
+# Errors by which a server says it's overloaded rather than that the operation is wrong
+_overloadErrors = (ldap.BUSY, ldap.UNAVAILABLE, ldap.TIMELIMIT_EXCEEDED, ldap.ADMINLIMIT_EXCEEDED, ldap.TIMEOUT)
+
+# Without an explicit latency target, aim for this many times the quickest round trip seen, but no less than
+# the floor, in seconds
+_latencyFactor = 4.0
+_latencyFloor = 0.05
+
+# How much to narrow the window when round trips are too slow
+_narrowing = 0.75
+
+# First wait after an overload error and the longest, in seconds, and how often to send an operation again
+_firstBackoff = 0.1
+_maxBackoff = 10.0
+_maxRetries = 6
+
+
+class Throttle(object):
+    '''Adapts how many LDAP writes are in flight to how the server copes, and paces them.  Until ``configure``
+    is called (or within ``limiting``), it leaves writers alone and only keeps statistics.  Safe to use from
+    several threads.'''
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.enabled = False
+        self.maxLatency = self.rate = None
+        self.reset()
+    def reset(self):
+        '''Start afresh with a window of one and no statistics.'''
+        with self._lock:
+            self.current, self.slowStart, self.ceiling = 1.0, True, 1
+            self.quickest, self.sinceNarrowed, self.overloads = None, 0, 0
+            self.nextSend = 0.0
+            self.latencies = array.array('d')
+            self.first = self.last = None
+            self.backoffs = self.retries = 0
+            self.pacedSeconds = 0.0
+    def configure(self, maxLatency=None, rate=None):
+        '''Start adapting, aiming for round trips of at most ``maxLatency`` seconds (or, if None, a few times
+        the quickest seen) and sending at most ``rate`` operations a second (or, if None, as many as the
+        window allows).'''
+        if maxLatency is not None and maxLatency <= 0:
+            raise ValueError(u'Latency must be positive, not %r' % maxLatency)
+        if rate is not None and rate <= 0: raise ValueError(u'Rate must be positive, not %r' % rate)
+        self.reset()
+        self.maxLatency, self.rate, self.enabled = maxLatency, rate, True
+    def copy(self, share=1):
+        '''Make a fresh throttle configured like this one, for writing to another server, or, with ``share``,
+        for one of that many writers to the same server, which split the rate between them.'''
+        other = Throttle()
+        if self.enabled: other.configure(self.maxLatency, self.rate / float(share) if self.rate else None)
+        return other
+    @contextlib.contextmanager
+    def limiting(self, maxLatency=None, rate=None, out=None):
+        '''Context manager for one run: ``configure`` the throttle, and on the way out write a ``summary`` to
+        ``out`` (standard error by default) if anything was written, and go back to leaving writers alone.'''
+        self.configure(maxLatency, rate)
+        try:
+            yield self
+        finally:
+            self.enabled = False
+            if self.latencies: print >>(out or sys.stderr), self.summary()
+    def window(self, ceiling):
+        '''Tell how many operations a writer whose own window is ``ceiling`` may have in flight now.'''
+        if not self.enabled: return ceiling
+        with self._lock:
+            self.ceiling = max(self.ceiling, ceiling)
+            return max(1, min(ceiling, int(self.current)))
+    def target(self):
+        '''Tell the round-trip time in seconds above which the window narrows.'''
+        if self.maxLatency is not None: return self.maxLatency
+        return max(_latencyFloor, _latencyFactor * (self.quickest or 0.0))
+    def reserve(self):
+        '''Claim the next chance to send an operation and return when it comes, as from ``time.time``, so that
+        operations go out no faster than the rate.'''
+        now = time.time()
+        if not self.enabled or self.rate is None: return now
+        with self._lock:
+            due = max(now, self.nextSend)
+            self.nextSend = due + 1.0 / self.rate
+        return due
+    def waitUntil(self, due):
+        '''Wait till ``due``, as returned by ``reserve``.'''
+        now = time.time()
+        if due > now: self._sleep(due - now)
+    def succeeded(self, latency):
+        '''Note an operation that came back after ``latency`` seconds, and widen or narrow the window.'''
+        with self._lock:
+            self._record(latency)
+            self.overloads = 0
+            if not self.enabled: return
+            self.quickest = latency if self.quickest is None else min(self.quickest, latency)
+            self.sinceNarrowed += 1
+            if latency > self.target():
+                # Narrow at most once a window's worth of results, as those sent together come back slow together
+                if self.sinceNarrowed >= self.current:
+                    self._narrow(_narrowing)
+            elif self.slowStart:
+                self.current += 1.0
+            else:
+                self.current += 1.0 / self.current
+            self.current = min(self.current, float(self.ceiling))
+    def failed(self, latency, error, retry=True):
+        '''Note an operation that came back after ``latency`` seconds with ``error``.  If the server was
+        overloaded, halve the window and, if ``retry``, wait a while and return True to have the operation sent
+        again.'''
+        with self._lock:
+            self._record(latency)
+            if not self.enabled or not isinstance(error, _overloadErrors): return False
+            self._narrow(0.5)
+            if not retry: return False
+            self.overloads += 1
+            self.backoffs += 1
+            delay = min(_maxBackoff, _firstBackoff * 2 ** (self.overloads - 1))
+        metrics.count('ldap_backoffs')
+        # Spread out the retries of writers that were turned away together
+        self._sleep(delay * random.uniform(0.5, 1.0))
+        return True
+    def retried(self):
+        '''Note an operation sent again after an overload.'''
+        with self._lock:
+            self.retries += 1
+        metrics.count('ldap_retries')
+    def _narrow(self, factor):
+        self.current, self.slowStart, self.sinceNarrowed = max(1.0, self.current * factor), False, 0
+    def _record(self, latency):
+        now = time.time()
+        if self.first is None: self.first = now - latency
+        self.last = now
+        self.latencies.append(latency)
+    def _sleep(self, seconds):
+        with self._lock:
+            self.pacedSeconds += seconds
+        metrics.addTime('ldap_throttle', seconds)
+        time.sleep(seconds)
+    def summary(self):
+        '''Describe the throughput and round-trip times of the writes so far.'''
+        with self._lock:
+            latencies = sorted(self.latencies)
+            elapsed = (self.last - self.first) if latencies else 0.0
+            def quantile(q):
+                return latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000.0 if latencies else 0.0
+            return (u'LDAP writes: %d in %.1fs (%.1f/s); round trip ms p50 %.1f, p95 %.1f, p99 %.1f, max %.1f; '
+                u'window %d of %d; %d backoffs, %d retries, %.1fs held back') % (len(latencies), elapsed,
+                len(latencies) / elapsed if elapsed > 0 else 0.0, quantile(0.5), quantile(0.95), quantile(0.99),
+                quantile(1.0), int(self.current), self.ceiling, self.backoffs, self.retries, self.pacedSeconds)
+
+
+class PipelinedWriter(object):
+    '''Send adds, modifies, and deletes over ``ldapConn`` with up to ``window`` awaiting results at once.  Each
+    operation may have a ``callback``, called as ``callback(dn, error)`` once its result arrives, where ``error``
+    is None on success or the ``ldap.LDAPError`` the server answered with.  With a ``throttle``, fewer may be in
+    flight and operations turned away by an overloaded server are sent again.  Call ``flush`` to wait for
+    everything.'''
+    def __init__(self, ldapConn, window=defaultWindow, throttle=None):
+        if window < 1: raise ValueError(u'Window must be at least 1, not %d' % window)
+        self.ldapConn, self.window, self.throttle = ldapConn, window, throttle
+        self.succeeded = self.failed = 0
+        self._inFlight, self._retries = collections.deque(), collections.deque()
+    def add(self, dn, modlist, callback=None):
+        '''Send an add of entry ``dn`` with attributes ``modlist`` (as made by ``ldap.modlist.addModlist``).'''
+        self._resend()
+        self._send('add', self.ldapConn.add_ext, (dn, modlist), dn, callback)
+    def modify(self, dn, modlist, callback=None):
+        '''Send a modify of entry ``dn`` with the given ``modlist`` of ``(op, attr, values)``.'''
+        self._resend()
+        self._send('modify', self.ldapConn.modify_ext, (dn, modlist), dn, callback)
+    def delete(self, dn, callback=None):
+        '''Send a delete of entry ``dn``.'''
+        self._resend()
+        self._send('delete', self.ldapConn.delete_ext, (dn,), dn, callback)
+    def _resend(self):
+        # Operations turned away by an overloaded server go again before anything new
+        while self._retries:
+            self._send(*self._retries.popleft())
+    def _window(self):
+        return self.window if self.throttle is None else self.throttle.window(self.window)
+    def _send(self, op, operation, args, dn, callback, attempt=0):
+        while len(self._inFlight) >= self._window():
+            self._collect()
+        if self.throttle is not None:
+            due = self.throttle.reserve()
+            # Collect results while held back, or they'd wait with us and seem to have taken that long
+            while self._inFlight and time.time() < due:
+                self._collect()
+            self.throttle.waitUntil(due)
+        metrics.count('ldap_requests', op=op)
+        sent = time.time()
+        try:
+            msgid = operation(*args)
+        except ldap.SERVER_DOWN:
+            # The results of whatever's in flight are gone with the connection
+            metrics.count('ldap_errors', op=op)
+            self._inFlight.clear()
+            raise
+        except ldap.LDAPError, ex:
+            # Refused before it was even sent; answer for it just as if the server had
+            self._answered(op, sent, sent, dn, callback, operation, args, attempt, ex)
+            return
+        except Exception:
+            # Let what's in flight finish and be answered for before giving up
+            error = sys.exc_info()
+            while self._inFlight:
+                self._collect()
+            raise error[0], error[1], error[2]
+        metrics.addTime('ldap_write', time.time() - sent)
+        self._inFlight.append((msgid, op, sent, dn, callback, operation, args, attempt))
+    def _collect(self):
+        # Take results in the order we sent the operations; later ones keep working on the server meanwhile.
+        # The round trip runs from sending to having the result, so it includes time queued behind others.
+        msgid, op, sent, dn, callback, operation, args, attempt = self._inFlight.popleft()
+        waiting = time.time()
+        try:
+            self.ldapConn.result3(msgid)
+        except ldap.SERVER_DOWN:
+            metrics.count('ldap_errors', op=op)
+            self._inFlight.clear()
+            raise
+        except ldap.LDAPError, ex:
+            self._answered(op, sent, waiting, dn, callback, operation, args, attempt, ex)
+        else:
+            self._answered(op, sent, waiting, dn, callback, operation, args, attempt, None)
+    def _answered(self, op, sent, waiting, dn, callback, operation, args, attempt, error):
+        # Count the result of an operation, send it again if the throttle says to, or tell its callback
+        latency = self._received(op, sent, waiting)
+        if error is None:
+            if self.throttle is not None: self.throttle.succeeded(latency)
+            self.succeeded += 1
+        else:
+            if self.throttle is not None and self.throttle.failed(latency, error, attempt < _maxRetries):
+                self.throttle.retried()
+                self._retries.append((op, operation, args, dn, callback, attempt + 1))
+                return
+            self.failed += 1
+            metrics.count('ldap_errors', op=op)
+        if callback is not None: callback(dn, error)
+    def _received(self, op, sent, waiting):
+        now = time.time()
+        metrics.observe('ldap_round_trip_seconds', now - sent, op=op)
+        metrics.addTime('ldap_write', now - waiting)
+        return now - sent
+    def pending(self):
+        '''Tell how many operations are still awaiting results.'''
+        return len(self._inFlight) + len(self._retries)
+    def flush(self):
+        '''Wait for the results of every operation sent so far, sending again any turned away meanwhile.'''
+        while self._inFlight or self._retries:
+            self._resend()
+            if self._inFlight: self._collect()
+
+
+# What the sync tools write through
+throttle = Throttle()
@@ -0,0 +1,275 @@
+# encoding: utf-8
+# Copyright 2026 California Institute of Technology. ALL RIGHTS
+# RESERVED. U.S. Government Sponsorship acknowledged.
+
+'''An in-memory stand-in for an LDAP server, for benchmarks and tests.
+
+A ``MemoryDirectory`` holds entries and answers the python-ldap connection calls the sync tools make: binds,
+``search_s`` and paged ``search_ext``, the synchronous and asynchronous adds, modifies, and deletes, and
+``result3``.  It counts every request, which is one round trip to a real server, and can add a fixed
+``latency`` to each so that pipelining and batching show up in timings the way they would over a network.
+Install it in place of ``ldap.initialize`` with ``installed``, or several as different servers with
+``installedServers``.
+'''
+
+from ldap.controls import SimplePagedResultsControl
+from syncldap import normalizeDN
+import collections, contextlib, itertools, ldap, re, threading, time
+
+# Attributes whose values are DNs, compared in normalized form
+_dnAttributes = frozenset(('uniquemember', 'member'))
+
+
+def _error(exceptionClass, desc, info):
+    return exceptionClass({'desc': desc, 'info': info})
+
+
+def _unescape(value):
+    return re.sub(r'\\([0-9a-fA-F]{2})', lambda match: chr(int(match.group(1), 16)), value)
+
+
+def _key(attr, value):
+    return normalizeDN(value) if attr in _dnAttributes else value.lower()
+
+
+def _parseFilter(text, position=0):
+    '''Parse the filter in ``text`` starting at ``position``; return a predicate on ``{attr→[values]}`` (with
+    lower-case attribute names) and the position just after the filter.'''
+    if text[position:position + 1] != '(':
+        raise _error(ldap.FILTER_ERROR, 'Bad search filter', text)
+    position += 1
+    op = text[position:position + 1]
+    if op in ('&', '|'):
+        position += 1
+        parts = []
+        while text[position:position + 1] == '(':
+            part, position = _parseFilter(text, position)
+            parts.append(part)
+        test = (lambda e: all(p(e) for p in parts)) if op == '&' else (lambda e: any(p(e) for p in parts))
+    elif op == '!':
+        part, position = _parseFilter(text, position + 1)
+        test = lambda e: not part(e)
+    else:
+        end = text.find(')', position)
+        if end < 0: raise _error(ldap.FILTER_ERROR, 'Bad search filter', text)
+        attr, sep, value = text[position:end].partition('=')
+        if not sep: raise _error(ldap.FILTER_ERROR, 'Bad search filter', text)
+        attr = attr.strip().lower()
+        position = end
+        if value == '*':
+            test = lambda e: bool(e.get(attr))
+        elif '*' in value:
+            pattern = re.compile('.*'.join(re.escape(_key(attr, _unescape(i))) for i in value.split('*')) + '$')
+            test = lambda e: any(pattern.match(_key(attr, v)) for v in e.get(attr, []))
+        else:
+            wanted = _key(attr, _unescape(value))
+            test = lambda e: any(_key(attr, v) == wanted for v in e.get(attr, []))
+    if text[position:position + 1] != ')':
+        raise _error(ldap.FILTER_ERROR, 'Bad search filter', text)
+    return test, position + 1
+
+
+def parseFilter(text):
+    '''Turn the LDAP search filter ``text`` into a predicate on ``{attr→[values]}`` with lower-case attribute
+    names.  Equality, presence, substrings, and ``&``, ``|``, and ``!`` are supported, all case-insensitive.'''
+    test, position = _parseFilter(text.strip())
+    if position != len(text.strip()): raise _error(ldap.FILTER_ERROR, 'Bad search filter', text)
+    return test
+
+
+class _Entry(object):
+    '''An entry's DN and attributes, keyed by lower-case name with the name as first given.'''
+    __slots__ = ('dn', 'attrs')
+    def __init__(self, dn, attrs):
+        self.dn, self.attrs = dn, attrs
+    def values(self):
+        return dict((key, values) for key, (name, values) in self.attrs.iteritems())
+    def select(self, attrlist):
+        if attrlist is None or '*' in attrlist:
+            return dict((name, list(values)) for name, values in self.attrs.itervalues())
+        wanted = frozenset(i.lower() for i in attrlist)
+        return dict((name, list(values)) for key, (name, values) in self.attrs.iteritems() if key in wanted)
+
+
+class MemoryDirectory(object):
+    '''The entries of an in-memory directory, shared by all connections made with ``initialize``.  Parents of
+    new entries needn't exist.  ``requests`` counts requests by kind; ``latency`` is how many seconds each
+    request takes to answer.'''
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.entries = collections.OrderedDict()
+        self.requests = collections.Counter()
+        self._lock = threading.RLock()
+    def initialize(self, url):
+        '''Make a new connection to this directory, as ``ldap.initialize`` would to a server at ``url``.'''
+        return MemoryConnection(self)
+    @contextlib.contextmanager
+    def installed(self):
+        '''Context manager that makes ``ldap.initialize`` connect to this directory whatever the URL.'''
+        initialize = ldap.initialize
+        ldap.initialize = self.initialize
+        try:
+            yield self
+        finally:
+            ldap.initialize = initialize
+    def roundTrips(self):
+        return sum(self.requests.itervalues())
+    def __len__(self):
+        return len(self.entries)
+    def get(self, dn):
+        '''Get ``{attr→[values]}`` for entry ``dn`` as first named, or None if there's no such entry.'''
+        entry = self.entries.get(normalizeDN(dn))
+        return None if entry is None else entry.select(None)
+    def add(self, dn, modlist):
+        '''Add entry ``dn`` with attributes ``modlist`` of ``(attr, values)``.'''
+        key = normalizeDN(dn)
+        with self._lock:
+            if key in self.entries: raise _error(ldap.ALREADY_EXISTS, 'Already exists', dn)
+            attrs = {}
+            for attr, values in modlist:
+                values = [values] if isinstance(values, basestring) else list(values)
+                attrs.setdefault(attr.lower(), (attr, []))[1].extend(values)
+            self.entries[key] = _Entry(dn, attrs)
+    def modify(self, dn, modlist):
+        '''Change entry ``dn`` with ``modlist`` of ``(op, attr, values)``, all or nothing.'''
+        with self._lock:
+            entry = self.entries.get(normalizeDN(dn))
+            if entry is None: raise _error(ldap.NO_SUCH_OBJECT, 'No such object', dn)
+            attrs = dict((key, (name, list(values))) for key, (name, values) in entry.attrs.iteritems())
+            for op, attr, values in modlist:
+                key = attr.lower()
+                values = [values] if isinstance(values, basestring) else list(values or [])
+                name, current = attrs.get(key, (attr, []))
+                if op == ldap.MOD_ADD:
+                    have = set(_key(key, v) for v in current)
+                    for value in values:
+                        if _key(key, value) in have:
+                            raise _error(ldap.TYPE_OR_VALUE_EXISTS, 'Type or value exists', '%s: %s' % (attr, value))
+                        have.add(_key(key, value))
+                    attrs[key] = (name, current + values)
+                elif op == ldap.MOD_DELETE:
+                    if key not in attrs: raise _error(ldap.NO_SUCH_ATTRIBUTE, 'No such attribute', attr)
+                    if values:
+                        doomed = set(_key(key, v) for v in values)
+                        if not doomed <= set(_key(key, v) for v in current):
+                            raise _error(ldap.NO_SUCH_ATTRIBUTE, 'No such attribute', attr)
+                        current = [v for v in current if _key(key, v) not in doomed]
+                    else:
+                        current = []
+                    if current:
+                        attrs[key] = (name, current)
+                    else:
+                        del attrs[key]
+                elif op == ldap.MOD_REPLACE:
+                    if values:
+                        attrs[key] = (name, values)
+                    else:
+                        attrs.pop(key, None)
+                else:
+                    raise _error(ldap.PROTOCOL_ERROR, 'Protocol error', 'Unknown modify operation %r' % (op,))
+            entry.attrs = attrs
+    def delete(self, dn):
+        with self._lock:
+            if self.entries.pop(normalizeDN(dn), None) is None:
+                raise _error(ldap.NO_SUCH_OBJECT, 'No such object', dn)
+    def search(self, base, scope, filterstr='(objectClass=*)', attrlist=None):
+        '''Return ``[(dn, {attr→[values]})]`` for entries in ``scope`` of ``base`` matching ``filterstr``.'''
+        test, base = parseFilter(filterstr or '(objectClass=*)'), normalizeDN(base)
+        if base == '' and scope == ldap.SCOPE_BASE:
+            return [('', {})]
+        if scope == ldap.SCOPE_BASE:
+            candidates = [self.entries[base]] if base in self.entries else []
+        elif scope == ldap.SCOPE_ONELEVEL:
+            candidates = [e for key, e in self.entries.items() if key.partition(',')[2] == base]
+        else:
+            suffix = ',' + base
+            candidates = [e for key, e in self.entries.items() if key == base or key.endswith(suffix) or not base]
+        return [(e.dn, e.select(attrlist)) for e in candidates if test(e.values())]
+
+
+class MemoryConnection(object):
+    '''A connection to a ``MemoryDirectory`` with the python-ldap ``LDAPObject`` calls the sync tools use.'''
+    def __init__(self, directory):
+        self.directory = directory
+        self._results = {}
+        self._cursors = {}
+        self._ids = itertools.count(1)
+    def _request(self, kind):
+        self.directory.requests[kind] += 1
+        return time.time() + self.directory.latency
+    def _wait(self, ready):
+        delay = ready - time.time()
+        if delay > 0: time.sleep(delay)
+    def _sync(self, kind, operation, *args):
+        self._wait(self._request(kind))
+        return operation(*args)
+    def _async(self, kind, resultType, operation, *args):
+        ready = self._request(kind)
+        try:
+            result = (resultType, operation(*args), [])
+        except ldap.LDAPError, ex:
+            result = ex
+        msgid = self._ids.next()
+        self._results[msgid] = (ready, result)
+        return msgid
+    def simple_bind_s(self, who='', cred=''):
+        self._wait(self._request('bind'))
+    bind_s = simple_bind_s
+    def unbind_s(self):
+        self._request('unbind')
+    unbind = unbind_s
+    def search_s(self, base, scope, filterstr='(objectClass=*)', attrlist=None, attrsonly=0):
+        return self._sync('search', self.directory.search, base, scope, filterstr, attrlist)
+    def search_ext(self, base, scope, filterstr='(objectClass=*)', attrlist=None, attrsonly=0, serverctrls=None,
+        clientctrls=None, timeout=-1, sizelimit=0):
+        return self._async('search', ldap.RES_SEARCH_RESULT, self._search, base, scope, filterstr, attrlist,
+            serverctrls)
+    def _search(self, base, scope, filterstr, attrlist, serverctrls):
+        paging = [c for c in serverctrls or [] if c.controlType == SimplePagedResultsControl.controlType]
+        if not paging:
+            return self.directory.search(base, scope, filterstr, attrlist), []
+        control = paging[0]
+        if control.cookie:
+            results = self._cursors.pop(control.cookie, None)
+            if results is None: raise _error(ldap.PROTOCOL_ERROR, 'Protocol error', 'Unknown paged results cookie')
+        else:
+            results = self.directory.search(base, scope, filterstr, attrlist)
+        page, rest = results[:control.size or len(results)], results[control.size or len(results):]
+        cookie = ''
+        if rest:
+            cookie = 'page%d' % self._ids.next()
+            self._cursors[cookie] = rest
+        return page, [SimplePagedResultsControl(True, size=control.size, cookie=cookie)]
+    def add_s(self, dn, modlist):
+        return self._sync('add', self.directory.add, dn, modlist)
+    def add_ext(self, dn, modlist, serverctrls=None, clientctrls=None):
+        return self._async('add', ldap.RES_ADD, self.directory.add, dn, modlist)
+    def modify_s(self, dn, modlist):
+        return self._sync('modify', self.directory.modify, dn, modlist)
+    def modify_ext(self, dn, modlist, serverctrls=None, clientctrls=None):
+        return self._async('modify', ldap.RES_MODIFY, self.directory.modify, dn, modlist)
+    def delete_s(self, dn):
+        return self._sync('delete', self.directory.delete, dn)
+    def delete_ext(self, dn, serverctrls=None, clientctrls=None):
+        return self._async('delete', ldap.RES_DELETE, self.directory.delete, dn)
+    def result3(self, msgid=ldap.RES_ANY if hasattr(ldap, 'RES_ANY') else -1, all=1, timeout=None):
+        ready, result = self._results.pop(msgid)
+        self._wait(ready)
+        if isinstance(result, ldap.LDAPError): raise result
+        resultType, value, controls = result
+        if resultType == ldap.RES_SEARCH_RESULT:
+            data, controls = value
+            return resultType, data, msgid, controls
+        return resultType, [], msgid, controls
+
+
+@contextlib.contextmanager
+def installedServers(directories):
+    '''Context manager that makes ``ldap.initialize`` connect to the directory that ``directories``, a mapping
+    of URL to ``MemoryDirectory``, has for each URL.'''
+    initialize = ldap.initialize
+    ldap.initialize = lambda url: directories[url].initialize(url)
+    try:
+        yield directories
+    finally:
+        ldap.initialize = initialize
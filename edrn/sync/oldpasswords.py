@@ -2,8 +2,11 @@
 
 u'''Secure old "changeme" passwords'''
 
+from .instrumentation import metrics
 from .utils import generatePassword
-import argparse, logging, sys, getpass, ldap, re, hashlib
+from .syncldap import pagedSearch
+from .passwordaudit import PasswordAuditor
+import argparse, logging, sys, getpass, ldap
 
 logging.basicConfig(level=logging.INFO, format='%(levelname)-8s %(message)s')
 
@@ -12,11 +15,8 @@ _ldapManager = u'uid=admin,ou=system'
 _query = u'(objectClass=edrnPerson)'
 _scope = u'one'
 _base = u'dc=edrn,dc=jpl,dc=nasa,dc=gov'
-_algorithmMatcher = re.compile(ur'\{([^}]+)\}(.+)')
 _badPasswd = 'changeme'
-
-_unsaltedBadSHA1Digest = hashlib.sha1(_badPasswd).digest()
-_unsaltedBadMD5Digest = hashlib.md5(_badPasswd).digest()
+_pageSize = 500
 
 _scopes = {
     u'base': ldap.SCOPE_BASE,
@@ -25,54 +25,85 @@ _scopes = {
 }
 
 
-_argParser = argparse.ArgumentParser(description=u'Change old "changeme" passwords')
+_argParser = argparse.ArgumentParser(description=u'Change old "changeme" and other weak passwords')
 _argParser.add_argument('-D', '--manager-dn', default=_ldapManager, help=u'LDAP manager DN; default %(default)s')
 _argParser.add_argument('-w', '--ldap-password', help=u"LDAP server manager password; if not given, you'll be prompted")
 _argParser.add_argument('-H', '--url', default=_ldapURL, help=u'URL to LDAP server; default %(default)s')
 _argParser.add_argument('-b', '--base', default=_base, help=u'Base DN for search; default %(default)s')
 _argParser.add_argument('-q', '--query', default=_query, help=u'User query; default %(default)s')
 _argParser.add_argument('-s', '--scope', default=_scope, help=u'Search scope; default %(default)s')
+_argParser.add_argument('-z', '--page-size', type=int, default=_pageSize,
+    help=u'How many users to read from the server at a time; default %(default)s')
+_argParser.add_argument('-W', '--weak-passwords', type=argparse.FileType('rb'),
+    help=u'File of weak passwords to look for, one per line; default just "%s"' % _badPasswd)
+_argParser.add_argument('-j', '--processes', type=int,
+    help=u'Worker processes for checking salted passwords; default one per CPU, 0 for none')
+_argParser.add_argument('--progress', action='store_true',
+    help=u'Show how many users have been checked so far on standard error')
+_argParser.add_argument('--metrics', metavar='FILE',
+    help=u'Save counts and timings of the run to FILE: Prometheus text format if it ends in .prom, JSON otherwise')
 
 
 def fixPassword(connection, dn):
     logging.info(u'Fixing bad password for "%s"', dn)
     modlist = [(ldap.MOD_DELETE, 'userPassword', None), (ldap.MOD_ADD, 'userPassword', [generatePassword()])]
-    connection.modify_s(dn, modlist)
+    with metrics.request('modify', 'ldap_write'):
+        connection.modify_s(dn, modlist)
+    metrics.count('passwords_fixed')
 
 
-def fixPasswords(managerDN, managerPassword, ldapURL, query, scope, base):
-    connection = ldap.initialize(ldapURL)
-    connection.bind_s(managerDN, managerPassword)
-    results = connection.search_s(base, scope, query)
-    for dn, attrs in results:
+def readWeakPasswords(stream):
+    u'''Read weak passwords from ``stream``, one per line, ignoring blank lines and # comments.'''
+    passwords = []
+    for line in stream:
+        line = line.rstrip('\r\n')
+        if line and not line.startswith('#'): passwords.append(line)
+    return passwords
+
+
+def _passwords(connection, query, scope, base, pageSize):
+    progress = metrics.progress('users')
+    for dn, attrs in pagedSearch(connection, base, scope, query, ['userPassword'], pageSize):
+        progress.advance()
         potentiallySaltedHashWithAlg = attrs.get('userPassword')
         potentiallySaltedHashWithAlg = potentiallySaltedHashWithAlg[0] if potentiallySaltedHashWithAlg else None
         if not potentiallySaltedHashWithAlg:
             logging.warn(u'No password for %s', dn)
             continue
-        match = _algorithmMatcher.match(potentiallySaltedHashWithAlg)
-        alg, potentiallySaltedHash = match.group(1), match.group(2)
-        if alg == 'MD5':
-            if _unsaltedBadMD5Digest == potentiallySaltedHash.decode('base64'):
-                fixPassword(connection, dn)
-        elif alg == 'SHA':
-            if _unsaltedBadSHA1Digest == potentiallySaltedHash.decode('base64'):
-                fixPassword(connection, dn)
-        elif alg == 'SSHA':
-            digest, salt = potentiallySaltedHash.decode('base64')[:20], potentiallySaltedHash.decode('base64')[20:]
-            sha1 = hashlib.sha1(_badPasswd)
-            sha1.update(salt)
-            if sha1.digest() == digest:
-                fixPassword(connection, dn)
-        else:
-            logging.info(u'Skipping dn "%s" due to algorithm %s', dn, alg)
+        yield dn, potentiallySaltedHashWithAlg
+    progress.finish()
+
+
+def fixPasswords(managerDN, managerPassword, ldapURL, query, scope, base, pageSize=_pageSize, weakPasswords=None,
+    processes=None):
+    connection = ldap.initialize(ldapURL)
+    with metrics.request('bind', 'ldap_bind'):
+        connection.bind_s(managerDN, managerPassword)
+    securePasswords(connection, query, scope, base, pageSize, weakPasswords, processes)
     connection.unbind_s()
 
 
+def securePasswords(connection, query=_query, scope=ldap.SCOPE_ONELEVEL, base=_base, pageSize=_pageSize,
+    weakPasswords=None, processes=None):
+    u'''Replace weak passwords of the users matching ``query`` with random ones, using an already bound
+    ``connection``.'''
+    auditor = PasswordAuditor(weakPasswords if weakPasswords else [_badPasswd], processes)
+    # Read a page at a time, and only the password, so memory stays flat however many users there are; salted
+    # hashes are checked in worker processes while we fix the weak ones found so far
+    for dn in auditor.audit(_passwords(connection, query, scope, base, pageSize)):
+        fixPassword(connection, dn)
+    for alg, count in sorted(auditor.checked.iteritems()):
+        logging.info(u'Checked %d %s passwords', count, alg)
+        metrics.count('passwords_checked', count, scheme=alg)
+
+
 def main():
     args = _argParser.parse_args()
     password = args.ldap_password if args.ldap_password else getpass.getpass(u'LDAP manager password: ')
-    fixPasswords(args.manager_dn, password, args.url, args.query, _scopes[args.scope], args.base)
+    weakPasswords = readWeakPasswords(args.weak_passwords) if args.weak_passwords else None
+    with metrics.recording('secureoldpasswords', args.metrics, args.progress):
+        fixPasswords(args.manager_dn, password, args.url, args.query, _scopes[args.scope], args.base,
+            args.page_size, weakPasswords, args.processes)
     return True
 
 
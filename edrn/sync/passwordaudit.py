@@ -0,0 +1,170 @@
+# encoding: utf-8
+# Copyright 2026 California Institute of Technology. ALL RIGHTS
+# RESERVED. U.S. Government Sponsorship acknowledged.
+
+u'''Checking LDAP password hashes against a list of weak passwords.
+
+Unsalted schemes ({MD5}, {SHA}, {SHA256}, …) are checked in the calling process by looking the hash up in
+digests of the weak passwords computed once up front.  Salted schemes ({SSHA}, {SSHA256}, {SSHA512}, {SMD5},
+{CRYPT}, {PBKDF2…}) need hashing per entry, so they're checked in batches in a pool of worker processes, each of
+which hashes the weak passwords once and then only feeds in each entry's salt.
+'''
+
+import base64, collections, hashlib, logging, multiprocessing, re
+
+try:
+    import crypt
+except ImportError:
+    crypt = None
+
+_algorithmMatcher = re.compile(r'\{([^}]+)\}(.+)', re.DOTALL)
+
+# Unsalted schemes, and salted schemes of the form base64(digest + salt), by hash function
+_unsaltedSchemes = {'MD5': hashlib.md5, 'SHA': hashlib.sha1, 'SHA256': hashlib.sha256, 'SHA384': hashlib.sha384,
+    'SHA512': hashlib.sha512}
+_saltedSchemes = {'SMD5': hashlib.md5, 'SSHA': hashlib.sha1, 'SSHA256': hashlib.sha256, 'SSHA384': hashlib.sha384,
+    'SSHA512': hashlib.sha512}
+_pbkdf2Schemes = {'PBKDF2': 'sha1', 'PBKDF2-SHA1': 'sha1', 'PBKDF2-SHA256': 'sha256', 'PBKDF2-SHA512': 'sha512'}
+
+# How many salted hashes to send to a worker at once
+_batchSize = 256
+
+# Hash states of the weak passwords for salted schemes, built once in each worker process by ``_initWorker``
+_workerPrefixes = None
+_workerPasswords = None
+
+
+def parseHash(value):
+    u'''Split an LDAP ``userPassword`` value like ``{SSHA}…`` into its upper-case scheme and the rest; return
+    ``(None, None)`` if it doesn't name a scheme.'''
+    match = _algorithmMatcher.match(value)
+    return (match.group(1).upper(), match.group(2)) if match else (None, None)
+
+
+def isSupported(alg):
+    u'''Tell if we know how to check passwords hashed with scheme ``alg``.'''
+    return alg in _unsaltedSchemes or alg in _saltedSchemes or alg in _pbkdf2Schemes or (alg == 'CRYPT' and
+        crypt is not None)
+
+
+def isSalted(alg):
+    return isSupported(alg) and alg not in _unsaltedSchemes
+
+
+def _saltedPrefixes(passwords):
+    return dict((alg, [hashFunction(p) for p in passwords]) for alg, hashFunction in _saltedSchemes.iteritems())
+
+
+def _ab64decode(data):
+    # The "adapted" base64 used by PBKDF2 hashes has "." for "+" and no padding
+    data = data.replace('.', '+')
+    return base64.b64decode(data + '=' * (-len(data) % 4))
+
+
+def isWeakSalted(alg, payload, passwords, prefixes):
+    u'''Tell if the salted hash ``payload`` of scheme ``alg`` is of one of the ``passwords``, using
+    ``prefixes`` from ``_saltedPrefixes``.'''
+    if alg in _saltedSchemes:
+        raw = base64.b64decode(payload)
+        hashes = prefixes[alg]
+        size = hashes[0].digest_size if hashes else 0
+        digest, salt = raw[:size], raw[size:]
+        for prefix in hashes:
+            candidate = prefix.copy()
+            candidate.update(salt)
+            if candidate.digest() == digest: return True
+        return False
+    elif alg in _pbkdf2Schemes:
+        iterations, salt, digest = payload.split('$')
+        salt, digest = _ab64decode(salt), _ab64decode(digest)
+        for password in passwords:
+            if hashlib.pbkdf2_hmac(_pbkdf2Schemes[alg], password, salt, int(iterations), len(digest)) == digest:
+                return True
+        return False
+    elif alg == 'CRYPT':
+        return any(crypt.crypt(password, payload) == payload for password in passwords)
+    raise ValueError(u'Unsupported salted scheme %s' % alg)
+
+
+def _initWorker(passwords):
+    global _workerPrefixes, _workerPasswords
+    _workerPasswords = passwords
+    _workerPrefixes = _saltedPrefixes(passwords)
+
+
+def _checkBatch(batch, passwords, prefixes):
+    u'''Check a batch of salted ``(dn, alg, payload)``; return ``(dn, weak, error)`` for each.'''
+    results = []
+    for dn, alg, payload in batch:
+        try:
+            results.append((dn, isWeakSalted(alg, payload, passwords, prefixes), None))
+        except (ValueError, TypeError), ex:
+            results.append((dn, False, unicode(ex)))
+    return results
+
+
+def _auditBatch(batch):
+    return _checkBatch(batch, _workerPasswords, _workerPrefixes)
+
+
+class PasswordAuditor(object):
+    u'''Find which of many password hashes are of known weak passwords.  Salted hashes are checked by
+    ``processes`` worker processes (one per CPU if None; 0 checks everything in this process).'''
+    def __init__(self, weakPasswords, processes=None):
+        self.passwords = tuple(weakPasswords)
+        if not self.passwords: raise ValueError(u'No weak passwords to check for')
+        self.processes = multiprocessing.cpu_count() if processes is None else processes
+        self.digests = dict((alg, frozenset(f(p).digest() for p in self.passwords))
+            for alg, f in _unsaltedSchemes.iteritems())
+        self.prefixes = _saltedPrefixes(self.passwords)
+        self.checked = collections.Counter()
+    def isWeakUnsalted(self, alg, payload):
+        return base64.b64decode(payload) in self.digests[alg]
+    def audit(self, entries):
+        u'''Check ``entries``, an iterable of ``(dn, userPassword)``, and yield the DN of each one whose
+        password is weak.  Entries come in and results go out as they're ready, so neither has to fit in
+        memory, and the caller may remediate each DN as it arrives.'''
+        pool = multiprocessing.Pool(self.processes, _initWorker, (self.passwords,)) if self.processes else None
+        pending, batch = collections.deque(), []
+        try:
+            for dn, value in entries:
+                alg, payload = parseHash(value)
+                if not isSupported(alg):
+                    logging.info(u'Skipping dn "%s" due to algorithm %s', dn, alg)
+                    continue
+                self.checked[alg] += 1
+                if isSalted(alg):
+                    batch.append((dn, alg, payload))
+                    if len(batch) >= _batchSize:
+                        for weak in self._submit(pool, pending, batch): yield weak
+                        batch = []
+                else:
+                    try:
+                        if self.isWeakUnsalted(alg, payload): yield dn
+                    except TypeError:
+                        logging.warn(u'Malformed %s password for %s', alg, dn)
+            if batch:
+                for weak in self._submit(pool, pending, batch): yield weak
+            while pending:
+                for weak in self._weakOf(pending.popleft().get()): yield weak
+        finally:
+            if pool is not None:
+                pool.terminate()
+                pool.join()
+    def _submit(self, pool, pending, batch):
+        if pool is None:
+            return self._weakOf(_checkBatch(batch, self.passwords, self.prefixes))
+        pending.append(pool.apply_async(_auditBatch, (batch,)))
+        # Keep every worker busy, but don't let finished results pile up
+        weak = []
+        while pending and (pending[0].ready() or len(pending) > 2 * self.processes):
+            weak.extend(self._weakOf(pending.popleft().get()))
+        return weak
+    def _weakOf(self, results):
+        weak = []
+        for dn, isWeak, error in results:
+            if error:
+                logging.warn(u'Malformed password for %s: %s', dn, error)
+            elif isWeak:
+                weak.append(dn)
+        return weak
@@ -5,13 +5,20 @@
 
 '''EDRN RDF data structures for use in the sync tools.'''
 
+from instrumentation import metrics
 from rdflib.term import URIRef
+from rdfstream import iterRecords, openSource, sourceFormat, rdflibFormats, UnsupportedRDF
 import rdflib
-import re
+import contextlib, hashlib, re
 
 # Bogus phone number if we can't figure one out
 _defaultPhone = '+1 555 555 5555'
 
+# Parsing engines: "sax" streams flat RDF/XML one subject at a time, reads N-Triples a line at a time, and
+# falls back to "rdflib" for anything else; "rdflib" always loads the whole document into a graph
+_engines = ('sax', 'rdflib')
+defaultEngine = 'sax'
+
 # General predicate URIs
 _typeURI  = URIRef(u'http://www.w3.org/1999/02/22-rdf-syntax-ns#type')
 _titleURI = URIRef(u'http://purl.org/dc/terms/title')
@@ -46,27 +53,212 @@ _allMemberURIs    = (_memberURI, _chairURI, _coChairURI, _consultantURI)
 def getPersonById(personId, personList):
     '''Get the person with matching ``personId`` out of ``personList``, or None if not found.'''
     if personId == None: return None
+    if isinstance(personList, RDFPersonList):
+        return personList.getPersonByRdfId(personId)
     for person in personList:
         if person.rdfId == personId:
             return person 
     return None
+
+def _rdfIdLookup(personList):
+    '''Return a callable that maps an RDF id to the matching person in ``personList`` (or None) in constant time.
+    An ``RDFPersonList`` already keeps such an index; any other sequence of people gets indexed once here.'''
+    if isinstance(personList, RDFPersonList):
+        return personList.getPersonByRdfId
+    index = {}
+    for person in personList:
+        index.setdefault(person.rdfId, person)
+    return index.get
     
+def _compact(value):
+    '''Return ``value`` as a byte string if it's all ASCII, which takes a fraction of the memory of a unicode
+    string; anything else stays unicode.'''
+    try:
+        return value.encode('ascii')
+    except UnicodeError:
+        return value
+
+def _fingerprint(*values):
+    '''Make a fingerprint of ``values``, strings or None, that changes whenever any of them does.'''
+    digest = hashlib.sha1()
+    for value in values:
+        # Mark None and strings apart and end every field the same way, so no two sequences of values run together
+        digest.update(('\1' if value is None else '\2' + unicode(value).encode('utf-8')) + '\0')
+    return digest.hexdigest()
+
+def _sharedStrings(personList):
+    '''Return the table of interned strings of ``personList`` if it has one, so a site's or committee's ids share
+    storage with the people that refer to them, or None.'''
+    return personList.strings if isinstance(personList, RDFPersonList) else None
+
 class _RDFList(object):
-    '''An abstract list of objects described by RDF.'''
-    def __init__(self, url):
+    '''An abstract list of objects described by RDF.  Subclasses set ``typeURI`` and ``predicateURIs`` to say
+    which subjects and predicates they need, ``idAttribute`` to name the attribute of their entities that holds
+    the subject URI, ``kind`` to say what they're counted as in ``metrics``, and implement ``addStatements``,
+    ``clear``, and ``_items``.
+
+    A list is normally parsed when made.  A lazy list instead parses as it's iterated, handing out each entity
+    as soon as it's made, and parses the rest only when something needs all of it: its length, indexing,
+    membership, or a lookup.  If the RDF turns out to need rdflib part way through, as when a subject is
+    described by a second node element, a lazy list carries on with rdflib from the subjects it hasn't handed
+    out yet; those it has stay as they were made.'''
+    typeURI = None
+    predicateURIs = None
+    idAttribute = 'id'
+    kind = None
+    def __init__(self, url, engine=None, cache=None, strings=None, records=None):
         self.url = url
-    def parseRDF(self):
+        self.records = records
+        self.engine = engine if engine else defaultEngine
+        if self.engine not in _engines:
+            raise ValueError(u'Unknown RDF parsing engine "%s"; expected one of %r' % (self.engine, _engines))
+        self.cache = cache
+        self.strings = {} if strings is None else strings
+        self._pending = None
+        self._streamed = frozenset()
+    def intern(self, value):
+        '''Return the one copy of string ``value`` kept in our ``strings`` table, so that the URIs and names
+        repeated across thousands of entities are stored once.'''
+        if value is None: return None
+        value = _compact(value)
+        return self.strings.setdefault(value, value)
+    def parse(self):
+        '''Parse our RDF, calling ``addStatements`` for each subject whose type is our ``typeURI``.  With a
+        ``cache`` (an ``edrn.sync.rdfcache.SourceCache``), unchanged sources aren't fetched or parsed again.'''
+        for subj, preds in self._records():
+            if self.addStatements(subj, preds) is not None:
+                metrics.count('rdf_entities_parsed', kind=self.kind)
+    def _begin(self, lazy):
+        if lazy:
+            self._pending = self._produce()
+        else:
+            self.parse()
+    def _records(self, streaming=False):
+        if self.records is not None:
+            # Already read, as by a ``SourceLoader``; let them go once used
+            records, self.records = self.records, None
+            for record in records:
+                yield record
+            return
+        if self.cache is not None:
+            for record in self.cache.getRecords(self.url, self.cacheKey(), self.readRecords):
+                yield record
+            return
+        if self.engine == 'sax':
+            try:
+                for record in iterRecords(self.url, self.predicateURIs, frozenset([self.typeURI])):
+                    yield record
+                return
+            except UnsupportedRDF:
+                # Carry on with rdflib, which handles all of RDF/XML.  Entities already handed out as they were
+                # read are skipped; otherwise start afresh, since a subject may be described again further on.
+                if streaming:
+                    seen = frozenset(getattr(i, self.idAttribute) for i in self._items()) | self._streamed
+                else:
+                    self.clear()
+                    seen = frozenset()
+        else:
+            seen = frozenset()
+        statements = self.parseRDF()
+        for subj, preds in statements.iteritems():
+            if self.getRDFTypeURI(preds) != self.typeURI or unicode(subj) in seen: continue
+            yield subj, preds
+    def _produce(self):
+        for subj, preds in self._records(streaming=True):
+            entity = self.addStatements(subj, preds)
+            if entity is not None:
+                metrics.count('rdf_entities_parsed', kind=self.kind)
+                yield entity
+    def stream(self):
+        '''Parse our RDF, yielding each entity as it's made but keeping none of them, nor the strings interned
+        for them, so that RDF of any size takes little memory.  Use it on a lazy list that hasn't been iterated;
+        the list itself stays empty.  Only the ids of the entities are remembered, in case the RDF turns out to
+        need rdflib part way through.'''
+        self._pending, self._streamed = None, set()
+        for subj, preds in self._records(streaming=True):
+            entity = self.addStatements(subj, preds)
+            self.clear()
+            self.strings = {}
+            if entity is not None:
+                self._streamed.add(getattr(entity, self.idAttribute))
+                metrics.count('rdf_entities_parsed', kind=self.kind)
+                yield entity
+    def isLazy(self):
+        '''Tell if some of our RDF is yet to be parsed.'''
+        return self._pending is not None
+    def materialize(self):
+        '''Parse whatever of our RDF is yet to be parsed.'''
+        if self._pending is None: return
+        for entity in self._pending:
+            pass
+        self._pending = None
+    def _iterate(self):
+        # Hand out what's already made, then make more; other iterators and ``materialize`` may be making
+        # them too, so always go by what's in ``_items``
+        index = 0
+        while True:
+            items = self._items()
+            if index < len(items):
+                yield items[index]
+                index += 1
+            elif self._pending is None:
+                return
+            else:
+                try:
+                    self._pending.next()
+                except StopIteration:
+                    self._pending = None
+    def cacheKey(self):
+        '''Name the kind of records this list needs, so differently filtered records don't share a cache entry.'''
+        names = [unicode(self.typeURI)] + sorted(unicode(i) for i in self.predicateURIs)
+        return hashlib.sha1(u'\n'.join(names).encode('utf-8')).hexdigest()
+    def readRecords(self, url, path):
+        '''Read the RDF for ``url`` from the local file at ``path`` and return a list of ``(s, {p→[o]})`` for
+        subjects of our type, keeping only our predicates.'''
+        types = frozenset([self.typeURI])
+        if self.engine == 'sax':
+            try:
+                with contextlib.closing(openSource(path)) as stream:
+                    return list(iterRecords(url, self.predicateURIs, types, stream))
+            except UnsupportedRDF:
+                pass
+        with contextlib.closing(openSource(path)) as stream:
+            statements = self.parseRDF(stream, url)
+        records = []
+        for subj, preds in statements.iteritems():
+            if self.getRDFTypeURI(preds) != self.typeURI: continue
+            records.append((subj, dict((p, o) for p, o in preds.iteritems()
+                if p in self.predicateURIs or p == _typeURI)))
+        return records
+    def addStatements(self, subj, preds):
+        '''Add the entity described by subject ``subj`` with predicates ``preds`` of the form {p→[o]}, and
+        return it, or None if the statements don't make one.'''
+        raise NotImplementedError(u'Subclasses must implement ``addStatements``')
+    def clear(self):
+        '''Forget any entities added so far.'''
+        raise NotImplementedError(u'Subclasses must implement ``clear``')
+    def _items(self):
+        raise NotImplementedError(u'Subclasses must implement ``_items``')
+    def parseRDF(self, stream=None, url=None):
         '''Parse our RDF file and return a mapping of statements of the form {s→{p→o}} where s is a subject's
-        URI, p is a predicate URI, and o is a list of objects that may be literals or URI references.'''
-        graph = rdflib.ConjunctiveGraph()
-        graph.parse(self.url)
-        statements = {}
-        for s, p, o in graph:
-            predicates = statements.get(s, {})
-            objects = predicates.get(p, [])
-            objects.append(o)
-            predicates[p] = objects
-            statements[s] = predicates
+        URI, p is a predicate URI, and o is a list of objects that may be literals or URI references.  If
+        ``stream`` (from ``edrn.sync.rdfstream.openSource``) is given, read the RDF from it instead of from our
+        URL; its format is told from ``url`` if given, else our URL, and what it starts with.'''
+        url = url if url else self.url
+        with metrics.timing('parse'):
+            graph = rdflib.ConjunctiveGraph()
+            source = stream if stream is not None else openSource(url)
+            try:
+                graph.parse(source=source, publicID=url, format=rdflibFormats[sourceFormat(url, source)])
+            finally:
+                if stream is None: source.close()
+            statements = {}
+            for s, p, o in graph:
+                predicates = statements.get(s, {})
+                objects = predicates.get(p, [])
+                objects.append(o)
+                predicates[p] = objects
+                statements[s] = predicates
         return statements
     def getRDFTypeURI(self, predicates):
         '''Get the type of the object being represented by the ``predicates``.  Return None if there's no type URI
@@ -74,28 +266,107 @@ class _RDFList(object):
         values = predicates.get(_typeURI, [])
         return values[0] if values else None
     def getSingleValue(self, predicateURI, predicates):
-        '''Get the first value in the ``predicates`` with the given ``predicateURI`` or None if there is no such item.'''
+        '''Get the first value in the ``predicates`` with the given ``predicateURI`` or None if there is no such
+        item.'''
         values = predicates.get(predicateURI, [])
-        return unicode(values[0]) if values else None
+        return _compact(unicode(values[0])) if values else None
+
+class _RecordReader(_RDFList):
+    '''Reads the records some kind of RDF list needs without making any entities.'''
+    def __init__(self, url, listClass, engine=None, cache=None):
+        super(_RecordReader, self).__init__(url, engine, cache)
+        self.typeURI, self.predicateURIs = listClass.typeURI, listClass.predicateURIs
+        self.read = []
+    def addStatements(self, subj, preds):
+        self.read.append((subj, preds))
+    def clear(self):
+        self.read = []
+    def _items(self):
+        return ()
+
+def fetchRecords(url, listClass, engine=None, cache=None):
+    '''Fetch and parse the RDF at ``url``, returning the ``(subject, {predicate→[objects]})`` records that a list
+    of class ``listClass`` would be made from; pass them to its constructor as ``records``.'''
+    reader = _RecordReader(url, listClass, engine, cache)
+    reader.parse()
+    return reader.read
 
 class RDFPersonList(_RDFList):
     '''A list of EDRN people from RDF.'''
-    def __init__(self, url):
-        super(RDFPersonList, self).__init__(url)
+    typeURI = _personTypeURI
+    predicateURIs = frozenset((_userIDURI, _emailURI, _givennameURI, _surnameURI, _siteURI, _phoneURI))
+    idAttribute = 'rdfId'
+    kind = 'person'
+    def __init__(self, url, engine=None, cache=None, lazy=False, records=None):
+        super(RDFPersonList, self).__init__(url, engine, cache, records=records)
         self.persons = []
-        self.parse()
-    def parse(self):
-        statements = self.parseRDF()
-        for subj, preds in statements.iteritems():
-            if self.getRDFTypeURI(preds) != _personTypeURI: continue
-            uid = self.getSingleValue(_userIDURI, preds)
-            if not uid: continue
-            email = self.stripMailTo(self.getSingleValue(_emailURI, preds))
-            givenname, surname = self.getSingleValue(_givennameURI, preds), self.getSingleValue(_surnameURI, preds)
-            siteURI = self.getSingleValue(_siteURI, preds)
-            phone = self.parsePhone(self.getSingleValue(_phoneURI, preds))
-            person = RDFPerson(unicode(subj), siteURI, email, uid, givenname, surname, phone)
-            self.persons.append(person)
+        self._byRdfId, self._byUid, self._extras = {}, {}, {}
+        self._begin(lazy)
+    def addStatements(self, subj, preds):
+        uid = self.getSingleValue(_userIDURI, preds)
+        if not uid: return None
+        email = self.stripMailTo(self.getSingleValue(_emailURI, preds))
+        givenname, surname = self.getSingleValue(_givennameURI, preds), self.getSingleValue(_surnameURI, preds)
+        siteURI = self.intern(self.getSingleValue(_siteURI, preds))
+        phone = self.parsePhone(self.getSingleValue(_phoneURI, preds))
+        person = RDFPerson(self.intern(unicode(subj)), siteURI, email, uid, givenname, surname, phone)
+        self.addPerson(person)
+        return person
+    def clear(self):
+        self.persons = []
+        self._byRdfId, self._byUid, self._extras = {}, {}, {}
+    def _items(self):
+        return self.persons
+    def merge(self, other):
+        '''Add the people of ``other`` whose uids we don't have yet.  The rest are taken to be the same people
+        from another feed, so their RDF ids find the person we already have.'''
+        self.materialize()
+        for person in other:
+            existing = self._byUid.get(person.uid)
+            if existing is None:
+                person.rdfId, person.siteId = self.intern(person.rdfId), self.intern(person.siteId)
+                self.addPerson(person)
+            else:
+                self.addAlias(person.rdfId, existing)
+    def addAlias(self, rdfId, person):
+        '''Have RDF id ``rdfId`` find ``person`` too, unless it already names someone.'''
+        self._byRdfId.setdefault(rdfId, person)
+    def aliases(self):
+        '''Yield ``(rdfId, person)`` for each RDF id that finds a person known by another, as after ``merge``.'''
+        self.materialize()
+        for rdfId, person in self._byRdfId.iteritems():
+            if rdfId != person.rdfId: yield rdfId, person
+    def addPerson(self, person):
+        '''Append ``person`` to this list and index it by RDF id and uid.'''
+        self.persons.append(person)
+        self._index(person)
+    def getPersonByRdfId(self, rdfId):
+        '''Get the person with the given ``rdfId``, or None if there isn't one.'''
+        self.materialize()
+        return self._byRdfId.get(rdfId)
+    def getPersonByUid(self, uid):
+        '''Get the person with the given ``uid``, or None if there isn't one.'''
+        self.materialize()
+        return self._byUid.get(uid)
+    def _indexes(self, person):
+        return ((self._byRdfId, 'rdfId', person.rdfId), (self._byUid, 'uid', person.uid))
+    def _index(self, person):
+        # The first person with an id or uid is the one found by it; count the others, which are few
+        for index, attribute, key in self._indexes(person):
+            if index.setdefault(key, person) is not person:
+                self._extras[attribute, key] = self._extras.get((attribute, key), 0) + 1
+    def _unindex(self, person):
+        for index, attribute, key in self._indexes(person):
+            extras = self._extras.pop((attribute, key), 0)
+            if extras > 1: self._extras[attribute, key] = extras - 1
+            if index.get(key) is not person: continue
+            del index[key]
+            if extras:
+                # Another person with the same id or uid is now the first one
+                for other in self.persons:
+                    if other is not person and getattr(other, attribute) == key:
+                        index[key] = other
+                        break
     def parsePhone(self, phone):
         if phone == None or phone == "":
             return _defaultPhone
@@ -119,22 +390,31 @@ class RDFPersonList(_RDFList):
     def stripMailTo(self, email):
         return None if email is None else email[email.find(":")+1:len(email)]
     def __len__(self):
+        self.materialize()
         return len(self.persons)
     def __add__(self, i):
         self.persons.add(i)
     def __getitem__(self, key):
+        self.materialize()
         return self.persons[key]
     def __setitem__(self, key, value):
+        self.materialize()
+        self._unindex(self.persons[key])
         self.persons[key] = value
+        self._index(value)
     def __delitem__(self, key):
+        self.materialize()
+        self._unindex(self.persons[key])
         del self.persons[key]
     def __iter__(self):
-        return iter(self.persons)
+        return iter(self.persons) if self._pending is None else self._iterate()
     def __contains__(self, item):
+        self.materialize()
         return item in self.persons
 
 class RDFPerson(object):
     '''An EDRN person from RDF.'''
+    __slots__ = ('rdfId', 'siteId', 'email', 'uid', 'firstname', 'lastname', 'phone')
     def __init__(self, rdfId, siteId, email, uid, firstname, lastname, phone):
         self.rdfId = rdfId
         self.siteId = siteId
@@ -143,46 +423,62 @@ class RDFPerson(object):
         self.firstname = firstname
         self.lastname = lastname
         self.phone = phone  
+    def fingerprint(self):
+        '''Make a fingerprint of everything about this person, which changes when any of it does.'''
+        return _fingerprint(self.rdfId, self.siteId, self.email, self.uid, self.firstname, self.lastname, self.phone)
         
 class RDFSiteList(_RDFList):
     '''A list of EDRN sites from RDF.'''
-    def __init__(self, url, personList):
-        super(RDFSiteList, self).__init__(url)
+    typeURI = _siteTypeURI
+    predicateURIs = frozenset((_titleURI, _abbrevNameURI, _programURI, _memberTypeURI, _piURI, _staffURI))
+    kind = 'site'
+    def __init__(self, url, personList, engine=None, cache=None, lazy=False, records=None):
+        super(RDFSiteList, self).__init__(url, engine, cache, _sharedStrings(personList), records)
         self.personList = personList
+        self._lookup = _rdfIdLookup(personList)
         self.sites = []
-        self.parse()
-    def parse(self):
-        statements = self.parseRDF()
-        for subj, preds in statements.iteritems():
-            if self.getRDFTypeURI(preds) != _siteTypeURI: continue
-            title = self.getSingleValue(_titleURI, preds)
-            abbrevName = self.getSingleValue(_abbrevNameURI, preds)
-            program = self.getSingleValue(_programURI, preds)
-            memberType = self.getSingleValue(_memberTypeURI, preds)
-            pi = getPersonById(self.getSingleValue(_piURI, preds), self.personList)
+        self._begin(lazy)
+    def addStatements(self, subj, preds):
+        title = self.getSingleValue(_titleURI, preds)
+        abbrevName = self.getSingleValue(_abbrevNameURI, preds)
+        program = self.intern(self.getSingleValue(_programURI, preds))
+        memberType = self.intern(self.getSingleValue(_memberTypeURI, preds))
+        with metrics.timing('resolve'):
+            pi = self._lookup(self.getSingleValue(_piURI, preds))
             staff = []
             for staffURI in preds.get(_staffURI, []):
-                person = getPersonById(unicode(staffURI), self.personList)
+                person = self._lookup(unicode(staffURI))
                 if person: staff.append(person)
-            site = RDFSite(unicode(subj), abbrevName, staff, title, pi, program, memberType)
-            self.sites.append(site)
+        site = RDFSite(self.intern(unicode(subj)), abbrevName, tuple(staff), title, pi, program, memberType)
+        self.sites.append(site)
+        return site
+    def clear(self):
+        self.sites = []
+    def _items(self):
+        return self.sites
     def __len__(self):
+        self.materialize()
         return len(self.sites)
     def __add__(self, i):
         self.sites.add(i)
     def __getitem__(self, key):
+        self.materialize()
         return self.sites[key]
     def __setitem__(self, key, value):
+        self.materialize()
         self.sites[key] = value
     def __delitem__(self, key):
+        self.materialize()
         del self.sites[key]
     def __iter__(self):
-        return iter(self.sites)
+        return iter(self.sites) if self._pending is None else self._iterate()
     def __contains__(self, item):
+        self.materialize()
         return item in self.sites
 
 class RDFSite(object):
-    '''An EDRN site.'''
+    '''An EDRN site.  Its ``staffList`` is a tuple of people.'''
+    __slots__ = ('id', 'abbrevName', 'staffList', 'title', 'pi', 'program', 'memberType')
     def __init__(self, id, abbrevName, staffList, title, pi, program, memberType):
         self.id = id
         self.abbrevName = abbrevName
@@ -191,46 +487,71 @@ class RDFSite(object):
         self.pi = pi
         self.program = program
         self.memberType = memberType
+    def fingerprint(self):
+        '''Make a fingerprint of this site, which changes when it does or when its PI's or staff's uids do, or
+        its PI's last name, which goes into its group's name.'''
+        pi = (self.pi.uid, self.pi.lastname) if self.pi is not None else (None, None)
+        return _fingerprint(self.id, self.abbrevName, self.title, self.program, self.memberType, *(pi +
+            tuple(i.uid for i in self.staffList)))
 
 class RDFCollaborativeGroupList(_RDFList):
     '''A list of collaborative groups from RDF.'''
-    def __init__(self, filePath, personList):
-        super(RDFCollaborativeGroupList, self).__init__(filePath)
+    typeURI = _committeeTypeURI
+    predicateURIs = frozenset((_titleURI, _groupTypeURI) + _allMemberURIs)
+    kind = 'committee'
+    def __init__(self, filePath, personList, engine=None, cache=None, lazy=False, records=None):
+        super(RDFCollaborativeGroupList, self).__init__(filePath, engine, cache, _sharedStrings(personList),
+            records)
         self.personList = personList
+        self._lookup = _rdfIdLookup(personList)
         self.groups = []
-        self.parse()
-    def parse(self):
-        statements = self.parseRDF()
-        for subj, preds in statements.iteritems():
-            if self.getRDFTypeURI(preds) != _committeeTypeURI: continue
-            title = self.getSingleValue(_titleURI, preds)
-            groupType = self.getSingleValue(_groupTypeURI, preds)
-            staff = set()
+        self._begin(lazy)
+    def addStatements(self, subj, preds):
+        title = self.getSingleValue(_titleURI, preds)
+        groupType = self.intern(self.getSingleValue(_groupTypeURI, preds))
+        staff, seen = [], set()
+        with metrics.timing('resolve'):
             for predicateURI in _allMemberURIs:
-                for staffURI in preds.get(predicateURI, preds):
-                    person = getPersonById(unicode(staffURI), self.personList)
-                    if person: staff.add(person)
-            cg = RDFCollaborativeGroup(unicode(subj), title, staff, groupType)
-            self.groups.append(cg)
+                for staffURI in preds.get(predicateURI, []):
+                    person = self._lookup(unicode(staffURI))
+                    if person and person not in seen:
+                        seen.add(person)
+                        staff.append(person)
+        cg = RDFCollaborativeGroup(self.intern(unicode(subj)), title, tuple(staff), groupType)
+        self.groups.append(cg)
+        return cg
+    def clear(self):
+        self.groups = []
+    def _items(self):
+        return self.groups
     def __len__(self):
+        self.materialize()
         return len(self.groups)
     def __add__(self, i):
         self.groups.add(i)
     def __getitem__(self, key):
+        self.materialize()
         return self.groups[key]
     def __setitem__(self, key, value):
+        self.materialize()
         self.groups[key] = value
     def __delitem__(self, key):
+        self.materialize()
         del self.groups[key]
     def __iter__(self):
-        return iter(self.groups)
+        return iter(self.groups) if self._pending is None else self._iterate()
     def __contains__(self, item):
+        self.materialize()
         return item in self.groups
 
 class RDFCollaborativeGroup(object):
-    '''An EDRN collaborative group.'''
+    '''An EDRN collaborative group.  Its ``staffList`` is a tuple of distinct people, chairs and members alike.'''
+    __slots__ = ('id', 'title', 'staffList', 'groupType')
     def __init__(self, id, title, staffList, groupType):
         self.id = id
         self.title = title
         self.staffList = staffList
         self.groupType = groupType
+    def fingerprint(self):
+        '''Make a fingerprint of this group, which changes when it does or when its members' uids do.'''
+        return _fingerprint(self.id, self.title, self.groupType, *[i.uid for i in self.staffList])
@@ -0,0 +1,169 @@
+# encoding: utf-8
+# Copyright 2026 California Institute of Technology. ALL RIGHTS
+# RESERVED. U.S. Government Sponsorship acknowledged.
+
+'''On-disk cache of parsed DMCC RDF.
+
+Each entry holds the parsed ``(subject, {predicate→[objects]})`` records for one source URL and one kind of
+RDF list, along with what's needed to tell whether the source has changed: the ETag and Last-Modified headers
+for remote URLs, or the modification time and size for local files.  An unchanged source is neither
+transferred nor parsed again.
+'''
+
+from rdflib.term import URIRef, Literal
+from instrumentation import metrics
+from utils import writeAtomically
+import email.utils, hashlib, json, marshal, os, os.path, tempfile, time, urllib, urllib2, urlparse, zlib
+
+# Default eviction policy: entries unused for a week go, and the whole cache stays under 256 MiB
+_defaultMaxAge = 7 * 24 * 60 * 60
+_defaultMaxBytes = 256 * 1024 * 1024
+_chunkSize = 64 * 1024
+
+# Kinds of objects in serialized records
+_uriKind, _literalKind = 0, 1
+
+
+def serializeRecords(records):
+    '''Turn ``records`` of the form ``[(s, {p→[o]})]`` into a compact byte string.'''
+    compact = []
+    for subj, preds in records:
+        predicates = []
+        for pred, objects in preds.iteritems():
+            values = []
+            for obj in objects:
+                if isinstance(obj, Literal):
+                    datatype = unicode(obj.datatype) if obj.datatype else None
+                    values.append((_literalKind, unicode(obj), obj.language, datatype))
+                else:
+                    values.append((_uriKind, unicode(obj)))
+            predicates.append((unicode(pred), tuple(values)))
+        compact.append((unicode(subj), tuple(predicates)))
+    return zlib.compress(marshal.dumps(tuple(compact)))
+
+
+def deserializeRecords(data):
+    '''Turn a byte string made by ``serializeRecords`` back into records.'''
+    records = []
+    for subj, predicates in marshal.loads(zlib.decompress(data)):
+        preds = {}
+        for pred, values in predicates:
+            objects = []
+            for value in values:
+                if value[0] == _literalKind:
+                    objects.append(Literal(value[1], lang=value[2], datatype=URIRef(value[3]) if value[3] else None))
+                else:
+                    objects.append(URIRef(value[1]))
+            preds[URIRef(pred)] = objects
+        records.append((URIRef(subj), preds))
+    return records
+
+
+def _localPath(url):
+    '''If ``url`` names a local file (a ``file:`` URL or a plain path), return its path; otherwise None.'''
+    parts = urlparse.urlparse(url)
+    if parts.scheme == 'file':
+        return urllib.url2pathname(parts.path)
+    if len(parts.scheme) <= 1:
+        return url
+    return None
+
+
+class SourceCache(object):
+    '''A directory of parsed RDF records keyed by source URL and record kind.'''
+    def __init__(self, directory, maxAge=_defaultMaxAge, maxBytes=_defaultMaxBytes):
+        self.directory = directory
+        self.maxAge, self.maxBytes = maxAge, maxBytes
+        self.hits = self.misses = 0
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+    def _entryPath(self, url, key):
+        return os.path.join(self.directory, hashlib.sha1(url.encode('utf-8') + '\0' + key).hexdigest())
+    def _readMeta(self, path):
+        try:
+            with open(path + '.meta', 'rb') as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            return None
+    def getRecords(self, url, key, readRecords):
+        '''Get the records for ``url`` of the kind named by ``key``.  If the cached copy is missing or the
+        source has changed, call ``readRecords(url, path)`` where ``path`` is a local copy of the source, and
+        cache what it returns.'''
+        path = self._entryPath(url, key)
+        meta = self._readMeta(path)
+        if meta is not None and not os.path.exists(path + '.records'):
+            meta = None
+        localPath = _localPath(url)
+        if localPath is not None:
+            records, meta = self._getLocal(url, localPath, path, meta, readRecords)
+        else:
+            records, meta = self._getRemote(url, path, meta, readRecords)
+        if records is None:
+            self.hits += 1
+            metrics.count('rdf_cache_hits')
+            with metrics.timing('parse'), open(path + '.records', 'rb') as f:
+                records = deserializeRecords(f.read())
+            # The records file's modification time is when it was last used, for eviction
+            os.utime(path + '.records', None)
+        else:
+            self.misses += 1
+            metrics.count('rdf_cache_misses')
+            writeAtomically(path + '.records', serializeRecords(records))
+            writeAtomically(path + '.meta', json.dumps(meta))
+            self.prune()
+        return records
+    def _getLocal(self, url, localPath, path, meta, readRecords):
+        st = os.stat(localPath)
+        if meta is not None and meta.get('mtime') == st.st_mtime and meta.get('size') == st.st_size:
+            return None, meta
+        return readRecords(url, localPath), dict(url=url, mtime=st.st_mtime, size=st.st_size)
+    def _getRemote(self, url, path, meta, readRecords):
+        request = urllib2.Request(url)
+        # Compressed sources are decompressed as they're parsed, so let the server send gzip
+        request.add_header('Accept-Encoding', 'gzip')
+        if meta is not None:
+            if meta.get('etag'): request.add_header('If-None-Match', meta['etag'])
+            if meta.get('lastModified'): request.add_header('If-Modified-Since', meta['lastModified'])
+        try:
+            with metrics.timing('fetch'):
+                response = urllib2.urlopen(request)
+        except urllib2.HTTPError, ex:
+            if ex.code == 304 and meta is not None:
+                return None, meta
+            raise
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix='.tmp')
+        try:
+            with metrics.timing('fetch'), os.fdopen(fd, 'wb') as f:
+                while True:
+                    chunk = response.read(_chunkSize)
+                    if not chunk: break
+                    f.write(chunk)
+            response.close()
+            records = readRecords(url, tmp)
+        finally:
+            os.remove(tmp)
+        headers = response.info()
+        return records, dict(url=url, etag=headers.getheader('ETag'), lastModified=headers.getheader('Last-Modified'),
+            fetched=email.utils.formatdate(usegmt=True))
+    def prune(self):
+        '''Evict entries not used within ``maxAge`` seconds, then the least recently used ones until the cache
+        fits in ``maxBytes``.'''
+        entries, total, now = [], 0, time.time()
+        for name in os.listdir(self.directory):
+            if not name.endswith('.records'): continue
+            path = os.path.join(self.directory, name[:-len('.records')])
+            try:
+                st = os.stat(path + '.records')
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+            total += st.st_size
+        entries.sort()
+        for lastUsed, size, path in entries:
+            if now - lastUsed <= self.maxAge and total <= self.maxBytes: break
+            for suffix in ('.records', '.meta'):
+                try:
+                    os.remove(path + suffix)
+                except OSError:
+                    pass
+            total -= size
@@ -0,0 +1,83 @@
+# encoding: utf-8
+# Copyright 2026 California Institute of Technology. ALL RIGHTS
+# RESERVED. U.S. Government Sponsorship acknowledged.
+
+'''Fetching and parsing many DMCC RDF sources at once.
+
+A ``SourceLoader`` reads all the sources it's given concurrently in a pool of worker threads (or processes),
+reading each distinct source only once however many times it's named, then makes the people, sites, and
+committees from what was read.  People from several user feeds are merged by uid.
+'''
+
+from rdf import RDFPersonList, RDFSiteList, RDFCollaborativeGroupList, fetchRecords
+import collections, multiprocessing, multiprocessing.pool
+
+# Default number of sources to fetch and parse at once
+defaultWorkers = 4
+
+
+def _fetch(args):
+    return fetchRecords(*args)
+
+
+def _distinct(items):
+    return list(collections.OrderedDict.fromkeys(items))
+
+
+class SourceLoader(object):
+    '''Load RDF sources ``workers`` at a time, with the given ``cache`` (an ``edrn.sync.rdfcache.SourceCache``)
+    and parsing ``engine``.  Workers are threads, which suits sources that take long to fetch; with
+    ``processes`` they're processes, which suits large local files that take long to parse.'''
+    def __init__(self, cache=None, engine=None, workers=defaultWorkers, processes=False):
+        if workers < 1: raise ValueError(u'Workers must be at least 1, not %d' % workers)
+        self.cache, self.engine, self.workers, self.processes = cache, engine, workers, processes
+    def fetch(self, sources):
+        '''Fetch and parse ``sources``, a sequence of ``(url, listClass)``, all at once.  Return a mapping of
+        each distinct ``(url, listClass)`` to its records.'''
+        sources = _distinct(sources)
+        jobs = [(url, listClass, self.engine, self.cache) for url, listClass in sources]
+        if len(jobs) <= 1 or self.workers == 1:
+            return dict(zip(sources, map(_fetch, jobs)))
+        poolClass = multiprocessing.Pool if self.processes else multiprocessing.pool.ThreadPool
+        pool = poolClass(min(self.workers, len(jobs)))
+        try:
+            return dict(zip(sources, pool.map(_fetch, jobs)))
+        finally:
+            pool.terminate()
+            pool.join()
+    def load(self, userURLs, siteURLs=(), committeeURLs=()):
+        '''Load people from ``userURLs``, sites from ``siteURLs``, and committees from ``committeeURLs``, all
+        fetched and parsed at once.  People with the same uid in more than one user feed are taken from the
+        first.  Return ``(persons, sites, committees)``, where ``sites`` and ``committees`` are None if no URLs
+        for them are given.'''
+        userURLs, siteURLs, committeeURLs = _distinct(userURLs), _distinct(siteURLs), _distinct(committeeURLs)
+        if not userURLs: raise ValueError(u'At least one user RDF source is needed')
+        return self.build(self.fetch(self.sources(userURLs, siteURLs, committeeURLs)), userURLs, siteURLs,
+            committeeURLs)
+    def sources(self, userURLs, siteURLs=(), committeeURLs=()):
+        '''Name the ``(url, listClass)`` sources to ``fetch`` for people, sites, and committees at the given URLs.'''
+        return ([(url, RDFPersonList) for url in _distinct(userURLs)]
+            + [(url, RDFSiteList) for url in _distinct(siteURLs)]
+            + [(url, RDFCollaborativeGroupList) for url in _distinct(committeeURLs)])
+    def build(self, records, userURLs, siteURLs=(), committeeURLs=()):
+        '''Make people, sites, and committees from ``records`` as returned by ``fetch``, just as ``load`` does.'''
+        userURLs, siteURLs, committeeURLs = _distinct(userURLs), _distinct(siteURLs), _distinct(committeeURLs)
+        persons = None
+        for url in userURLs:
+            people = RDFPersonList(url, self.engine, self.cache, records=records[(url, RDFPersonList)])
+            if persons is None:
+                persons = people
+            else:
+                persons.merge(people)
+        sites = self._combine(RDFSiteList, siteURLs, persons, records)
+        committees = self._combine(RDFCollaborativeGroupList, committeeURLs, persons, records)
+        return persons, sites, committees
+    def loadPersons(self, userURLs):
+        '''Load and merge people from ``userURLs``, all fetched and parsed at once.'''
+        return self.load(userURLs)[0]
+    def _combine(self, listClass, urls, persons, records):
+        if not urls: return None
+        combined = []
+        for url in urls:
+            combined.extend(records[(url, listClass)])
+        return listClass(urls[0], persons, self.engine, self.cache, records=combined)
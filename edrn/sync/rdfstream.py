@@ -0,0 +1,337 @@
+# encoding: utf-8
+# Copyright 2026 California Institute of Technology. ALL RIGHTS
+# RESERVED. U.S. Government Sponsorship acknowledged.
+
+'''Streaming RDF/XML parsing for the flat documents DMCC publishes.
+
+DMCC's RDF is a single ``rdf:RDF`` element holding one node element per subject, each with simple property
+elements whose objects are either ``rdf:resource`` references or literal text.  That shape can be read with a
+SAX parser one subject at a time, without building an rdflib graph of the whole feed.  Anything outside that
+shape raises ``UnsupportedRDF`` so callers can fall back to rdflib, including a subject described by a second
+node element, whose statements rdflib would merge with those already handed out.
+
+N-Triples, one statement per line, is read a line at a time with a regular expression instead.  Turtle has no
+fast path and is left to rdflib.  Any source may be gzip or bzip2 compressed; ``openSource`` notices and
+decompresses it as it's read, and asks web servers for gzip so large feeds download faster.
+'''
+
+from rdflib.term import URIRef, Literal
+from instrumentation import metrics
+from xml.sax.handler import ContentHandler, feature_namespaces, feature_external_ges
+import bz2, collections, re, time, urllib2, urlparse, xml.sax, zlib
+
+_rdfNS = u'http://www.w3.org/1999/02/22-rdf-syntax-ns#'
+_xmlNS = u'http://www.w3.org/XML/1998/namespace'
+_typeURI = URIRef(_rdfNS + u'type')
+_chunkSize = 64 * 1024
+
+# Attributes that change the meaning of a node or property element in ways we don't handle
+_unsupportedAttributes = frozenset([(_rdfNS, u'nodeID'), (_rdfNS, u'parseType'), (_rdfNS, u'bagID')])
+
+
+class UnsupportedRDF(Exception):
+    '''The document uses RDF/XML features beyond the flat shape the streaming parser understands.'''
+    def __init__(self, msg):
+        super(UnsupportedRDF, self).__init__(msg)
+        self.msg = msg
+
+
+# Formats, by file extension and by what rdflib calls them
+_extensions = {'.rdf': 'xml', '.xml': 'xml', '.owl': 'xml', '.nt': 'nt', '.ttl': 'turtle', '.n3': 'turtle'}
+_compressedExtensions = ('.gz', '.bz2')
+rdflibFormats = {'xml': 'xml', 'nt': 'nt', 'turtle': 'turtle'}
+
+# How much of a source to look at when guessing its format
+_sniffSize = 4096
+
+# N-Triples terms and statements; see https://www.w3.org/TR/n-triples/
+_iri = r'<([^>]*)>'
+_literal = r'"((?:[^"\\]|\\.)*)"(?:@([A-Za-z]+(?:-[A-Za-z0-9]+)*)|\^\^<([^>]*)>)?'
+_tripleMatcher = re.compile(r'^\s*' + _iri + r'\s*' + _iri + r'\s*(?:' + _iri + '|' + _literal + r')\s*\.\s*(?:#.*)?$')
+_ignorableMatcher = re.compile(r'^\s*(?:#.*)?$')
+_iriStartMatcher = re.compile(r'^<[^>\s]*>\s')
+_escapeMatcher = re.compile(r'\\(?:u([0-9A-Fa-f]{4})|U([0-9A-Fa-f]{8})|(.))')
+_escapes = {'t': u'\t', 'b': u'\b', 'n': u'\n', 'r': u'\r', 'f': u'\f', '"': u'"', "'": u"'", '\\': u'\\'}
+
+
+class _Source(object):
+    '''A readable source that decompresses what it reads if it starts with gzip or bzip2 magic, and can
+    ``peek`` at what's coming without consuming it.'''
+    def __init__(self, raw):
+        self.raw = raw
+        head = raw.read(3)
+        if head.startswith('\x1f\x8b'):
+            # 16 + MAX_WBITS has zlib expect a gzip header
+            self._newDecompressor = lambda: zlib.decompressobj(16 + zlib.MAX_WBITS)
+        elif head.startswith('BZh'):
+            self._newDecompressor = bz2.BZ2Decompressor
+        else:
+            self._newDecompressor = None
+        self.compressed = self._newDecompressor is not None
+        self._decompressor = self._newDecompressor() if self.compressed else None
+        self._buffer, self._eof = self._decompress(head), False
+    def _decompress(self, data):
+        if not self.compressed or not data: return data
+        out = []
+        while data:
+            out.append(self._decompressor.decompress(data))
+            # Concatenated gzip members or bzip2 streams each need a fresh decompressor
+            data = self._decompressor.unused_data
+            if data: self._decompressor = self._newDecompressor()
+        return ''.join(out)
+    def _fill(self, size):
+        while not self._eof and (size < 0 or len(self._buffer) < size):
+            chunk = self.raw.read(_chunkSize)
+            if not chunk:
+                self._eof = True
+            else:
+                self._buffer += self._decompress(chunk)
+    def peek(self, size):
+        self._fill(size)
+        return self._buffer[:size]
+    def read(self, size=-1):
+        self._fill(size)
+        if size < 0: size = len(self._buffer)
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+    def readline(self, size=-1):
+        while '\n' not in self._buffer and not self._eof:
+            self._fill(len(self._buffer) + _chunkSize)
+        end = self._buffer.find('\n') + 1 or len(self._buffer)
+        return self.read(end if size < 0 else min(size, end))
+    def close(self):
+        self.raw.close()
+
+
+def openSource(url):
+    '''Open ``url`` for reading, which may be a URL or a plain file path.  Gzip and bzip2 sources are
+    decompressed as they're read.'''
+    scheme = urlparse.urlparse(url).scheme
+    if len(scheme) > 1:
+        request = urllib2.Request(url)
+        request.add_header('Accept-Encoding', 'gzip')
+        return _Source(urllib2.urlopen(request))
+    return _Source(open(url, 'rb'))
+
+
+def sourceFormat(url, source):
+    '''Tell the format of the RDF in ``source`` (opened with ``openSource``) from ``url``: "xml" for RDF/XML,
+    "nt" for N-Triples, or "turtle".  The extension of ``url``, less any .gz or .bz2, decides it if it's a
+    known one; otherwise the start of ``source`` does.'''
+    path = urlparse.urlparse(url).path.lower() if len(urlparse.urlparse(url).scheme) > 1 else url.lower()
+    for extension in _compressedExtensions:
+        if path.endswith(extension): path = path[:-len(extension)]
+    for extension, name in _extensions.iteritems():
+        if path.endswith(extension): return name
+    lines = source.peek(_sniffSize).lstrip('\xef\xbb\xbf').splitlines()
+    statements = [line.lstrip() for line in lines if not _ignorableMatcher.match(line)]
+    if not statements or statements[0].startswith(('<?', '<!')):
+        return 'xml'
+    if _tripleMatcher.match(statements[0]):
+        return 'nt'
+    if _iriStartMatcher.match(statements[0]):
+        return 'turtle'
+    return 'xml' if statements[0].startswith('<') else 'turtle'
+
+
+def _unescape(value):
+    if '\\' not in value: return value
+    def replace(match):
+        short, long, char = match.groups()
+        if char is not None: return _escapes.get(char, char)
+        return unichr(int(short or long, 16))
+    return _escapeMatcher.sub(replace, value)
+
+
+class _SubjectHandler(ContentHandler):
+    '''SAX handler that collects one ``(subject, {predicate→[objects]})`` record per node element.  Only the
+    subjects seen so far are remembered, to notice one described twice.'''
+    def __init__(self, base, predicates, types):
+        ContentHandler.__init__(self)
+        self.bases, self.langs = [base], [None]
+        self.predicates, self.types = predicates, types
+        self.records, self.seen = collections.deque(), set()
+        self.depth = 0
+        self.subject = self.statements = self.predicate = None
+        self.resource, self.text, self.datatype = None, [], None
+    def _resolve(self, uri):
+        return URIRef(urlparse.urljoin(self.bases[-1], uri) if self.bases[-1] else uri)
+    def _uri(self, name):
+        ns, local = name
+        if ns is None: raise UnsupportedRDF(u'Element "%s" has no namespace' % local)
+        return ns + local
+    def _add(self, predicate, obj):
+        if self.predicates is not None and predicate not in self.predicates and predicate != _typeURI: return
+        self.statements.setdefault(predicate, []).append(obj)
+    def startElementNS(self, name, qname, attrs):
+        self.depth += 1
+        base = attrs.get((_xmlNS, u'base'))
+        self.bases.append(urlparse.urljoin(self.bases[-1], base) if base else self.bases[-1])
+        # xml:lang is inherited from enclosing elements, and an empty one takes it away
+        self.langs.append(attrs.get((_xmlNS, u'lang'), self.langs[-1]) or None)
+        for key in attrs.keys():
+            if key in _unsupportedAttributes: raise UnsupportedRDF(u'Unsupported attribute %s' % (key[1],))
+        if self.depth == 1:
+            if name != (_rdfNS, u'RDF'): raise UnsupportedRDF(u'Root element is not rdf:RDF')
+        elif self.depth == 2:
+            self._startNode(name, attrs)
+        elif self.depth == 3:
+            self._startProperty(name, attrs)
+        else:
+            raise UnsupportedRDF(u'Nested node elements are not supported')
+    def _startNode(self, name, attrs):
+        about, rdfID = attrs.get((_rdfNS, u'about')), attrs.get((_rdfNS, u'ID'))
+        if about is not None:
+            self.subject = self._resolve(about)
+        elif rdfID is not None:
+            self.subject = self._resolve(u'#' + rdfID)
+        else:
+            raise UnsupportedRDF(u'Blank node subjects are not supported')
+        if self.subject in self.seen:
+            raise UnsupportedRDF(u'Subject %s is described by more than one node element' % self.subject)
+        self.seen.add(self.subject)
+        self.statements = {}
+        if name != (_rdfNS, u'Description'):
+            self._add(_typeURI, URIRef(self._uri(name)))
+        for key, value in attrs.items():
+            ns, local = key
+            if ns in (_rdfNS, _xmlNS): continue
+            self._add(URIRef(self._uri(key)), Literal(value, lang=self.langs[-1]))
+    def _startProperty(self, name, attrs):
+        if name == (_rdfNS, u'li'): raise UnsupportedRDF(u'rdf:li is not supported')
+        self.predicate = URIRef(self._uri(name))
+        resource = attrs.get((_rdfNS, u'resource'))
+        self.resource = self._resolve(resource) if resource is not None else None
+        datatype = attrs.get((_rdfNS, u'datatype'))
+        self.datatype = URIRef(datatype) if datatype else None
+        self.text = []
+        for ns, local in attrs.keys():
+            if ns in (_rdfNS, _xmlNS) and local in (u'resource', u'datatype', u'lang', u'base', u'ID'): continue
+            raise UnsupportedRDF(u'Property attributes on property elements are not supported')
+    def characters(self, content):
+        if self.depth == 3: self.text.append(content)
+    def endElementNS(self, name, qname):
+        if self.depth == 3:
+            if self.resource is not None:
+                self._add(self.predicate, self.resource)
+            else:
+                # A datatype overrides any language
+                lang = None if self.datatype else self.langs[-1]
+                self._add(self.predicate, Literal(u''.join(self.text), lang=lang, datatype=self.datatype))
+            self.predicate, self.resource, self.text = None, None, []
+        elif self.depth == 2:
+            if self.types is None or not self.types.isdisjoint(self.statements.get(_typeURI, [])):
+                self.records.append((self.subject, self.statements))
+            self.subject = self.statements = None
+        self.bases.pop()
+        self.langs.pop()
+        self.depth -= 1
+
+
+def iterSubjects(url, predicates=None, types=None, stream=None):
+    '''Stream the RDF/XML document at ``url``, yielding ``(subject, {predicate→[objects]})`` for each subject as
+    soon as its node element ends.
+
+    Only predicates in ``predicates`` (plus ``rdf:type``) are kept, and if ``types`` is given, only subjects
+    with at least one type among them are yielded; pass None for either to keep everything.  Objects are rdflib
+    ``URIRef`` and ``Literal`` terms, just as they would be from an rdflib graph.  Raises ``UnsupportedRDF``
+    if the document isn't in the flat shape this parser handles, as when a subject has a second node element.
+    If ``stream`` is given, the document is read from it instead of from ``url``, which is then only used to
+    resolve relative URIs; the caller closes it.
+    '''
+    handler = _SubjectHandler(url if len(urlparse.urlparse(url).scheme) > 1 else None, predicates, types)
+    parser = xml.sax.make_parser()
+    parser.setFeature(feature_namespaces, True)
+    parser.setFeature(feature_external_ges, False)
+    parser.setContentHandler(handler)
+    # Time reading and parsing separately, leaving out whatever the caller does with each record
+    start = time.time()
+    source = stream if stream is not None else openSource(url)
+    try:
+        while True:
+            chunk = source.read(_chunkSize)
+            parsing = time.time()
+            metrics.addTime('fetch', parsing - start)
+            if not chunk: break
+            parser.feed(chunk)
+            metrics.addTime('parse', time.time() - parsing)
+            while handler.records:
+                yield handler.records.popleft()
+            start = time.time()
+        parsing = time.time()
+        parser.close()
+        metrics.addTime('parse', time.time() - parsing)
+        while handler.records:
+            yield handler.records.popleft()
+    finally:
+        if stream is None: source.close()
+
+
+def iterTriples(url, predicates=None, types=None, stream=None):
+    '''Read the N-Triples document at ``url`` a line at a time, yielding ``(subject, {predicate→[objects]})``
+    for each subject, filtered by ``predicates`` and ``types`` just as ``iterSubjects`` does.  Statements about a
+    subject may be anywhere in the document, so only the kept predicates of each subject are held until the end,
+    when the records are yielded in the order their subjects first appeared.  Raises ``UnsupportedRDF`` for
+    blank nodes or anything else a line can't be matched with; if ``stream`` is given, it's read instead.'''
+    subjects, kept = collections.OrderedDict(), {}
+    lastSubject = statements = None
+    start = time.time()
+    source = stream if stream is not None else openSource(url)
+    try:
+        rest = ''
+        while True:
+            chunk = source.read(_chunkSize)
+            parsing = time.time()
+            metrics.addTime('fetch', parsing - start)
+            lines = (rest + chunk).split('\n')
+            rest = lines.pop() if chunk else ''
+            for line in lines:
+                match = _tripleMatcher.match(line)
+                if match is None:
+                    if _ignorableMatcher.match(line): continue
+                    raise UnsupportedRDF(u'Not a simple N-Triples statement: %s' % line.decode('utf-8', 'replace'))
+                subject, predicate, resource, text, lang, datatype = match.groups()
+                # The same few predicates come up on every line, so decide on each just once
+                if predicate not in kept:
+                    term = URIRef(_unescape(predicate.decode('utf-8')))
+                    kept[predicate] = term if predicates is None or term in predicates or term == _typeURI else None
+                predicate = kept[predicate]
+                if predicate is None: continue
+                if resource is not None:
+                    obj = URIRef(_unescape(resource.decode('utf-8')))
+                else:
+                    obj = Literal(_unescape(text.decode('utf-8')), lang=lang,
+                        datatype=URIRef(_unescape(datatype.decode('utf-8'))) if datatype else None)
+                # Statements about a subject are usually together, so its record is usually the last one used
+                if subject != lastSubject:
+                    lastSubject = subject
+                    statements = subjects.setdefault(URIRef(_unescape(subject.decode('utf-8'))), {})
+                statements.setdefault(predicate, []).append(obj)
+            metrics.addTime('parse', time.time() - parsing)
+            if not chunk: break
+            start = time.time()
+    finally:
+        if stream is None: source.close()
+    while subjects:
+        subject, statements = subjects.popitem(last=False)
+        if types is None or not types.isdisjoint(statements.get(_typeURI, [])):
+            yield subject, statements
+
+
+def iterRecords(url, predicates=None, types=None, stream=None):
+    '''Yield the ``(subject, {predicate→[objects]})`` records of the RDF at ``url`` (or in ``stream``, which must
+    come from ``openSource``), filtered as by ``iterSubjects``, using the fast parser for its format.  Raises
+    ``UnsupportedRDF`` if there isn't one, as for Turtle, or the document is beyond it.'''
+    source = stream if stream is not None else openSource(url)
+    try:
+        format = sourceFormat(url, source)
+        if format == 'xml':
+            records = iterSubjects(url, predicates, types, source)
+        elif format == 'nt':
+            records = iterTriples(url, predicates, types, source)
+        else:
+            raise UnsupportedRDF(u'There is no fast parser for %s' % format)
+        for record in records:
+            yield record
+    finally:
+        if stream is None: source.close()
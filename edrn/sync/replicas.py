@@ -0,0 +1,60 @@
+# encoding: utf-8
+# Copyright 2026 California Institute of Technology. ALL RIGHTS
+# RESERVED. U.S. Government Sponsorship acknowledged.
+
+u'''Writing the same changes to several LDAP servers at once.
+
+EDRN keeps directory servers that aren't replicated to each other: the primary and test or staging instances
+that mirror its users.  Rather than running ``dmccsync`` or ``dmccgroupsync`` once per server, reading and
+parsing the RDF each time, they can be given several servers.  The RDF is read once, and ``fanOut`` then
+brings each server in line in its own thread, so a run takes as long as the slowest server rather than all of
+them together.  Each server has its own connections, snapshot, and ``edrn.sync.ldapwriter.Throttle``, so a
+struggling server slows only itself; its counters are labeled with its URL, its progress is shown on lines of
+its own, and if its part of the run fails the others carry on.
+'''
+
+from instrumentation import metrics
+from ldapwriter import throttle
+import sys, threading, traceback
+
+
+def uniqueServers(ldapUrls):
+    u'''Give ``ldapUrls`` in order with repeats left out.'''
+    seen, servers = set(), []
+    for ldapUrl in ldapUrls:
+        if ldapUrl not in seen:
+            seen.add(ldapUrl)
+            servers.append(ldapUrl)
+    return servers
+
+
+def fanOut(ldapUrls, work, out=None):
+    u'''Call ``work(ldapUrl, throttle)`` for each of ``ldapUrls`` at once, each in a thread of its own with a
+    ``Throttle`` configured like the process-wide one, and wait for them all.  Failures are reported to ``out``
+    (standard error by default) as they happen, along with each server's write summary, and returned as a
+    mapping of URL to exception for the servers whose work failed.  With just one server, ``work`` runs here
+    with the process-wide throttle and any exception is raised as usual.'''
+    ldapUrls = uniqueServers(ldapUrls)
+    if len(ldapUrls) == 1:
+        work(ldapUrls[0], throttle)
+        return {}
+    out = out if out is not None else sys.stderr
+    failures, lock = {}, threading.Lock()
+    def serve(ldapUrl, own):
+        try:
+            with metrics.scoped(server=ldapUrl):
+                work(ldapUrl, own)
+        except Exception, ex:
+            metrics.count('server_failures', server=ldapUrl)
+            with lock:
+                failures[ldapUrl] = ex
+                print >>out, u'Syncing [%s] failed: %s' % (ldapUrl, unicode(ex) or repr(ex))
+                traceback.print_exc(file=out)
+        finally:
+            if own.latencies:
+                with lock:
+                    print >>out, u'[%s] %s' % (ldapUrl, own.summary())
+    threads = [threading.Thread(target=serve, args=(ldapUrl, throttle.copy()), name=ldapUrl) for ldapUrl in ldapUrls]
+    for thread in threads: thread.start()
+    for thread in threads: thread.join()
+    return failures
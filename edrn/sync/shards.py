@@ -0,0 +1,69 @@
+# encoding: utf-8
+# Copyright 2026 California Institute of Technology. ALL RIGHTS
+# RESERVED. U.S. Government Sponsorship acknowledged.
+
+u'''Syncing people in several processes at once, split by uid.
+
+Building a full directory, one process spends as much time making entries and keeping its books as waiting
+on the server.  ``runShards`` splits the people into shards by a stable hash of their uid, so a person is in
+the same shard every run, and works on each shard in a process of its own with its own LDAP connection and
+``edrn.sync.ldapwriter.Throttle``.  The people and the directory snapshot are read once, before the workers
+are forked, so each worker sees them without copying.  Each worker's counters are labeled with its shard and
+merged into the process-wide ``metrics`` as it finishes.  Only when every shard is done does the caller go on,
+so groups written afterwards name people who exist.
+'''
+
+from instrumentation import metrics
+from ldapwriter import throttle
+import hashlib, multiprocessing, multiprocessing.pool, sys, time, traceback
+
+# What the workers do, set before they're forked: the people, the number of shards, the work to do on each
+# shard, and whether the workers are processes
+_job = None
+
+
+def shardOf(uid, shards):
+    u'''Tell which of ``shards`` shards the person with ``uid`` belongs in, whatever the case of the uid.'''
+    return int(hashlib.md5(uid.lower().encode('utf-8')).hexdigest()[:8], 16) % shards
+
+
+def _runShard(index):
+    persons, shards, work, processes = _job
+    if processes: metrics.reset()
+    own = throttle.copy(shards)
+    mine = [person for person in persons if shardOf(person.uid, shards) == index]
+    error = None
+    try:
+        with metrics.scoped(shard=str(index)):
+            work(mine, index, own)
+    except Exception:
+        error = traceback.format_exc()
+    return index, len(mine), metrics.export() if processes else None, own.summary() if own.latencies else None, error
+
+
+def runShards(persons, shards, work, processes=True, out=None):
+    u'''Split ``persons`` into ``shards`` shards by uid and call ``work(persons, index, throttle)`` for each
+    shard's people at once, in processes or, if not ``processes``, threads.  Each gets a ``Throttle`` configured
+    like the process-wide one, with the rate split between the shards.  Report to ``out`` (standard error by
+    default) as each shard finishes, and return a mapping of shard index to the traceback of each that failed.'''
+    global _job
+    if shards < 1: raise ValueError(u'Shards must be at least 1, not %d' % shards)
+    out = out if out is not None else sys.stderr
+    _job = (persons, shards, work, processes)
+    poolClass = multiprocessing.Pool if processes else multiprocessing.pool.ThreadPool
+    pool, failures, started = poolClass(shards), {}, time.time()
+    try:
+        for index, count, exported, summary, error in pool.imap_unordered(_runShard, range(shards)):
+            if exported is not None: metrics.merge(exported)
+            print >>out, u'[shard %d] %d people done after %.1fs' % (index, count, time.time() - started)
+            if summary: print >>out, u'[shard %d] %s' % (index, summary)
+            if error is not None:
+                failures[index] = error
+                metrics.count('shard_failures', shard=str(index))
+                print >>out, u'Shard %d failed:\n%s' % (index, error)
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+        _job = None
+    return failures
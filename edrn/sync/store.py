@@ -0,0 +1,268 @@
+# encoding: utf-8
+# Copyright 2026 California Institute of Technology. ALL RIGHTS
+# RESERVED. U.S. Government Sponsorship acknowledged.
+
+u'''A local SQLite store of parsed DMCC people, sites, and committees.
+
+Parsing the DMCC feeds takes seconds to minutes; an ``EntityStore`` keeps what they held in one SQLite file,
+indexed by uid, RDF id, site, and committee, so questions like who's on a site's staff or which committees
+someone is in are answered in milliseconds, and the sync tools can ``load`` whole lists from it instead of the
+RDF.  ``save`` replaces the store's content in a single transaction, so readers never see half a feed.
+'''
+
+from rdf import RDFPersonList, RDFPerson, RDFSiteList, RDFSite, RDFCollaborativeGroupList, RDFCollaborativeGroup
+from rdfcache import SourceCache
+from rdfloader import SourceLoader, defaultWorkers
+import argparse, contextlib, sqlite3, sys, time
+
+_schemaVersion = 1
+_schema = u'''
+create table if not exists meta (key text primary key, value text);
+create table if not exists sources (url text, kind text);
+create table if not exists people (id integer primary key, rdfId text not null, uid text not null,
+    siteId text, email text, firstname text, lastname text, phone text);
+create index if not exists people_rdfId on people (rdfId);
+create index if not exists people_uid on people (uid collate nocase);
+create index if not exists people_site on people (siteId);
+create table if not exists aliases (rdfId text primary key, person integer not null references people);
+create table if not exists sites (id integer primary key, rdfId text not null, abbrevName text, title text,
+    pi integer references people, program text, memberType text);
+create index if not exists sites_rdfId on sites (rdfId);
+create index if not exists sites_pi on sites (pi);
+create table if not exists staff (site integer not null references sites, position integer not null,
+    person integer not null references people, primary key (site, position));
+create index if not exists staff_person on staff (person);
+create table if not exists committees (id integer primary key, rdfId text not null, title text, groupType text);
+create index if not exists committees_rdfId on committees (rdfId);
+create table if not exists members (committee integer not null references committees, position integer not null,
+    person integer not null references people, primary key (committee, position));
+create index if not exists members_person on members (person);
+'''
+_personColumns = (u'people.rdfId, people.siteId, people.email, people.uid, people.firstname, people.lastname, '
+    u'people.phone')
+
+
+class EntityStore(object):
+    '''People, sites, and committees kept in the SQLite database at ``path``, which is made if need be.'''
+    def __init__(self, path):
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.execute(u'pragma foreign_keys = on')
+        self.db.executescript(_schema)
+        version = self._meta('schemaVersion')
+        if version is None:
+            with self.db:
+                self.db.execute(u'insert into meta values (?, ?)', ('schemaVersion', unicode(_schemaVersion)))
+        elif int(version) != _schemaVersion:
+            raise ValueError(u'Store "%s" has schema version %s, not %d' % (path, version, _schemaVersion))
+    def _meta(self, key):
+        row = self.db.execute(u'select value from meta where key = ?', (key,)).fetchone()
+        return row[0] if row else None
+    def close(self):
+        self.db.close()
+    def save(self, persons, sites=None, committees=None, sources=()):
+        '''Replace everything in the store with ``persons``, ``sites``, and ``committees`` (any sequences of
+        ``RDFPerson``, ``RDFSite``, and ``RDFCollaborativeGroup``), noting they came from ``sources``, a sequence of
+        ``(url, kind)``.'''
+        with self.db:
+            for table in (u'members', u'committees', u'staff', u'sites', u'aliases', u'people', u'sources'):
+                self.db.execute(u'delete from ' + table)
+            rows = {}
+            for person in persons:
+                if id(person) in rows: continue
+                rows[id(person)] = self.db.execute(u'insert into people (rdfId, uid, siteId, email, firstname, '
+                    u'lastname, phone) values (?, ?, ?, ?, ?, ?, ?)', (person.rdfId, person.uid, person.siteId,
+                    person.email, person.firstname, person.lastname, person.phone)).lastrowid
+            if isinstance(persons, RDFPersonList):
+                # People merged from several feeds are known by each feed's RDF id
+                self.db.executemany(u'insert or ignore into aliases values (?, ?)', ((rdfId, rows[id(person)])
+                    for rdfId, person in persons.aliases() if id(person) in rows))
+            for site in sites or ():
+                row = self.db.execute(u'insert into sites (rdfId, abbrevName, title, pi, program, memberType) values '
+                    u'(?, ?, ?, ?, ?, ?)', (site.id, site.abbrevName, site.title, rows.get(id(site.pi)), site.program,
+                    site.memberType)).lastrowid
+                self.db.executemany(u'insert into staff values (?, ?, ?)', ((row, position, rows[id(person)])
+                    for position, person in enumerate(site.staffList) if id(person) in rows))
+            for committee in committees or ():
+                row = self.db.execute(u'insert into committees (rdfId, title, groupType) values (?, ?, ?)',
+                    (committee.id, committee.title, committee.groupType)).lastrowid
+                self.db.executemany(u'insert into members values (?, ?, ?)', ((row, position, rows[id(person)])
+                    for position, person in enumerate(committee.staffList) if id(person) in rows))
+            self.db.executemany(u'insert into sources values (?, ?)', sources)
+            self.db.execute(u'insert or replace into meta values (?, ?)', ('saved', unicode(time.time())))
+    def saved(self):
+        '''Tell when the store was last saved, in seconds since the epoch, or None if it never was.'''
+        value = self._meta('saved')
+        return float(value) if value else None
+    def sources(self):
+        '''Give the ``(url, kind)`` of each source the store was last saved from.'''
+        return self.db.execute(u'select url, kind from sources order by rowid').fetchall()
+    def counts(self):
+        '''Give how many people, sites, and committees are in the store.'''
+        return tuple(self.db.execute(u'select count(*) from ' + table).fetchone()[0]
+            for table in (u'people', u'sites', u'committees'))
+    def load(self):
+        '''Make the people, sites, and committees in the store into ``(persons, sites, committees)``, lists like
+        those parsed from RDF, without reading any RDF.'''
+        persons = RDFPersonList(self.path, records=[])
+        byRow = {}
+        for row in self.db.execute(u'select people.id, ' + _personColumns + u' from people order by people.id'):
+            person = RDFPerson(*[persons.intern(value) if value is not None else None for value in row[1:]])
+            persons.addPerson(person)
+            byRow[row[0]] = person
+        for rdfId, row in self.db.execute(u'select rdfId, person from aliases'):
+            persons.addAlias(persons.intern(rdfId), byRow[row])
+        sites = RDFSiteList(self.path, persons, records=[])
+        sites.sites = self._sites(u'', (), byRow)
+        committees = RDFCollaborativeGroupList(self.path, persons, records=[])
+        committees.groups = self._committees(u'', (), byRow)
+        return persons, sites, committees
+    def _people(self, where, args):
+        return [RDFPerson(*row) for row in self.db.execute(u'select ' + _personColumns + u' from people ' + where,
+            args)]
+    def _groupPeople(self, table, column, where, args, byRow):
+        # Everyone in each group of those matching ``where``, in order, in one query
+        people = {}
+        if byRow is None:
+            query = (u'select %s.%s, ' % (table, column) + _personColumns + u' from %s join people on %s.person = '
+                u'people.id' % (table, table))
+            make = lambda row: RDFPerson(*row[1:])
+        else:
+            query, make = u'select %s, person from %s' % (column, table), lambda row: byRow[row[1]]
+        if where: query += u' where %s.%s in (select id from %ss %s)' % (table, column, column, where)
+        for row in self.db.execute(query + u' order by %s.%s, %s.position' % (table, column, table), args):
+            people.setdefault(row[0], []).append(make(row))
+        return people
+    def _sites(self, where, args, byRow=None):
+        staff = self._groupPeople(u'staff', u'site', where, args, byRow)
+        sites = []
+        for row, rdfId, abbrevName, title, pi, program, memberType in self.db.execute(u'select id, rdfId, abbrevName, '
+            u'title, pi, program, memberType from sites ' + where + u' order by id', args):
+            if pi is not None:
+                pi = byRow[pi] if byRow is not None else self._people(u'where id = ?', (pi,))[0]
+            sites.append(RDFSite(rdfId, abbrevName, tuple(staff.get(row, ())), title, pi, program, memberType))
+        return sites
+    def _committees(self, where, args, byRow=None):
+        members = self._groupPeople(u'members', u'committee', where, args, byRow)
+        rows = self.db.execute(u'select id, rdfId, title, groupType from committees ' + where + u' order by id', args)
+        return [RDFCollaborativeGroup(rdfId, title, tuple(members.get(row, ())), groupType)
+            for row, rdfId, title, groupType in rows]
+    def person(self, uid):
+        '''Get the person with ``uid`` (in any case), or None.'''
+        people = self._people(u'where uid = ? collate nocase order by id limit 1', (uid,))
+        return people[0] if people else None
+    def personByRdfId(self, rdfId):
+        '''Get the person with RDF id ``rdfId``, or None.'''
+        people = self._people(u'where rdfId = ? or id = (select person from aliases where rdfId = ?)', (rdfId, rdfId))
+        return people[0] if people else None
+    def findPeople(self, name):
+        '''Find people whose first name, last name, uid, or email contains ``name``, in any case.'''
+        pattern = u'%' + name.replace(u'\\', u'\\\\').replace(u'%', u'\\%').replace(u'_', u'\\_') + u'%'
+        return self._people(u"where firstname like ?1 escape '\\' or lastname like ?1 escape '\\' "
+            u"or uid like ?1 escape '\\' or email like ?1 escape '\\' order by lastname, firstname", (pattern,))
+    def site(self, key):
+        '''Get the site whose RDF id, abbreviated name, or title is ``key``, or None.'''
+        sites = self._sites(u'where rdfId = ?1 or abbrevName = ?1 collate nocase or title = ?1 collate nocase', (key,))
+        return sites[0] if sites else None
+    def committee(self, key):
+        '''Get the committee whose RDF id or title is ``key``, or None.'''
+        committees = self._committees(u'where rdfId = ?1 or title = ?1 collate nocase', (key,))
+        return committees[0] if committees else None
+    def sitesOf(self, uid):
+        '''Get the sites on whose staff, or of which the PI, is the person with ``uid``.'''
+        return self._sites(u'where id in (select site from staff join people on staff.person = people.id where '
+            u'people.uid = ?1 collate nocase) or pi in (select id from people where uid = ?1 collate nocase)', (uid,))
+    def committeesOf(self, uid):
+        '''Get the committees the person with ``uid`` is a member of.'''
+        return self._committees(u'where id in (select committee from members join people on members.person = '
+            u'people.id where people.uid = ? collate nocase)', (uid,))
+
+
+@contextlib.contextmanager
+def openStore(path):
+    '''Context manager giving an ``EntityStore`` at ``path`` that's closed afterwards.'''
+    store = EntityStore(path)
+    try:
+        yield store
+    finally:
+        store.close()
+
+
+def _describePerson(person):
+    return u'%s\t%s %s\t%s\t%s' % (person.uid, person.firstname or u'', person.lastname or u'', person.email or u'',
+        person.rdfId)
+
+
+def _describeGroup(group, people=True):
+    lines = [u'%s\t%s' % (group.id, group.title or u'')]
+    if getattr(group, 'pi', None) is not None: lines.append(u'PI\t' + _describePerson(group.pi))
+    if people: lines.extend(u'\t' + _describePerson(person) for person in group.staffList)
+    return u'\n'.join(lines)
+
+
+_argParser = argparse.ArgumentParser(description=u'Keep parsed DMCC RDF in a local store and answer questions about it')
+_argParser.add_argument('store', help=u'SQLite file holding the store')
+_subParsers = _argParser.add_subparsers(dest='command')
+_importParser = _subParsers.add_parser('import', help=u'Parse DMCC RDF and replace the contents of the store with it')
+_importParser.add_argument('-c', '--cache', help=u'Directory in which to cache parsed RDF')
+_importParser.add_argument('-j', '--jobs', type=int, default=defaultWorkers,
+    help=u'How many RDF sources to fetch and parse at once; default %(default)s')
+_importParser.add_argument('urls', nargs='+', metavar='URL',
+    help=u'One or more user RDF URLs, then the site RDF URL, then the committee RDF URL')
+_subParsers.add_parser('info', help=u'Tell what the store holds and where it came from')
+for _name, _help in (('person', u'Show the person with a uid'), ('sites', u'Show the sites a uid is staff or PI of'),
+    ('committees', u'Show the committees a uid is a member of')):
+    _subParsers.add_parser(_name, help=_help).add_argument('uid')
+_subParsers.add_parser('find', help=u'Find people by part of their name, uid, or email').add_argument('name')
+_subParsers.add_parser('site', help=u'Show a site, its PI, and its staff, by RDF id, abbreviated name, or title'
+    ).add_argument('key')
+_subParsers.add_parser('committee', help=u'Show a committee and its members, by RDF id or title').add_argument('key')
+
+
+def _print(text):
+    print text.encode('utf-8')
+
+
+def main():
+    args = _argParser.parse_args()
+    with openStore(args.store) as store:
+        if args.command == 'import':
+            if len(args.urls) < 3:
+                _argParser.error(u'Give at least one user RDF URL, a site RDF URL, and a committee RDF URL')
+            if args.jobs < 1: _argParser.error(u'Jobs must be positive')
+            userURLs, siteURL, committeeURL = args.urls[:-2], args.urls[-2], args.urls[-1]
+            loader = SourceLoader(SourceCache(args.cache) if args.cache else None, workers=args.jobs)
+            persons, sites, committees = loader.load(userURLs, [siteURL], [committeeURL])
+            store.save(persons, sites, committees, [(url, 'person') for url in userURLs] + [(siteURL, 'site'),
+                (committeeURL, 'committee')])
+            _print(u'Saved %d people, %d sites, and %d committees to %s' % (store.counts() + (args.store,)))
+        elif args.command == 'info':
+            saved = store.saved()
+            _print(u'%d people, %d sites, %d committees' % store.counts())
+            _print(u'Saved ' + (time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(saved)) if saved else u'never'))
+            for url, kind in store.sources():
+                _print(u'%s\t%s' % (kind, url))
+        elif args.command == 'person':
+            person = store.person(args.uid)
+            if person is None: return False
+            _print(_describePerson(person))
+        elif args.command == 'find':
+            people = store.findPeople(args.name.decode('utf-8'))
+            for person in people:
+                _print(_describePerson(person))
+            return len(people) > 0
+        elif args.command in ('sites', 'committees'):
+            groups = store.sitesOf(args.uid) if args.command == 'sites' else store.committeesOf(args.uid)
+            for group in groups:
+                _print(_describeGroup(group, people=False))
+            return len(groups) > 0
+        else:
+            key = args.key.decode('utf-8')
+            group = store.site(key) if args.command == 'site' else store.committee(key)
+            if group is None: return False
+            _print(_describeGroup(group))
+    return True
+
+
+if __name__ == '__main__':
+    sys.exit(0 if main() else -1)
@@ -0,0 +1,159 @@
+# encoding: utf-8
+# Copyright 2026 California Institute of Technology. ALL RIGHTS
+# RESERVED. U.S. Government Sponsorship acknowledged.
+
+u'''Running the nightly user, group, and password jobs in one process.
+
+``dmccsync``, ``dmccgroupsync``, and ``secureoldpasswords`` each read the users RDF, bind to LDAP, and
+(for the first two) read the whole directory for themselves.  ``syncAll`` runs any of them as stages of one
+run that shares a single set of parsed RDF, a single directory snapshot, and a single connection pool.  The
+stages always run in the order of ``stages``, so people are added before the groups that name them and
+before their passwords are checked, however they're asked for.
+'''
+
+from dmccmakegroups import piGroups, collabGroups, writeGroups
+from dmccsync import sync, reconcile, reconcileSnapshot, syncShards
+from instrumentation import metrics
+from ldapwriter import defaultWindow, throttle
+from oldpasswords import readWeakPasswords, securePasswords
+from rdfcache import SourceCache
+from rdfloader import SourceLoader, defaultWorkers
+from store import EntityStore
+from syncldap import ConnectionPool, DirectorySnapshot
+import argparse, getpass, sys
+
+# The stages in the order they run, and the RDF each needs
+stages = ('users', 'groups', 'passwords')
+_needsPeople = frozenset(('users', 'groups'))
+
+
+def parseStages(value):
+    u'''Turn a comma-separated list of stage names into a tuple of them in the order they run.'''
+    names = set(name.strip().lower() for name in value.split(',') if name.strip())
+    unknown = names - set(stages)
+    if unknown:
+        raise ValueError(u'Unknown stages: %s; choose from %s' % (u', '.join(sorted(unknown)), u', '.join(stages)))
+    if not names: raise ValueError(u'At least one stage is needed')
+    return tuple(stage for stage in stages if stage in names)
+
+
+def syncAll(selected, userURLs, siteURL, committeeURL, ldapUrl, adminUser, adminPass, cache=None, window=defaultWindow,
+    jobs=defaultWorkers, reconciling=False, deprovision=False, pruneMembers=False, weakPasswords=None, processes=None,
+    store=None, shards=1):
+    u'''Run the ``selected`` stages against the LDAP server at ``ldapUrl``: ``users`` adds (or with
+    ``reconciling``, reconciles) the people in ``userURLs``, ``groups`` writes the PI groups of ``siteURL`` and
+    the collaborative groups of ``committeeURL``, and ``passwords`` replaces ``weakPasswords`` with random ones.
+    Given a ``store`` (an ``edrn.sync.store.EntityStore``), people, sites, and committees come from it instead
+    of from the RDF.  With several ``shards``, people are split by uid and synced by that many processes, and
+    the later stages only run once they've all succeeded.'''
+    selected = [stage for stage in stages if stage in selected]
+    persons = sites = committees = None
+    if store is not None:
+        persons, sites, committees = store.load()
+    elif _needsPeople.intersection(selected):
+        # Read everything needed at once, and the users just once for every stage
+        groupURLs = ([siteURL], [committeeURL]) if 'groups' in selected else ((), ())
+        persons, sites, committees = SourceLoader(cache, workers=jobs).load(userURLs, *groupURLs)
+    pool = ConnectionPool(ldapUrl, adminUser, adminPass)
+    try:
+        snapshot = None
+        if _needsPeople.intersection(selected):
+            snapshot = reconcileSnapshot() if reconciling and 'users' in selected else DirectorySnapshot()
+            pool.run(snapshot.load)
+        for stage in selected:
+            print >>sys.stderr, "Running stage: ["+stage+"]"
+            if stage == 'users':
+                if shards > 1:
+                    failures = syncShards(persons, ldapUrl, adminUser, adminPass, shards, window, reconciling,
+                        deprovision, snapshot=snapshot)
+                    if failures:
+                        raise RuntimeError(u'%d of %d user shards failed, so later stages were skipped'
+                            % (len(failures), shards))
+                elif reconciling:
+                    reconcile(persons, ldapUrl, adminUser, adminPass, pool=pool, window=window,
+                        deprovision=deprovision, snapshot=snapshot)
+                else:
+                    sync(persons, ldapUrl, adminUser, adminPass, pool=pool, snapshot=snapshot, window=window)
+            elif stage == 'groups':
+                writeGroups(piGroups(sites), ldapUrl, adminUser, adminPass, pool, snapshot, window, pruneMembers)
+                writeGroups(collabGroups(committees), ldapUrl, adminUser, adminPass, pool, snapshot, window,
+                    pruneMembers)
+            elif stage == 'passwords':
+                pool.run(lambda ldapConn: securePasswords(ldapConn, weakPasswords=weakPasswords,
+                    processes=processes))
+    finally:
+        pool.close()
+
+
+_argParser = argparse.ArgumentParser(description=u'Sync DMCC users and groups to EDRN LDAP and secure weak passwords'
+    u' in one run')
+_argParser.add_argument('-u', '--user', required=True, help=u'LDAP DN of a user who may add and change entries')
+_argParser.add_argument('-p', '--password', help=u"That user's password; if not given, you'll be prompted")
+_argParser.add_argument('-l', '--ldapUrl', required=True, help=u'URL of the LDAP server to sync with')
+_argParser.add_argument('-s', '--stages', default=','.join(stages),
+    help=u'Comma-separated stages to run, always in the order users, groups, passwords; default %(default)s')
+_argParser.add_argument('-c', '--cache', help=u'Directory in which to cache parsed RDF')
+_argParser.add_argument('--store', metavar='FILE',
+    help=u'Take people, sites, and committees from this store made by dmccstore instead of from RDF')
+_argParser.add_argument('-w', '--window', type=int, default=defaultWindow,
+    help=u'Most LDAP writes to keep in flight at once, adapting to the server; default %(default)s')
+_argParser.add_argument('-j', '--jobs', type=int, default=defaultWorkers,
+    help=u'How many RDF sources to fetch and parse at once; default %(default)s')
+_argParser.add_argument('--max-rate', type=float, metavar='OPS', help=u'Most LDAP writes to send a second')
+_argParser.add_argument('--max-latency', type=float, metavar='SECONDS',
+    help=u'Narrow the window of writes when they take longer than this; default four times the quickest seen')
+_argParser.add_argument('--shards', type=int, default=1,
+    help=u'Split people into this many shards by uid and sync each in a process of its own; default %(default)s')
+_argParser.add_argument('-r', '--reconcile', action='store_true',
+    help=u'Update changed people too, rather than only adding missing ones')
+_argParser.add_argument('-d', '--deprovision', action='store_true',
+    help=u'With --reconcile, delete people who are no longer in the RDF')
+_argParser.add_argument('-m', '--prune-members', action='store_true',
+    help=u"Remove group members who aren't in the RDF")
+_argParser.add_argument('-W', '--weak-passwords', type=argparse.FileType('rb'),
+    help=u'File of weak passwords to look for, one per line; default just "changeme"')
+_argParser.add_argument('--password-processes', type=int,
+    help=u'Worker processes for checking salted passwords; default one per CPU, 0 for none')
+_argParser.add_argument('--progress', action='store_true', help=u'Show how far along each stage is on standard error')
+_argParser.add_argument('--metrics', metavar='FILE',
+    help=u'Save counts and timings of the run to FILE: Prometheus text format if it ends in .prom, JSON otherwise')
+_argParser.add_argument('urls', nargs='*', metavar='URL',
+    help=u'One or more user RDF URLs, then, if syncing groups, the site RDF URL and the committee RDF URL')
+
+
+def main():
+    args = _argParser.parse_args()
+    try:
+        selected = parseStages(args.stages)
+    except ValueError, ex:
+        _argParser.error(unicode(ex))
+    urls, siteURL, committeeURL = args.urls, None, None
+    if args.store:
+        if urls: _argParser.error(u'Give either --store or RDF URLs, not both')
+    elif 'groups' in selected:
+        if len(urls) < 3:
+            _argParser.error(u'The groups stage needs user RDF URLs, a site RDF URL, and a committee RDF URL')
+        urls, siteURL, committeeURL = urls[:-2], urls[-2], urls[-1]
+    elif _needsPeople.intersection(selected) and not urls:
+        _argParser.error(u'The users stage needs at least one user RDF URL')
+    if args.deprovision and not args.reconcile: _argParser.error(u'--deprovision only works with --reconcile')
+    if args.window < 1 or args.jobs < 1 or args.shards < 1:
+        _argParser.error(u'The window, jobs, and shards must all be positive')
+    if args.max_rate is not None and args.max_rate <= 0 or args.max_latency is not None and args.max_latency <= 0:
+        _argParser.error(u'The rate and latency must be positive')
+    password = args.password if args.password else getpass.getpass(u'LDAP password: ')
+    weakPasswords = readWeakPasswords(args.weak_passwords) if args.weak_passwords else None
+    store = EntityStore(args.store) if args.store else None
+    try:
+        with metrics.recording('dmccsyncall', args.metrics, args.progress), throttle.limiting(args.max_latency,
+            args.max_rate):
+            syncAll(selected, urls, siteURL, committeeURL, args.ldapUrl, args.user, password,
+                SourceCache(args.cache) if args.cache else None, args.window, args.jobs, args.reconcile,
+                args.deprovision, args.prune_members, weakPasswords, args.password_processes, store, args.shards)
+    finally:
+        if store is not None: store.close()
+    return True
+
+
+if __name__ == '__main__':
+    sys.exit(0 if main() else -1)
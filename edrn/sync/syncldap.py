@@ -6,7 +6,225 @@
 '''EDRN generic LDAP functions.
 '''
 
-import ldap
+from instrumentation import metrics
+from ldap.controls import SimplePagedResultsControl
+import contextlib, ldap, ldap.filter, Queue, threading, time
+
+# How long a pooled connection may sit idle before we check it's still alive, in seconds
+_defaultCheckAfter = 60
+
+# Where EDRN people and groups live, and how many entries to ask for per page when reading them all
+_baseDN = 'dc=edrn,dc=jpl,dc=nasa,dc=gov'
+_defaultPageSize = 500
+
+# How many uids or group names to look for in one search when reading only some of the directory, and how
+# many in all before it's quicker to read everything
+_subsetBatchSize = 100
+_subsetLimit = 2000
+
+
+def pagedSearch(ldapConn, base, scope, searchFilter, attrs, pageSize=_defaultPageSize):
+    '''Search with the Simple Paged Results control, yielding ``(dn, attrs)`` for each entry as each page
+    arrives so that only one page is held in memory at a time.'''
+    control = SimplePagedResultsControl(True, size=pageSize, cookie='')
+    while True:
+        with metrics.request('search', 'ldap_read'):
+            msgid = ldapConn.search_ext(base, scope, searchFilter, attrs, serverctrls=[control])
+            rtype, rdata, rmsgid, serverctrls = ldapConn.result3(msgid)
+        for dn, entry in rdata:
+            # Skip search continuation references, which have no DN
+            if dn is not None: yield dn, entry
+        cookies = [c.cookie for c in serverctrls if c.controlType == SimplePagedResultsControl.controlType]
+        if not cookies or not cookies[0]: return
+        control.cookie = cookies[0]
+
+
+def normalizeDN(dn):
+    '''Put ``dn`` in a form that can be compared with others: lower case, without spaces around commas.'''
+    return ','.join(i.strip() for i in dn.lower().split(','))
+
+
+class DirectorySnapshot(object):
+    '''An in-memory copy of which people and groups exist under a base DN, and who is in each group, so
+    that existence and membership questions can be answered without a search per question.  Call ``load``
+    to read the directory and the ``added…``/``removed…`` methods to keep the copy in step with writes.
+    If ``personAttributes`` are named, each person's DN and values of those attributes are kept too.'''
+    def __init__(self, base=_baseDN, pageSize=_defaultPageSize, personAttributes=()):
+        self.base, self.pageSize = base, pageSize
+        self.personAttributes = tuple(personAttributes)
+        self.uids = set()
+        self.people = {}
+        self.groups = {}
+        self.members = {}
+    def load(self, ldapConn):
+        '''Read every ``edrnPerson`` and ``groupOfUniqueNames`` one level below our base.'''
+        self.uids, self.people, self.groups, self.members = set(), {}, {}, {}
+        self._readPeople(ldapConn, '(objectClass=edrnPerson)')
+        self._readGroups(ldapConn, '(objectClass=groupOfUniqueNames)')
+    refresh = load
+    def loadSubset(self, ldapConn, uids=(), groupcns=()):
+        '''Read just the people with ``uids`` and the groups named ``groupcns``, so that a run touching a few
+        entries needn't read the whole directory.  Questions about anyone or any group else get wrong answers.
+        If there are so many that reading everything would be quicker, everything is read.'''
+        uids, groupcns = set(uids), set(groupcns)
+        if len(uids) + len(groupcns) > _subsetLimit: return self.load(ldapConn)
+        self.uids, self.people, self.groups, self.members = set(), {}, {}, {}
+        self._readEach(ldapConn, 'edrnPerson', 'uid', uids, self._readPeople)
+        self._readEach(ldapConn, 'groupOfUniqueNames', 'cn', groupcns, self._readGroups)
+    def reloadPeople(self, ldapConn, uids):
+        '''Read the people with ``uids`` afresh, forgetting any no longer in the directory, as after writes to
+        them whose results never came.'''
+        uids = set(uid.lower() for uid in uids)
+        self.uids -= uids
+        for uid in uids: self.people.pop(uid, None)
+        self._readEach(ldapConn, 'edrnPerson', 'uid', uids, self._readPeople)
+    def _readEach(self, ldapConn, objectClass, attribute, values, read):
+        values = sorted(values)
+        for i in range(0, len(values), _subsetBatchSize):
+            wanted = ''.join('(%s=%s)' % (attribute, ldap.filter.escape_filter_chars(
+                value.encode('utf-8') if isinstance(value, unicode) else value))
+                for value in values[i:i + _subsetBatchSize])
+            read(ldapConn, '(&(objectClass=%s)(|%s))' % (objectClass, wanted))
+    def _readPeople(self, ldapConn, searchFilter):
+        for dn, attrs in pagedSearch(ldapConn, self.base, ldap.SCOPE_ONELEVEL, searchFilter,
+            ['uid'] + list(self.personAttributes), self.pageSize):
+            for uid in attrs.get('uid', []):
+                self.uids.add(uid.lower())
+                if self.personAttributes:
+                    self.people[uid.lower()] = (dn, dict((k.lower(), v) for k, v in attrs.iteritems()))
+    def _readGroups(self, ldapConn, searchFilter):
+        for dn, attrs in pagedSearch(ldapConn, self.base, ldap.SCOPE_ONELEVEL, searchFilter, ['cn', 'uniquemember'],
+            self.pageSize):
+            for cn in attrs.get('cn', []):
+                self.groups[cn.lower()] = dn
+            self.members[normalizeDN(dn)] = dict((normalizeDN(i), i) for i in attrs.get('uniquemember', []))
+    def personExists(self, uid):
+        return uid.lower() in self.uids
+    def groupExists(self, groupcn):
+        return groupcn.lower() in self.groups
+    def memberExists(self, groupcn, uid):
+        '''Tell if ``uid`` (of the form ``uid=…``, as with the ``memberExists`` function) is in group ``groupcn``.'''
+        return normalizeDN(uid + ',' + self.base) in self.getMembers(groupcn)
+    def getMembers(self, groupcn):
+        '''Get the members of group ``groupcn`` as a mapping from normalized member DN to the DN as stored in
+        the directory; empty if there's no such group.'''
+        dn = self.groups.get(groupcn.lower())
+        return self.members.setdefault(normalizeDN(dn), {}) if dn else {}
+    def getPerson(self, uid):
+        '''Get ``(dn, {attribute→[values]})`` for person ``uid``, with lower-case attribute names, or None if
+        there's no such person or we weren't asked to keep ``personAttributes``.'''
+        return self.people.get(uid.lower())
+    def addedPerson(self, uid, dn=None, attrs=None):
+        self.uids.add(uid.lower())
+        if self.personAttributes and dn is not None:
+            self.people[uid.lower()] = (dn, dict((k.lower(), v if isinstance(v, list) else [v])
+                for k, v in (attrs or {}).iteritems()))
+    def changedPerson(self, uid, attrs):
+        '''Note that person ``uid`` now has the given ``attrs`` of the form {attribute→[values]}.'''
+        person = self.people.get(uid.lower())
+        if person is not None:
+            person[1].update((k.lower(), v) for k, v in attrs.iteritems())
+    def removedPerson(self, uid):
+        self.uids.discard(uid.lower())
+        self.people.pop(uid.lower(), None)
+    def addedGroup(self, groupcn, dn, memberDNs):
+        self.groups[groupcn.lower()] = dn
+        self.members[normalizeDN(dn)] = dict((normalizeDN(i), i) for i in memberDNs)
+    def addedMembers(self, groupcn, memberDNs):
+        self.getMembers(groupcn).update((normalizeDN(i), i) for i in memberDNs)
+    def removedMembers(self, groupcn, memberDNs):
+        members = self.getMembers(groupcn)
+        for i in memberDNs:
+            members.pop(normalizeDN(i), None)
+
+
+class ConnectionPool(object):
+    '''A small pool of LDAP connections to one server.  Connections are bound once and reused for many
+    operations; idle ones are health-checked before reuse and dead ones are replaced with a fresh bind.'''
+    def __init__(self, url, bindDN, password, size=2, checkAfter=_defaultCheckAfter):
+        self.url, self.bindDN, self.password = url, bindDN, password
+        self.size, self.checkAfter = size, checkAfter
+        self.binds = 0
+        self._idle = Queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+    def _connect(self):
+        conn = ldap.initialize(self.url)
+        with metrics.request('bind', 'ldap_bind'):
+            conn.simple_bind_s(self.bindDN, self.password)
+        with self._lock:
+            self.binds += 1
+        return conn
+    def _discard(self, conn):
+        try:
+            conn.unbind_s()
+        except ldap.LDAPError:
+            pass
+    def _healthy(self, conn):
+        try:
+            conn.search_s('', ldap.SCOPE_BASE, '(objectClass=*)', ['1.1'])
+            return True
+        except ldap.LDAPError:
+            return False
+    def _drain(self):
+        while True:
+            try:
+                conn, lastUsed = self._idle.get_nowait()
+            except Queue.Empty:
+                return
+            self._discard(conn)
+    def acquire(self):
+        '''Get a bound connection, waiting if all ``size`` connections are in use.  Give it back with
+        ``release``.'''
+        self._slots.acquire()
+        try:
+            while True:
+                try:
+                    conn, lastUsed = self._idle.get_nowait()
+                except Queue.Empty:
+                    return self._connect()
+                if time.time() - lastUsed < self.checkAfter or self._healthy(conn):
+                    return conn
+                self._discard(conn)
+        except:
+            self._slots.release()
+            raise
+    def release(self, conn, broken=False):
+        '''Return ``conn`` to the pool, or throw it away if it's ``broken``.'''
+        if broken:
+            self._discard(conn)
+        else:
+            self._idle.put((conn, time.time()))
+        self._slots.release()
+    @contextlib.contextmanager
+    def connection(self):
+        '''Context manager that acquires a connection and releases it afterwards.'''
+        conn = self.acquire()
+        try:
+            yield conn
+        except ldap.SERVER_DOWN:
+            self.release(conn, broken=True)
+            raise
+        except:
+            self.release(conn)
+            raise
+        else:
+            self.release(conn)
+    def run(self, operation):
+        '''Call ``operation`` with a pooled connection and return what it returns.  If the server went away,
+        drop the idle connections, rebind, and try once more.'''
+        try:
+            with self.connection() as conn:
+                return operation(conn)
+        except ldap.SERVER_DOWN:
+            metrics.count('ldap_reconnects')
+            self._drain()
+            with self.connection() as conn:
+                return operation(conn)
+    def close(self):
+        '''Unbind all idle connections.'''
+        self._drain()
+
 
 def personExists(ldapConn, uid):
     baseDn = "dc=edrn,dc=jpl,dc=nasa,dc=gov"
@@ -18,6 +236,8 @@ def personExists(ldapConn, uid):
             return True
         else:
             return False
+    except ldap.SERVER_DOWN:
+        raise
     except ldap.LDAPError, e:
         print e.message['info']
         
@@ -36,6 +256,8 @@ def groupExists(ldapConn, groupcn):
             return True
         else:
             return False
+    except ldap.SERVER_DOWN:
+        raise
     except ldap.LDAPError, e:
         print e.message['info']
 
@@ -50,5 +272,7 @@ def memberExists(ldapConn, groupcn, uid):
             return True
         else:
             return False
+    except ldap.SERVER_DOWN:
+        raise
     except ldap.LDAPError, e:
         print e.message['info']
\ No newline at end of file
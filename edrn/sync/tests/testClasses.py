@@ -5,10 +5,18 @@
 u'''EDRN Sync Services — unit tests for classes.'''
 
 import unittest2 as unittest
-import pkg_resources
-from edrn.sync.rdf import RDFPersonList, RDFSiteList, RDFCollaborativeGroupList
+import pkg_resources, bz2, gzip, os, os.path, shutil, sys, tempfile, threading, time, BaseHTTPServer
+from edrn.sync.rdf import RDFPerson, RDFPersonList, RDFSiteList, RDFCollaborativeGroupList
+from edrn.sync.rdfstream import iterSubjects, iterTriples, openSource, sourceFormat, UnsupportedRDF
+from edrn.sync.rdfcache import SourceCache, serializeRecords, deserializeRecords
+from edrn.sync.rdfloader import SourceLoader
+from edrn.sync.store import EntityStore
+from edrn.sync.corpus import generateCorpus
+import edrn.sync.rdfloader
 import xml.parsers.expat, xml.sax
 from rdflib.exceptions import ParserError
+from rdflib.term import URIRef, Literal
+import rdflib
 
 
 class _RDFBaseTestCase(unittest.TestCase):
@@ -65,6 +73,62 @@ class RDFPersonListTest(_RDFBaseTestCase):
         self.assertEqual(1, len(l))
         person = l[0]
         self.assertEqual('churchill', person.uid)
+    def testLookups(self):
+        '''See if people can be found by RDF id and by uid without scanning the list.'''
+        goodFile = 'file:' + pkg_resources.resource_filename(__name__, 'data/users.rdf')
+        l = RDFPersonList(goodFile)
+        heather = l.getPersonByUid('hkincaid')
+        self.assertEqual('Kincaid', heather.lastname)
+        self.assertTrue(heather is l.getPersonByRdfId('http://edrn.nci.nih.gov/data/registered-person/3'))
+        self.assertEqual(None, l.getPersonByUid('nobody'))
+        self.assertEqual(None, l.getPersonByRdfId(None))
+        del l[l.persons.index(heather)]
+        self.assertEqual(None, l.getPersonByUid('hkincaid'))
+        self.assertEqual(2, len(l))
+    def testDuplicateLookups(self):
+        '''When the first of several people with a uid goes, the next is found by it.'''
+        l = RDFPersonList('file:' + pkg_resources.resource_filename(__name__, 'data/users.rdf'))
+        first, second, third = [RDFPerson(u'urn:%d' % i, None, None, u'dup', None, u'Dup', None) for i in range(3)]
+        for person in (first, second, third): l.addPerson(person)
+        self.assertTrue(first is l.getPersonByUid(u'dup'))
+        del l[l.persons.index(first)]
+        self.assertTrue(second is l.getPersonByUid(u'dup'))
+        l[l.persons.index(third)] = RDFPerson(u'urn:3', None, None, u'other', None, u'Other', None)
+        del l[l.persons.index(second)]
+        self.assertEqual(None, l.getPersonByUid(u'dup'))
+        self.assertEqual(u'urn:3', l.getPersonByUid(u'other').rdfId)
+        self.assertTrue(l.getPersonByRdfId(u'urn:0') is None)
+
+    def testLazy(self):
+        '''Check that a lazy list parses as it's iterated and all at once only when it has to.'''
+        goodFile = 'file:' + pkg_resources.resource_filename(__name__, 'data/users.rdf')
+        eager = [i.uid for i in RDFPersonList(goodFile)]
+        l = RDFPersonList(goodFile, lazy=True)
+        self.assertTrue(l.isLazy())
+        self.assertEqual(0, len(l.persons))
+        first, second = iter(l), iter(l)
+        self.assertEqual(eager[0], first.next().uid)
+        self.assertEqual(1, len(l.persons))
+        self.assertEqual(eager, [i.uid for i in second])
+        self.assertEqual(eager[1:], [i.uid for i in first])
+        self.assertFalse(l.isLazy())
+        l = RDFPersonList(goodFile, lazy=True)
+        self.assertEqual('Kincaid', l.getPersonByUid('hkincaid').lastname)
+        self.assertFalse(l.isLazy())
+        self.assertEqual(3, len(l))
+    def testLazyFallback(self):
+        '''Make sure a lazy list that has to fall back to rdflib part way through still gives each person once.'''
+        nestedFile = 'file:' + pkg_resources.resource_filename(__name__, 'data/nested.rdf')
+        l = RDFPersonList(nestedFile, lazy=True)
+        self.assertEqual(['mattmann', 'pramirez'], sorted(i.uid for i in l))
+        self.assertEqual(2, len(l))
+    def testStream(self):
+        '''See if streaming gives every person once without keeping any, even falling back to rdflib.'''
+        for name in ('users.rdf', 'nested.rdf'):
+            url = 'file:' + pkg_resources.resource_filename(__name__, 'data/' + name)
+            l = RDFPersonList(url, lazy=True)
+            self.assertEqual(sorted(i.uid for i in RDFPersonList(url)), sorted(i.uid for i in l.stream()))
+            self.assertEqual(0, len(l.persons))
 
 class RDFSiteListTest(_RDFBaseTestCase):
     '''Test the RDFSiteList class.'''
@@ -89,6 +153,20 @@ class RDFSiteListTest(_RDFBaseTestCase):
         self.assertEqual('Mattmann', jpl.pi.lastname)
         self.assertEqual(1, len(jpl.staffList))
         self.assertEqual('Ramirez', jpl.staffList[0].lastname)
+    def testLazy(self):
+        '''See if lazy sites resolve staff from a lazy person list.'''
+        persons = RDFPersonList('file:' + pkg_resources.resource_filename(__name__, 'data/users.rdf'), lazy=True)
+        l = RDFSiteList('file:' + pkg_resources.resource_filename(__name__, 'data/sites.rdf'), persons, lazy=True)
+        self.assertTrue(persons.isLazy())
+        self.assertEqual(set(['JPL', 'NG']), set(i.abbrevName for i in l))
+        self.assertFalse(persons.isLazy())
+    def testPlainPersonSequence(self):
+        '''Make sure a plain list of people still resolves PIs and staff.'''
+        goodFile = 'file:' + pkg_resources.resource_filename(__name__, 'data/sites.rdf')
+        l = RDFSiteList(goodFile, list(self.personList.persons))
+        ng = [i for i in l if i.abbrevName == 'NG'][0]
+        self.assertEqual('Kincaid', ng.pi.lastname)
+        self.assertEqual(['Kincaid'], [i.lastname for i in ng.staffList])
 
 class RDFCollaborativeGroupListTest(_RDFBaseTestCase):
     '''Test the RDFCollaborativeGroupList class.'''
@@ -111,11 +189,407 @@ class RDFCollaborativeGroupListTest(_RDFBaseTestCase):
         got = set([i.lastname for i in sc.staffList])
         self.assertEqual(expected, got, 'Members of committee incorrect, expected %r, got %r' % (expected, got))
 
+class RDFEngineTest(unittest.TestCase):
+    '''Compare the streaming SAX engine with the rdflib engine.'''
+    def _profile(self, name):
+        return 'file:' + pkg_resources.resource_filename('edrn.sync', 'profiles/default/rdf/' + name)
+    def testUnknownEngine(self):
+        '''Ensure asking for a nonexistent engine is an error.'''
+        with self.assertRaises(ValueError):
+            RDFPersonList(self._profile('dmcc-users.rdf'), engine='bogus')
+    def testSameResults(self):
+        '''Check that both engines produce identical people, sites, and committees from the DMCC profile RDF.'''
+        results = {}
+        for engine in ('sax', 'rdflib'):
+            persons = RDFPersonList(self._profile('dmcc-users.rdf'), engine=engine)
+            sites = RDFSiteList(self._profile('dmcc-sites.rdf'), persons, engine=engine)
+            groups = RDFCollaborativeGroupList(self._profile('dmcc-committes.rdf'), persons, engine=engine)
+            results[engine] = (
+                sorted((p.rdfId, p.siteId, p.email, p.uid, p.firstname, p.lastname, p.phone) for p in persons),
+                sorted((s.id, s.title, s.pi.uid if s.pi else None, tuple(sorted(i.uid for i in s.staffList)))
+                    for s in sites),
+                sorted((g.id, g.title, g.groupType, tuple(sorted(i.uid for i in g.staffList))) for g in groups),
+            )
+        self.assertTrue(len(results['sax'][0]) > 0)
+        self.assertEqual(results['rdflib'], results['sax'])
+    def testPredicateFilter(self):
+        '''See if the streaming parser keeps only the predicates and types asked for.'''
+        goodFile = 'file:' + pkg_resources.resource_filename(__name__, 'data/users.rdf')
+        accountName = URIRef(u'http://xmlns.com/foaf/0.1/accountName')
+        person = URIRef(u'http://edrn.nci.nih.gov/rdf/types.rdf#Person')
+        records = list(iterSubjects(goodFile, frozenset([accountName]), frozenset([person])))
+        self.assertEqual(3, len(records))
+        for subj, preds in records:
+            self.assertEqual(set([accountName, URIRef(u'http://www.w3.org/1999/02/22-rdf-syntax-ns#type')]), set(preds))
+        self.assertEqual([], list(iterSubjects(goodFile, types=frozenset([URIRef(u'urn:no:such:type')]))))
+    def testFallback(self):
+        '''Make sure RDF/XML the streaming parser can't handle still parses via rdflib.'''
+        nestedFile = 'file:' + pkg_resources.resource_filename(__name__, 'data/nested.rdf')
+        with self.assertRaises(UnsupportedRDF):
+            list(iterSubjects(nestedFile))
+        l = RDFPersonList(nestedFile, engine='sax')
+        self.assertEqual(set(['mattmann', 'pramirez']), set([i.uid for i in l]))
+    def testSplitSubjects(self):
+        '''Check a subject described by more than one node element goes to rdflib, which merges its statements.'''
+        splitFile = 'file:' + pkg_resources.resource_filename(__name__, 'data/split.rdf')
+        with self.assertRaises(UnsupportedRDF):
+            list(iterSubjects(splitFile))
+        expected = [('u1', 'Bob', None), ('u2', 'Paul', 'Ramirez')]
+        for engine in ('sax', 'rdflib'):
+            l = RDFPersonList(splitFile, engine=engine)
+            self.assertEqual(expected, sorted((i.uid, i.firstname, i.lastname) for i in l), engine)
+        persons = SourceLoader().loadPersons([splitFile])
+        self.assertEqual(expected, sorted((i.uid, i.firstname, i.lastname) for i in persons))
+    def testLanguage(self):
+        '''Check xml:lang is inherited from enclosing elements and an empty one takes it away.'''
+        langFile = 'file:' + pkg_resources.resource_filename(__name__, 'data/lang.rdf')
+        [(subject, statements)] = list(iterSubjects(langFile))
+        self.assertEqual([Literal(u'Bob', lang='en')], statements[URIRef(u'http://xmlns.com/foaf/0.1/givenname')])
+        self.assertEqual([Literal(u'Ramirez')], statements[URIRef(u'http://xmlns.com/foaf/0.1/surname')])
+
+class RDFFormatTest(unittest.TestCase):
+    '''Test reading N-Triples, Turtle, and compressed RDF.'''
+    def setUp(self):
+        super(RDFFormatTest, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.users = pkg_resources.resource_filename(__name__, 'data/users.rdf')
+        self.graph = rdflib.ConjunctiveGraph()
+        self.graph.parse(self.users, format='xml')
+        self.expected = sorted(i.uid for i in RDFPersonList(self.users))
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        super(RDFFormatTest, self).tearDown()
+    def _write(self, name, format=None, opener=open):
+        path = os.path.join(self.directory, name)
+        data = self.graph.serialize(format=format) if format else open(self.users, 'rb').read()
+        with opener(path, 'wb') as f:
+            f.write(data)
+        return path
+    def testFormats(self):
+        '''See if every format and compression, with or without a telling extension, gives the same people.'''
+        paths = [self._write('users.nt', 'nt'), self._write('users.ttl', 'turtle'), self._write('nt', 'nt'),
+            self._write('ttl', 'turtle'), self._write('users.nt.gz', 'nt', gzip.open),
+            self._write('users.rdf.bz2', opener=bz2.BZ2File), self._write('rdf', opener=gzip.open)]
+        for path in paths:
+            for engine in ('sax', 'rdflib'):
+                self.assertEqual(self.expected, sorted(i.uid for i in RDFPersonList(path, engine=engine)), path)
+        self.assertEqual(['nt', 'turtle', 'xml'], [sourceFormat(p, openSource(p)) for p in paths[2:4] + paths[6:]])
+    def testTriples(self):
+        '''Check the line-based N-Triples reader unescapes literals and leaves blank nodes to rdflib.'''
+        path = os.path.join(self.directory, 'escapes.nt')
+        with open(path, 'wb') as f:
+            f.write('# A comment\n\n<urn:s> <urn:p> "Caf\\u00E9 \\"Ren\xc3\xa9\\"\\n"@fr .\r\n'
+                '<urn:s> <urn:q> <urn:o> . # trailing\n<urn:s> <urn:r> "1"^^<urn:int> .')
+        [(subject, statements)] = list(iterTriples(path))
+        self.assertEqual(URIRef(u'urn:s'), subject)
+        self.assertEqual([Literal(u'Caf\xe9 "Ren\xe9"\n', lang='fr')], statements[URIRef(u'urn:p')])
+        self.assertEqual([URIRef(u'urn:o')], statements[URIRef(u'urn:q')])
+        self.assertEqual([Literal(u'1', datatype=URIRef(u'urn:int'))], statements[URIRef(u'urn:r')])
+        with open(path, 'wb') as f:
+            f.write('_:b0 <urn:p> "x" .\n')
+        with self.assertRaises(UnsupportedRDF):
+            list(iterTriples(path))
+    def testCachedCompressed(self):
+        '''Make sure compressed sources are cached like any other.'''
+        cache = SourceCache(os.path.join(self.directory, 'cache'))
+        path = self._write('users.nt.gz', 'nt', gzip.open)
+        for i in range(2):
+            self.assertEqual(self.expected, sorted(i.uid for i in RDFPersonList(path, cache=cache)))
+        self.assertEqual((1, 1), (cache.hits, cache.misses))
+
+
+class _FeedHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    '''Serve the test users RDF with an ETag, answering conditional requests with 304.'''
+    etag = '"users-1"'
+    requests, notModified = [], []
+    def do_GET(self):
+        self.requests.append(self.path)
+        if self.headers.getheader('If-None-Match') == self.etag:
+            self.notModified.append(self.path)
+            self.send_response(304)
+            self.end_headers()
+            return
+        with open(pkg_resources.resource_filename(__name__, 'data/users.rdf'), 'rb') as f:
+            body = f.read()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/rdf+xml')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', self.etag)
+        self.end_headers()
+        self.wfile.write(body)
+    def log_message(self, *args):
+        pass
+
+
+class SourceCacheTest(unittest.TestCase):
+    '''Test the on-disk cache of parsed RDF.'''
+    def setUp(self):
+        super(SourceCacheTest, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.cache = SourceCache(os.path.join(self.directory, 'cache'))
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        super(SourceCacheTest, self).tearDown()
+    def testSerialization(self):
+        '''Confirm records survive a round trip through their compact serialized form.'''
+        goodFile = 'file:' + pkg_resources.resource_filename(__name__, 'data/sites.rdf')
+        records = sorted(iterSubjects(goodFile))
+        self.assertEqual(records, sorted(deserializeRecords(serializeRecords(records))))
+    def testLocalFile(self):
+        '''Check that a local file is parsed once and then revalidated by modification time and size.'''
+        users = os.path.join(self.directory, 'users.rdf')
+        shutil.copy(pkg_resources.resource_filename(__name__, 'data/users.rdf'), users)
+        first = RDFPersonList('file:' + users, cache=self.cache)
+        second = RDFPersonList('file:' + users, cache=self.cache)
+        self.assertEqual((1, 1), (self.cache.misses, self.cache.hits))
+        self.assertEqual(sorted(i.uid for i in first), sorted(i.uid for i in second))
+        shutil.copy(pkg_resources.resource_filename(__name__, 'data/no-email.rdf'), users)
+        os.utime(users, (time.time() + 10, time.time() + 10))
+        third = RDFPersonList('file:' + users, cache=self.cache)
+        self.assertEqual(['churchill'], [i.uid for i in third])
+        self.assertEqual(2, self.cache.misses)
+    def testKindsKeptApart(self):
+        '''Ensure different kinds of RDF list reading the same source get separate entries.'''
+        users = 'file:' + pkg_resources.resource_filename(__name__, 'data/users.rdf')
+        persons = RDFPersonList(users, cache=self.cache)
+        self.assertEqual(0, len(RDFSiteList(users, persons, cache=self.cache)))
+        self.assertEqual(3, len(RDFPersonList(users, cache=self.cache)))
+    def testRemote(self):
+        '''Verify remote sources are revalidated with If-None-Match against a local HTTP server.'''
+        del _FeedHandler.requests[:], _FeedHandler.notModified[:]
+        server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), _FeedHandler)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        try:
+            url = 'http://127.0.0.1:%d/users.rdf' % server.server_address[1]
+            first = RDFPersonList(url, cache=self.cache)
+            second = RDFPersonList(url, cache=self.cache)
+        finally:
+            server.shutdown()
+            server.server_close()
+        self.assertEqual(2, len(_FeedHandler.requests))
+        self.assertEqual(1, len(_FeedHandler.notModified))
+        self.assertEqual((1, 1), (self.cache.misses, self.cache.hits))
+        self.assertEqual(3, len(first))
+        self.assertEqual(3, len(second))
+        self.assertEqual(u'http://edrn.nci.nih.gov/data/sites/2', second.getPersonByUid('hkincaid').siteId)
+    def testEviction(self):
+        '''See if stale entries and entries beyond the size limit are evicted.'''
+        users = 'file:' + pkg_resources.resource_filename(__name__, 'data/users.rdf')
+        sites = 'file:' + pkg_resources.resource_filename(__name__, 'data/sites.rdf')
+        persons = RDFPersonList(users, cache=self.cache)
+        RDFSiteList(sites, persons, cache=self.cache)
+        count = lambda: len([i for i in os.listdir(self.cache.directory) if i.endswith('.records')])
+        self.assertEqual(2, count())
+        self.cache.maxBytes = 1
+        self.cache.prune()
+        self.assertEqual(0, count())
+        self.cache.maxBytes = 1024 * 1024
+        RDFPersonList(users, cache=self.cache)
+        self.cache.maxAge = -1
+        self.cache.prune()
+        self.assertEqual(0, count())
+
+
+class SourceLoaderTest(unittest.TestCase):
+    '''Test loading several RDF sources at once.'''
+    def setUp(self):
+        super(SourceLoaderTest, self).setUp()
+        self.fetched = []
+        self.fetchRecords = edrn.sync.rdfloader.fetchRecords
+        def fetchRecords(url, listClass, engine=None, cache=None):
+            self.fetched.append((url, listClass))
+            return self.fetchRecords(url, listClass, engine, cache)
+        edrn.sync.rdfloader.fetchRecords = fetchRecords
+    def tearDown(self):
+        edrn.sync.rdfloader.fetchRecords = self.fetchRecords
+        super(SourceLoaderTest, self).tearDown()
+    def _data(self, name):
+        return 'file:' + pkg_resources.resource_filename(__name__, 'data/' + name)
+    def testEachSourceOnce(self):
+        '''Check that naming a source twice still reads it only once, and everything comes out as if read alone.'''
+        loader = SourceLoader(workers=3)
+        persons, sites, committees = loader.load([self._data('users.rdf'), self._data('users.rdf')],
+            [self._data('sites.rdf')], [self._data('committees.rdf')])
+        self.assertEqual(3, len(self.fetched))
+        self.assertEqual(3, len(set(self.fetched)))
+        self.assertEqual(3, len(persons))
+        self.assertEqual(set(['JPL', 'NG']), set(i.abbrevName for i in sites))
+        self.assertEqual(3, len(committees[0].staffList))
+        self.assertEqual(None, loader.load([self._data('users.rdf')])[1])
+    def testMerge(self):
+        '''See if people in several user feeds are merged by uid, the first feed winning.'''
+        persons = SourceLoader(processes=True).loadPersons([self._data('users.rdf'), self._data('more-users.rdf')])
+        self.assertEqual(set(['mattmann', 'pramirez', 'hkincaid', 'crichton']), set(i.uid for i in persons))
+        heather = persons.getPersonByUid('hkincaid')
+        self.assertEqual('Kincaid', heather.lastname)
+        self.assertTrue(heather is persons.getPersonByRdfId('http://edrn.nci.nih.gov/data/other-person/1'))
+        siteId = persons.intern('http://edrn.nci.nih.gov/data/sites/1')
+        self.assertTrue(persons.getPersonByUid('crichton').siteId is siteId)
+    def testNoUsers(self):
+        '''Make sure there are people to load.'''
+        self.assertRaises(ValueError, SourceLoader().load, [], [self._data('sites.rdf')])
+        self.assertRaises(ValueError, SourceLoader, workers=0)
+
+
+class EntityStoreTest(unittest.TestCase):
+    '''Test the SQLite store of parsed entities.'''
+    def setUp(self):
+        super(EntityStoreTest, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        data = lambda name: 'file:' + pkg_resources.resource_filename(__name__, 'data/' + name)
+        self.persons, self.sites, self.committees = SourceLoader().load([data('users.rdf'), data('more-users.rdf')],
+            [data('sites.rdf')], [data('committees.rdf')])
+        self.store = EntityStore(os.path.join(self.directory, 'store.db'))
+        self.store.save(self.persons, self.sites, self.committees, [(data('users.rdf'), 'person')])
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.directory)
+        super(EntityStoreTest, self).tearDown()
+    def _summary(self, persons, sites, committees):
+        return ([(i.rdfId, i.uid, i.siteId, i.email, i.firstname, i.lastname, i.phone) for i in persons],
+            [(i.id, i.abbrevName, i.title, i.pi and i.pi.uid, [j.uid for j in i.staffList]) for i in sites],
+            [(i.id, i.title, i.groupType, [j.uid for j in i.staffList]) for i in committees])
+    def testLoad(self):
+        '''Check that what's loaded from the store is what was saved, merged RDF ids and all.'''
+        persons, sites, committees = self.store.load()
+        self.assertEqual(self._summary(self.persons, self.sites, self.committees),
+            self._summary(persons, sites, committees))
+        self.assertTrue(persons.getPersonByRdfId(u'http://edrn.nci.nih.gov/data/other-person/1') is
+            persons.getPersonByUid('hkincaid'))
+        self.assertTrue(sites[0].pi is persons.getPersonByRdfId(sites[0].pi.rdfId))
+        self.assertEqual((4, 2, len(self.committees)), self.store.counts())
+    def testQueries(self):
+        '''Try looking people, sites, and committees up.'''
+        self.assertEqual('Kincaid', self.store.person('HKincaid').lastname)
+        self.assertEqual('hkincaid', self.store.personByRdfId(u'http://edrn.nci.nih.gov/data/other-person/1').uid)
+        self.assertEqual(None, self.store.person('nobody'))
+        self.assertEqual(['crichton'], [i.uid for i in self.store.findPeople(u'richt')])
+        [jpl] = [i for i in self.sites if i.abbrevName == 'JPL']
+        self.assertEqual([i.uid for i in jpl.staffList], [i.uid for i in self.store.site('jpl').staffList])
+        self.assertEqual(jpl.pi.uid, self.store.site(jpl.title).pi.uid)
+        for uid in ('mattmann', 'hkincaid'):
+            self.assertEqual(sorted(i.id for i in self.sites if uid in [j.uid for j in i.staffList] or
+                (i.pi and i.pi.uid == uid)), sorted(i.id for i in self.store.sitesOf(uid)))
+            self.assertEqual(sorted(i.id for i in self.committees if uid in [j.uid for j in i.staffList]),
+                sorted(i.id for i in self.store.committeesOf(uid)))
+        self.assertEqual(self.committees[0].title, self.store.committee(self.committees[0].id).title)
+    def testReplace(self):
+        '''Make sure saving again replaces everything.'''
+        self.store.save(self.persons[:1])
+        self.assertEqual((1, 0, 0), self.store.counts())
+        self.assertEqual([], self.store.sources())
+
+
+class CorpusTest(unittest.TestCase):
+    '''Test generating synthetic DMCC RDF.'''
+    def setUp(self):
+        super(CorpusTest, self).setUp()
+        self.directory = tempfile.mkdtemp()
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        super(CorpusTest, self).tearDown()
+    def testGenerate(self):
+        '''Check that a generated corpus parses into linked people, sites, and committees, the same each time.'''
+        users, sites, committees = generateCorpus(self.directory, 500, sites=20, committees=8, seed=3)
+        persons = RDFPersonList(users)
+        self.assertEqual(500, len(persons))
+        siteList = RDFSiteList(sites, persons)
+        self.assertEqual(20, len(siteList))
+        self.assertEqual(500, sum(len(i.staffList) for i in siteList))
+        self.assertTrue(all(i.pi is None or i.pi in i.staffList for i in siteList))
+        groups = RDFCollaborativeGroupList(committees, persons)
+        self.assertEqual(8, len(groups))
+        self.assertEqual(2, len([i for i in groups if i.groupType == 'Collaborative Group']))
+        self.assertTrue(all(len(i.staffList) >= 3 for i in groups))
+        with open(users, 'rb') as f:
+            first = f.read()
+        generateCorpus(self.directory, 500, sites=20, committees=8, seed=3)
+        with open(users, 'rb') as f:
+            self.assertEqual(first, f.read())
+        self.assertRaises(ValueError, generateCorpus, self.directory, 0)
+
+
+class _DictEntity(object):
+    '''An entity with attributes in a ``__dict__``, the way records were stored before they had slots.'''
+    def __init__(self, **attributes):
+        self.__dict__.update(attributes)
+
+
+def _copy(value):
+    # A distinct but equal unicode string, as each parsed entity used to get
+    return (u' ' + value)[1:] if isinstance(value, basestring) else value
+
+
+def _footprint(entities):
+    '''Estimate the bytes taken by ``entities``: each object, its ``__dict__`` or staff container, and every
+    string it refers to, counting shared strings once.'''
+    total, seen = 0, set()
+    for entity in entities:
+        total += sys.getsizeof(entity)
+        if hasattr(entity, '__dict__'):
+            total += sys.getsizeof(entity.__dict__)
+            values = entity.__dict__.values()
+        else:
+            values = [getattr(entity, name) for name in entity.__slots__]
+        for value in values:
+            if isinstance(value, basestring) and id(value) not in seen:
+                seen.add(id(value))
+                total += sys.getsizeof(value)
+            elif isinstance(value, (list, tuple, set, frozenset)):
+                total += sys.getsizeof(value)
+    return total
+
+
+class CompactRecordTest(unittest.TestCase):
+    '''Compare the memory taken by slotted, interned entities with plain ``__dict__`` ones.'''
+    def _profile(self, name):
+        return 'file:' + pkg_resources.resource_filename('edrn.sync', 'profiles/default/rdf/' + name)
+    def testInterning(self):
+        '''Check that repeated ids are stored once across people, sites, and committees.'''
+        persons = RDFPersonList(self._profile('dmcc-users.rdf'))
+        sites = RDFSiteList(self._profile('dmcc-sites.rdf'), persons)
+        groups = RDFCollaborativeGroupList(self._profile('dmcc-committes.rdf'), persons)
+        self.assertTrue(sites.strings is persons.strings and groups.strings is persons.strings)
+        bySite = {}
+        for person in persons:
+            if person.siteId: bySite.setdefault(person.siteId, set()).add(id(person.siteId))
+        self.assertTrue(any(len(i) == 1 for i in bySite.itervalues()))
+        self.assertTrue(all(len(i) == 1 for i in bySite.itervalues()))
+        site = [i for i in sites if i.id in bySite][0]
+        self.assertTrue(site.id is persons.intern(site.id))
+        self.assertFalse(hasattr(persons[0], '__dict__'))
+    def testMemoryPerEntity(self):
+        '''Measure memory per entity of a full users, sites, and committees load before and after.'''
+        persons = RDFPersonList(self._profile('dmcc-users.rdf'))
+        sites = RDFSiteList(self._profile('dmcc-sites.rdf'), persons)
+        groups = RDFCollaborativeGroupList(self._profile('dmcc-committes.rdf'), persons)
+        compact = list(persons) + list(sites) + list(groups)
+        before = [_DictEntity(**dict((name, _copy(getattr(p, name))) for name in p.__slots__)) for p in persons]
+        before += [_DictEntity(id=_copy(i.id), abbrevName=_copy(i.abbrevName), staffList=list(i.staffList),
+            title=_copy(i.title), pi=i.pi, program=_copy(i.program), memberType=_copy(i.memberType)) for i in sites]
+        before += [_DictEntity(id=_copy(i.id), title=_copy(i.title), staffList=set(i.staffList),
+            groupType=_copy(i.groupType)) for i in groups]
+        perEntityBefore = _footprint(before) / float(len(before))
+        perEntityAfter = _footprint(compact) / float(len(compact))
+        self.assertTrue(perEntityAfter * 3 < perEntityBefore,
+            u'Expected a third or less, got %.0f bytes per entity before and %.0f after' % (perEntityBefore,
+            perEntityAfter))
+
+
 def test_suite():
     return unittest.TestSuite([
         unittest.makeSuite(RDFPersonListTest),
         unittest.makeSuite(RDFSiteListTest),
         unittest.makeSuite(RDFCollaborativeGroupListTest),
+        unittest.makeSuite(RDFEngineTest),
+        unittest.makeSuite(RDFFormatTest),
+        unittest.makeSuite(SourceCacheTest),
+        unittest.makeSuite(CompactRecordTest),
+        unittest.makeSuite(SourceLoaderTest),
+        unittest.makeSuite(CorpusTest),
+        unittest.makeSuite(EntityStoreTest),
     ])
 
 if __name__ == '__main__':
@@ -6,8 +6,25 @@ u'''EDRN Sync Services - unit tests for functions.'''
 
 import unittest2 as unittest
 import ldap
-import edrn.sync.syncldap
+from ldap.controls import SimplePagedResultsControl
+import edrn.sync.syncldap, edrn.sync.dmccsync, edrn.sync.dmccmakegroups, edrn.sync.ldapwriter, edrn.sync.oldpasswords
+import base64, crypt, hashlib, json, os.path, shutil, StringIO, tempfile, time
+from edrn.sync.rdf import RDFPerson
+from edrn.sync.ldapwriter import PipelinedWriter, Throttle
+from edrn.sync.passwordaudit import PasswordAuditor
+from edrn.sync.memoryldap import MemoryDirectory, installedServers
+from edrn.sync.changefeed import FingerprintState
+from edrn.sync.benchmark import Benchmark, runBenchmark, regressions
+from edrn.sync.corpus import generateCorpus
+from edrn.sync.instrumentation import Metrics, Progress, metrics
+from edrn.sync.journal import Journal, fingerprint, journaling
+from edrn.sync.rdfcache import SourceCache
+from edrn.sync.rdfloader import SourceLoader
+from edrn.sync.shards import shardOf
+from edrn.sync.store import EntityStore
+from edrn.sync.syncall import parseStages, syncAll
 from edrn.sync.utils import generatePassword
+from edrn.sync.watch import Watcher
 
 
 class LDAPFunctionsTest(unittest.TestCase):
@@ -28,6 +45,987 @@ class LDAPFunctionsTest(unittest.TestCase):
         self.assertEqual('(&(cn=erne)(uniquemember=mattmann,dc=edrn,dc=jpl,dc=nasa,dc=gov))', self.lastFilter)
 
 
+class _FakeConnection(object):
+    '''A stand-in for a python-ldap connection that can be made to fail.'''
+    def __init__(self, url):
+        self.url, self.down, self.unbound = url, False, False
+    def simple_bind_s(self, who, cred):
+        self.who = who
+    def search_s(self, base, scope, searchFilter, attrs):
+        if self.down: raise ldap.SERVER_DOWN(dict(info='down'))
+        return []
+    def unbind_s(self):
+        self.unbound = True
+
+
+class ConnectionPoolTest(unittest.TestCase):
+    '''Test pooled LDAP connections.'''
+    def setUp(self):
+        super(ConnectionPoolTest, self).setUp()
+        self.connections = []
+        self.initialize = ldap.initialize
+        def initialize(url):
+            conn = _FakeConnection(url)
+            self.connections.append(conn)
+            return conn
+        ldap.initialize = initialize
+    def tearDown(self):
+        ldap.initialize = self.initialize
+        super(ConnectionPoolTest, self).tearDown()
+    def testReuse(self):
+        '''Ensure many operations share one bind.'''
+        pool = edrn.sync.syncldap.ConnectionPool('ldap://localhost', 'uid=admin,ou=system', 'secret')
+        for i in range(100):
+            pool.run(lambda conn: edrn.sync.syncldap.personExists(conn, 'user%d' % i))
+        self.assertEqual(1, pool.binds)
+        pool.close()
+        self.assertTrue(self.connections[0].unbound)
+    def testRebind(self):
+        '''Check that a connection the server dropped is replaced with a fresh bind.'''
+        pool = edrn.sync.syncldap.ConnectionPool('ldap://localhost', 'uid=admin,ou=system', 'secret')
+        pool.run(lambda conn: edrn.sync.syncldap.personExists(conn, 'mattmann'))
+        self.connections[0].down = True
+        pool.run(lambda conn: edrn.sync.syncldap.personExists(conn, 'mattmann'))
+        self.assertEqual(2, pool.binds)
+        self.assertTrue(self.connections[0].unbound)
+    def testHealthCheck(self):
+        '''See if idle connections are checked and dead ones replaced before reuse.'''
+        pool = edrn.sync.syncldap.ConnectionPool('ldap://localhost', 'uid=admin,ou=system', 'secret', checkAfter=-1)
+        with pool.connection():
+            pass
+        self.connections[0].down = True
+        with pool.connection() as conn:
+            self.assertTrue(conn is self.connections[1])
+        self.assertEqual(2, pool.binds)
+
+
+class _PagedDirectory(object):
+    '''A stand-in for a python-ldap connection holding ``entries`` that it returns in pages.'''
+    def __init__(self, entries):
+        self.entries, self.searches = entries, []
+    def search_ext(self, base, scope, searchFilter, attrs, serverctrls):
+        control = serverctrls[0]
+        wanted = searchFilter[len('(objectClass='):-1].lower()
+        matches = [(dn, dict((k, v) for k, v in e.items() if k in attrs)) for dn, e in self.entries
+            if wanted in [i.lower() for i in e['objectClass']]]
+        start = int(control.cookie or 0)
+        self.searches.append((searchFilter, control.size))
+        self.page = matches[start:start + control.size]
+        self.next = str(start + control.size) if start + control.size < len(matches) else ''
+        return len(self.searches)
+    def result3(self, msgid):
+        control = SimplePagedResultsControl(True, size=0, cookie=self.next)
+        return ldap.RES_SEARCH_RESULT, self.page, msgid, [control]
+
+
+class DirectorySnapshotTest(unittest.TestCase):
+    '''Test the in-memory directory snapshot.'''
+    def setUp(self):
+        super(DirectorySnapshotTest, self).setUp()
+        base = 'dc=edrn,dc=jpl,dc=nasa,dc=gov'
+        entries = [('uid=user%d,%s' % (i, base), dict(objectClass=['edrnPerson'], uid=['user%d' % i]))
+            for i in range(7)]
+        entries.append(('cn=Mattmann JPL,' + base, dict(objectClass=['groupOfUniqueNames'], cn=['Mattmann JPL'],
+            uniquemember=['uid=user1,' + base, 'uid=User2, dc=edrn, dc=jpl, dc=nasa, dc=gov'])))
+        self.directory = _PagedDirectory(entries)
+        self.snapshot = edrn.sync.syncldap.DirectorySnapshot(pageSize=3)
+        self.snapshot.load(self.directory)
+    def testLoad(self):
+        '''Check that everything is read in a few paged searches.'''
+        self.assertEqual(4, len(self.directory.searches))
+        self.assertEqual(7, len(self.snapshot.uids))
+        self.assertTrue(self.snapshot.personExists('USER6'))
+        self.assertFalse(self.snapshot.personExists('user7'))
+        self.assertTrue(self.snapshot.groupExists('mattmann jpl'))
+        self.assertFalse(self.snapshot.groupExists('erne'))
+        self.assertTrue(self.snapshot.memberExists('Mattmann JPL', 'uid=user2'))
+        self.assertFalse(self.snapshot.memberExists('Mattmann JPL', 'uid=user3'))
+    def testWrites(self):
+        '''Ensure the snapshot follows writes made during a run.'''
+        base = 'dc=edrn,dc=jpl,dc=nasa,dc=gov'
+        self.snapshot.addedPerson('user7')
+        self.assertTrue(self.snapshot.personExists('user7'))
+        self.snapshot.addedGroup('erne', 'cn=erne,' + base, ['uid=user7,' + base])
+        self.assertTrue(self.snapshot.memberExists('erne', 'uid=user7'))
+        self.snapshot.addedMembers('Mattmann JPL', ['uid=user3,' + base])
+        self.snapshot.removedMembers('Mattmann JPL', ['uid=user1,' + base])
+        self.assertTrue(self.snapshot.memberExists('Mattmann JPL', 'uid=user3'))
+        self.assertFalse(self.snapshot.memberExists('Mattmann JPL', 'uid=user1'))
+        self.snapshot.refresh(self.directory)
+        self.assertFalse(self.snapshot.personExists('user7'))
+
+
+class _AsyncDirectory(object):
+    '''A stand-in for a python-ldap connection's asynchronous write API that rejects duplicate entries.'''
+    def __init__(self):
+        self.entries, self.outstanding, self.maxOutstanding, self.msgid = {}, {}, 0, 0
+    def _start(self, result):
+        self.msgid += 1
+        self.outstanding[self.msgid] = result
+        self.maxOutstanding = max(self.maxOutstanding, len(self.outstanding))
+        return self.msgid
+    def add_ext(self, dn, modlist):
+        if dn in self.entries:
+            return self._start(ldap.ALREADY_EXISTS(dict(info='Already exists: ' + dn)))
+        self.entries[dn] = modlist
+        return self._start(None)
+    def modify_ext(self, dn, modlist):
+        return self._start(None if dn in self.entries else ldap.NO_SUCH_OBJECT(dict(info='No such: ' + dn)))
+    def delete_ext(self, dn):
+        if dn not in self.entries: return self._start(ldap.NO_SUCH_OBJECT(dict(info='No such: ' + dn)))
+        del self.entries[dn]
+        return self._start(None)
+    def result3(self, msgid):
+        error = self.outstanding.pop(msgid)
+        if error is not None: raise error
+        return ldap.RES_ADD, [], msgid, []
+
+
+class _RefusingDirectory(_AsyncDirectory):
+    '''An asynchronous directory whose adds of ``uid=refuse`` raise ``error`` as they're sent.'''
+    def __init__(self, error):
+        super(_RefusingDirectory, self).__init__()
+        self.error = error
+    def add_ext(self, dn, modlist):
+        if dn == 'uid=refuse': raise self.error(dict(info='Refused'))
+        return super(_RefusingDirectory, self).add_ext(dn, modlist)
+
+
+class PipelinedWriterTest(unittest.TestCase):
+    '''Test pipelined LDAP writes.'''
+    def testWindow(self):
+        '''Ensure no more than the window of operations is ever in flight and every result is reported.'''
+        directory, results = _AsyncDirectory(), []
+        writer = PipelinedWriter(directory, window=4)
+        for i in range(20):
+            writer.add('uid=user%d' % i, [], lambda dn, error: results.append((dn, error)))
+        writer.add('uid=user3', [], lambda dn, error: results.append((dn, error)))
+        writer.modify('uid=nobody', [], lambda dn, error: results.append((dn, error)))
+        writer.flush()
+        self.assertEqual(4, directory.maxOutstanding)
+        self.assertEqual(0, writer.pending())
+        self.assertEqual((20, 2), (writer.succeeded, writer.failed))
+        self.assertEqual(22, len(results))
+        failures = [(dn, type(error)) for dn, error in results if error is not None]
+        self.assertEqual([('uid=user3', ldap.ALREADY_EXISTS), ('uid=nobody', ldap.NO_SUCH_OBJECT)], failures)
+    def testBadWindow(self):
+        '''Make sure a window smaller than one is rejected.'''
+        self.assertRaises(ValueError, PipelinedWriter, _AsyncDirectory(), 0)
+    def testRefusedOnSending(self):
+        '''Operations refused as they're sent are answered for, and the ones in flight still get their results.'''
+        directory, results = _RefusingDirectory(ldap.UNWILLING_TO_PERFORM), []
+        writer = PipelinedWriter(directory, window=4)
+        for dn in ('uid=a', 'uid=refuse', 'uid=b'):
+            writer.add(dn, [], lambda dn, error: results.append((dn, type(error) if error else None)))
+        writer.flush()
+        self.assertEqual([('uid=refuse', ldap.UNWILLING_TO_PERFORM), ('uid=a', None), ('uid=b', None)], results)
+        self.assertEqual((2, 1), (writer.succeeded, writer.failed))
+        directory, results = _RefusingDirectory(ValueError), []
+        writer = PipelinedWriter(directory, window=4)
+        writer.add('uid=a', [], lambda dn, error: results.append(dn))
+        self.assertRaises(ValueError, writer.add, 'uid=refuse', [])
+        self.assertEqual((['uid=a'], 0), (results, writer.pending()))
+        directory = _RefusingDirectory(ldap.SERVER_DOWN)
+        writer = PipelinedWriter(directory, window=4)
+        writer.add('uid=a', [])
+        self.assertRaises(ldap.SERVER_DOWN, writer.add, 'uid=refuse', [])
+        self.assertEqual(0, writer.pending())
+
+
+class _BusyDirectory(_AsyncDirectory):
+    '''An asynchronous directory that answers busy to the first ``busy`` operations.'''
+    def __init__(self, busy):
+        super(_BusyDirectory, self).__init__()
+        self.busy = busy
+    def add_ext(self, dn, modlist):
+        if self.busy > 0:
+            self.busy -= 1
+            return self._start(ldap.BUSY(dict(info='Busy')))
+        return super(_BusyDirectory, self).add_ext(dn, modlist)
+
+
+class ThrottleTest(unittest.TestCase):
+    '''Test adapting the window of LDAP writes to the server.'''
+    def setUp(self):
+        super(ThrottleTest, self).setUp()
+        self.firstBackoff = edrn.sync.ldapwriter._firstBackoff
+        edrn.sync.ldapwriter._firstBackoff = 0.001
+        self.throttle = Throttle()
+    def tearDown(self):
+        edrn.sync.ldapwriter._firstBackoff = self.firstBackoff
+        super(ThrottleTest, self).tearDown()
+    def testLeftAlone(self):
+        '''An unconfigured throttle leaves the window as it is.'''
+        self.assertEqual(7, self.throttle.window(7))
+        self.assertFalse(self.throttle.failed(0.01, ldap.BUSY({})))
+    def testWindow(self):
+        '''Check the window starts at one, widens while replies are quick, and narrows when they're slow.'''
+        self.throttle.configure(maxLatency=0.1)
+        self.assertEqual(1, self.throttle.window(8))
+        for i in range(3): self.throttle.succeeded(0.01)
+        self.assertEqual(4, self.throttle.window(8))
+        for i in range(10): self.throttle.succeeded(0.01)
+        self.assertEqual(8, self.throttle.window(8))
+        self.throttle.succeeded(0.5)
+        self.assertEqual(6, self.throttle.window(8))
+        for i in range(5): self.throttle.succeeded(0.5)
+        self.assertEqual(6, self.throttle.window(8))
+        self.throttle.succeeded(0.5)
+        self.assertEqual(4, self.throttle.window(8))
+        self.assertTrue(self.throttle.failed(0.01, ldap.BUSY({})))
+        self.assertEqual(2, self.throttle.window(8))
+        self.assertFalse(self.throttle.failed(0.01, ldap.NO_SUCH_OBJECT({})))
+    def testAutomaticTarget(self):
+        '''Without a target, aim for a few times the quickest round trip, but no less than the floor.'''
+        self.throttle.configure()
+        self.throttle.succeeded(0.001)
+        self.assertEqual(edrn.sync.ldapwriter._latencyFloor, self.throttle.target())
+        self.throttle.succeeded(0.1)
+        self.throttle.configure()
+        self.throttle.succeeded(0.1)
+        self.assertAlmostEqual(0.4, self.throttle.target())
+    def testRetries(self):
+        '''See writes turned away as busy sent again, and a server that stays busy give up eventually.'''
+        directory, results = _BusyDirectory(3), []
+        with self.throttle.limiting(out=StringIO.StringIO()):
+            writer = PipelinedWriter(directory, 4, self.throttle)
+            for i in range(10):
+                writer.add('uid=user%d' % i, [], lambda dn, error: results.append((dn, error)))
+            writer.flush()
+        self.assertEqual(10, len(directory.entries))
+        self.assertEqual((10, 0), (writer.succeeded, writer.failed))
+        self.assertEqual(3, self.throttle.retries)
+        self.assertEqual(0, writer.pending())
+        directory, results = _BusyDirectory(100), []
+        with self.throttle.limiting(out=StringIO.StringIO()):
+            writer = PipelinedWriter(directory, 4, self.throttle)
+            writer.add('uid=user0', [], lambda dn, error: results.append((dn, error)))
+            writer.flush()
+        self.assertEqual([ldap.BUSY], [type(error) for dn, error in results])
+        self.assertEqual(edrn.sync.ldapwriter._maxRetries, self.throttle.retries)
+    def testRate(self):
+        '''Check a rate ceiling spaces writes out and the summary reports them.'''
+        out = StringIO.StringIO()
+        start = time.time()
+        with self.throttle.limiting(rate=200, out=out):
+            writer = PipelinedWriter(_AsyncDirectory(), 10, self.throttle)
+            for i in range(21):
+                writer.add('uid=user%d' % i, [])
+            writer.flush()
+        self.assertTrue(time.time() - start >= 0.095)
+        self.assertTrue(out.getvalue().startswith('LDAP writes: 21 in '))
+        self.assertFalse(self.throttle.enabled)
+
+
+class ReconcileTest(unittest.TestCase):
+    '''Test planning the changes that reconcile the directory with the RDF.'''
+    def setUp(self):
+        super(ReconcileTest, self).setUp()
+        base = 'dc=edrn,dc=jpl,dc=nasa,dc=gov'
+        self.snapshot = edrn.sync.syncldap.DirectorySnapshot(personAttributes=('cn', 'mail', 'telephoneNumber', 'sn'))
+        for uid, first, last, mail in (('same', 'Sam', 'Same', 'same@x.com'), ('moved', 'Mo', 'Ved', 'old@x.com'),
+            ('gone', 'Gon', 'E', 'gone@x.com')):
+            self.snapshot.addedPerson(uid, 'uid=%s,%s' % (uid, base), dict(cn=first + ' ' + last, mail=mail,
+                telephoneNumber='626-555-1212', sn=last))
+        self.persons = [
+            RDFPerson('urn:1', 'urn:site', 'same@x.com', 'same', 'Sam', 'Same', '626-555-1212'),
+            RDFPerson('urn:2', 'urn:site', 'new@x.com', 'moved', 'Mo', 'Ved', '626-555-1212'),
+            RDFPerson('urn:3', 'urn:site', 'fresh@x.com', 'fresh', 'Fre', 'Sh', '626-555-1212'),
+        ]
+    def testPlan(self):
+        '''Check that only missing people are added and only changed attributes are modified.'''
+        changes = edrn.sync.dmccsync.planChanges(self.persons, self.snapshot)
+        self.assertEqual(['fresh'], [uid for uid, dn, attrs in changes.adds])
+        self.assertEqual([('moved', [(ldap.MOD_REPLACE, 'mail', ['new@x.com'])])],
+            [(uid, mods) for uid, dn, mods in changes.modifies])
+        self.assertEqual([], changes.deletes)
+        self.assertEqual(2, len(changes))
+    def testDeprovision(self):
+        '''Ensure people gone from the RDF are deleted only when asked.'''
+        changes = edrn.sync.dmccsync.planChanges(self.persons, self.snapshot, deprovision=True)
+        self.assertEqual([('gone', 'uid=gone,dc=edrn,dc=jpl,dc=nasa,dc=gov')], changes.deletes)
+    def testApply(self):
+        '''See if applying a plan leaves nothing more to do.'''
+        changes = edrn.sync.dmccsync.planChanges(self.persons, self.snapshot, deprovision=True)
+        directory = _AsyncDirectory()
+        directory.entries.update((dn, []) for dn, attrs in self.snapshot.people.values())
+        writer = PipelinedWriter(directory)
+        done = edrn.sync.dmccsync.applyChanges(changes, writer, self.snapshot)
+        writer.flush()
+        self.assertEqual(3, done[0])
+        self.assertEqual(0, len(edrn.sync.dmccsync.planChanges(self.persons, self.snapshot, deprovision=True)))
+    def testPasswords(self):
+        '''Only people to be added get a new password.'''
+        changes = edrn.sync.dmccsync.planChanges(self.persons, self.snapshot)
+        self.assertTrue(all('userPassword' in attrs for uid, dn, attrs in changes.adds))
+        self.assertEqual([], [mods for uid, dn, mods in changes.modifies if 'userPassword' in [m[1] for m in mods]])
+    def testReconnect(self):
+        '''After the server goes away part way, only what it hasn't done is sent again.'''
+        tmpdir = tempfile.mkdtemp()
+        try:
+            persons = SourceLoader().loadPersons([generateCorpus(tmpdir, 20)[0]])
+        finally:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+        metrics.reset()
+        directory = _FlakyDirectory(5)
+        with directory.installed():
+            changes = edrn.sync.dmccsync.reconcile(persons, 'ldap://localhost', 'admin', 'secret')
+        self.assertEqual(20, len(changes.adds))
+        self.assertEqual(1, metrics.get('ldap_reconnects'))
+        self.assertEqual(1, metrics.total('ldap_errors'))
+        self.assertEqual(20, len(directory.search('dc=edrn,dc=jpl,dc=nasa,dc=gov', ldap.SCOPE_ONELEVEL,
+            '(objectClass=edrnPerson)', ['1.1'])))
+
+
+class _RecordingWriter(object):
+    '''A stand-in for a ``PipelinedWriter`` that just remembers what it was asked to do.'''
+    def __init__(self):
+        self.adds, self.modifies = [], []
+    def add(self, dn, modlist, callback=None):
+        self.adds.append(dn)
+    def modify(self, dn, modlist, callback=None):
+        self.modifies.append(modlist)
+        if callback: callback(dn, None)
+
+
+class GroupMembershipTest(unittest.TestCase):
+    '''Test incremental group membership updates.'''
+    def setUp(self):
+        super(GroupMembershipTest, self).setUp()
+        self.base = 'dc=edrn,dc=jpl,dc=nasa,dc=gov'
+        self.snapshot = edrn.sync.syncldap.DirectorySnapshot()
+        self.snapshot.addedGroup('Mattmann JPL', 'cn=Mattmann JPL,' + self.base,
+            ['uid=mattmann,' + self.base, 'uid=Manual, dc=edrn, dc=jpl, dc=nasa, dc=gov'])
+    def _staff(self, *uids):
+        return [RDFPerson('urn:' + uid, 'urn:site', None, uid, uid, uid, None) for uid in uids]
+    def testMemberChanges(self):
+        '''Check that only the difference is computed, and hand-added members are kept unless pruning.'''
+        current = self.snapshot.getMembers('Mattmann JPL')
+        desired = ['uid=MATTMANN,' + self.base, 'uid=pramirez,' + self.base, 'uid=pramirez,' + self.base]
+        self.assertEqual((['uid=pramirez,' + self.base], []), edrn.sync.dmccmakegroups.memberChanges(current, desired))
+        self.assertEqual((['uid=pramirez,' + self.base], ['uid=Manual, dc=edrn, dc=jpl, dc=nasa, dc=gov']),
+            edrn.sync.dmccmakegroups.memberChanges(current, desired, prune=True))
+    def testUnchangedGroup(self):
+        '''Ensure a group whose members are already right isn't written at all.'''
+        writer = _RecordingWriter()
+        edrn.sync.dmccmakegroups._addGroup(writer, 'Mattmann JPL', self._staff('mattmann'), self.snapshot)
+        self.assertEqual(([], []), (writer.adds, writer.modifies))
+    def testChunks(self):
+        '''See if a big membership change is split into chunks of adds.'''
+        writer = _RecordingWriter()
+        uids = ['user%d' % i for i in range(2500)]
+        edrn.sync.dmccmakegroups._addGroup(writer, 'Mattmann JPL', self._staff(*uids), self.snapshot)
+        self.assertEqual([1000, 1000, 500], [len(mods[0][2]) for mods in writer.modifies])
+        self.assertEqual(set([ldap.MOD_ADD]), set(mods[0][0] for mods in writer.modifies))
+        self.assertTrue(self.snapshot.memberExists('Mattmann JPL', 'uid=user2499'))
+
+
+class _PasswordDirectory(_PagedDirectory):
+    '''A paged stand-in directory that also accepts binds and password changes.'''
+    def __init__(self, entries):
+        super(_PasswordDirectory, self).__init__(entries)
+        self.modified = []
+    def bind_s(self, who, cred):
+        pass
+    def modify_s(self, dn, modlist):
+        self.modified.append(dn)
+    def unbind_s(self):
+        pass
+
+
+class OldPasswordsTest(unittest.TestCase):
+    '''Test finding and fixing weak passwords.'''
+    def setUp(self):
+        super(OldPasswordsTest, self).setUp()
+        weak = '{SHA}' + hashlib.sha1('changeme').digest().encode('base64').strip()
+        strong = '{SHA}' + hashlib.sha1('s3cr3t!').digest().encode('base64').strip()
+        self.directory = _PasswordDirectory([('uid=user%d,dc=edrn,dc=jpl,dc=nasa,dc=gov' % i,
+            dict(objectClass=['edrnPerson'], uid=['user%d' % i], userPassword=[weak if i % 3 == 0 else strong]))
+            for i in range(10)])
+        self.initialize = ldap.initialize
+        ldap.initialize = lambda url: self.directory
+    def tearDown(self):
+        ldap.initialize = self.initialize
+        super(OldPasswordsTest, self).tearDown()
+    def testPagedScan(self):
+        '''Check that users are read a page at a time, with only their passwords, and weak ones get fixed.'''
+        edrn.sync.oldpasswords.fixPasswords('uid=admin,ou=system', 'secret', 'ldap://localhost',
+            '(objectClass=edrnPerson)', ldap.SCOPE_ONELEVEL, 'dc=edrn,dc=jpl,dc=nasa,dc=gov', pageSize=4, processes=0)
+        self.assertEqual([('(objectClass=edrnPerson)', 4)] * 3, self.directory.searches)
+        self.assertEqual(['uid=user%d,dc=edrn,dc=jpl,dc=nasa,dc=gov' % i for i in (0, 3, 6, 9)],
+            self.directory.modified)
+
+
+def _saltedHash(scheme, hashFunction, password, salt):
+    return '{%s}' % scheme + base64.b64encode(hashFunction(password + salt).digest() + salt)
+
+
+def _pbkdf2Hash(scheme, digest, password, salt, iterations):
+    ab64 = lambda data: base64.b64encode(data).rstrip('=').replace('+', '.')
+    raw = hashlib.pbkdf2_hmac(digest, password, salt, iterations)
+    return '{%s}%d$%s$%s' % (scheme, iterations, ab64(salt), ab64(raw))
+
+
+class PasswordAuditorTest(unittest.TestCase):
+    '''Test checking password hashes of many schemes against weak passwords.'''
+    def setUp(self):
+        super(PasswordAuditorTest, self).setUp()
+        self.weakPasswords = ['changeme', 'password', 'edrn']
+        entries, self.expected = [], []
+        for i, password in enumerate(['changeme', 'Tr0ub4dor&3', 'edrn', 's3cr3t!', 'password']):
+            salt = 'salt%04d' % i
+            for scheme, hashed in (
+                ('SHA', '{SHA}' + base64.b64encode(hashlib.sha1(password).digest())),
+                ('SHA512', '{SHA512}' + base64.b64encode(hashlib.sha512(password).digest())),
+                ('SMD5', _saltedHash('SMD5', hashlib.md5, password, salt)),
+                ('SSHA', _saltedHash('SSHA', hashlib.sha1, password, salt)),
+                ('SSHA256', _saltedHash('SSHA256', hashlib.sha256, password, salt)),
+                ('PBKDF2-SHA256', _pbkdf2Hash('PBKDF2-SHA256', 'sha256', password, salt, 100)),
+                ('CRYPT', '{CRYPT}' + crypt.crypt(password, '$6$%s$' % salt))):
+                dn = 'uid=%s-%d,dc=edrn' % (scheme, i)
+                entries.append((dn, hashed))
+                if password in self.weakPasswords: self.expected.append(dn)
+        entries.append(('uid=unknown,dc=edrn', '{FOO}bar'))
+        entries.append(('uid=malformed,dc=edrn', '{SSHA}not base64!'))
+        self.entries = entries
+    def testInline(self):
+        '''Check that weak passwords are found without worker processes.'''
+        auditor = PasswordAuditor(self.weakPasswords, processes=0)
+        self.assertEqual(sorted(self.expected), sorted(auditor.audit(self.entries)))
+        self.assertEqual(5, auditor.checked['SSHA256'])
+        self.assertEqual(0, auditor.checked['FOO'])
+    def testPool(self):
+        '''Check that worker processes find the same weak passwords.'''
+        auditor = PasswordAuditor(self.weakPasswords, processes=2)
+        self.assertEqual(sorted(self.expected * 50), sorted(auditor.audit(self.entries * 50)))
+        self.assertEqual(250, auditor.checked['PBKDF2-SHA256'])
+    def testNoPasswords(self):
+        '''Make sure there's something to look for.'''
+        self.assertRaises(ValueError, PasswordAuditor, [])
+
+
+class MemoryDirectoryTest(unittest.TestCase):
+    '''Test the in-memory LDAP stand-in.'''
+    def setUp(self):
+        super(MemoryDirectoryTest, self).setUp()
+        self.directory = MemoryDirectory()
+        self.conn = self.directory.initialize('ldap://localhost')
+        for i in range(7):
+            self.conn.add_s('uid=user%d,dc=edrn,dc=jpl,dc=nasa,dc=gov' % i, [('objectClass', ['edrnPerson']),
+                ('uid', 'user%d' % i), ('mail', 'user%d@example.com' % i)])
+        self.conn.add_s('cn=Group,dc=edrn,dc=jpl,dc=nasa,dc=gov', [('objectClass', ['groupOfUniqueNames']),
+            ('cn', ['Group']), ('uniquemember', ['uid=user1,dc=edrn,dc=jpl,dc=nasa,dc=gov'])])
+    def testSearch(self):
+        '''Check filters, scopes, and attribute selection.'''
+        base = 'dc=edrn,dc=jpl,dc=nasa,dc=gov'
+        self.assertEqual(7, len(self.conn.search_s(base, ldap.SCOPE_ONELEVEL, '(objectClass=EDRNPERSON)')))
+        self.assertEqual([('uid=user3,dc=edrn,dc=jpl,dc=nasa,dc=gov', {'uid': ['user3']})],
+            self.conn.search_s(base, ldap.SCOPE_ONELEVEL, '(uid=user3)', ['UID']))
+        self.assertEqual(1, len(self.conn.search_s(base, ldap.SCOPE_SUBTREE,
+            '(&(cn=group)(uniquemember=UID=user1, dc=edrn,dc=jpl,dc=nasa,dc=gov))')))
+        self.assertEqual(2, len(self.conn.search_s(base, ldap.SCOPE_ONELEVEL, '(|(uid=user1)(mail=user2@*))')))
+        self.assertEqual(6, len(self.conn.search_s(base, ldap.SCOPE_ONELEVEL, '(&(uid=*)(!(uid=user0)))')))
+        self.assertEqual([], self.conn.search_s('uid=user0,' + base, ldap.SCOPE_ONELEVEL, '(objectClass=*)'))
+        self.assertRaises(ldap.FILTER_ERROR, self.conn.search_s, base, ldap.SCOPE_ONELEVEL, 'uid=user0')
+    def testPagedSearch(self):
+        '''See if paged searches come back a page per request.'''
+        before = self.directory.requests['search']
+        found = list(edrn.sync.syncldap.pagedSearch(self.conn, 'dc=edrn,dc=jpl,dc=nasa,dc=gov', ldap.SCOPE_ONELEVEL,
+            '(objectClass=edrnPerson)', ['uid'], 3))
+        self.assertEqual(['user%d' % i for i in range(7)], [attrs['uid'][0] for dn, attrs in found])
+        self.assertEqual(3, self.directory.requests['search'] - before)
+    def testWrites(self):
+        '''Make sure writes behave as a server's would, including the errors.'''
+        dn = 'uid=user1,dc=edrn,dc=jpl,dc=nasa,dc=gov'
+        self.assertRaises(ldap.ALREADY_EXISTS, self.conn.add_s, dn.upper(), [('uid', 'user1')])
+        self.conn.modify_s(dn, [(ldap.MOD_REPLACE, 'mail', ['new@example.com']), (ldap.MOD_ADD, 'cn', ['One'])])
+        self.assertEqual(['new@example.com'], self.directory.get(dn)['mail'])
+        self.assertRaises(ldap.TYPE_OR_VALUE_EXISTS, self.conn.modify_s, dn, [(ldap.MOD_ADD, 'cn', ['ONE'])])
+        self.assertRaises(ldap.NO_SUCH_ATTRIBUTE, self.conn.modify_s, dn, [(ldap.MOD_DELETE, 'sn', None)])
+        # A failed modify changes nothing
+        self.assertRaises(ldap.NO_SUCH_ATTRIBUTE, self.conn.modify_s, dn, [(ldap.MOD_DELETE, 'cn', None),
+            (ldap.MOD_DELETE, 'sn', None)])
+        self.assertEqual(['One'], self.directory.get(dn)['cn'])
+        writer = PipelinedWriter(self.conn, 2)
+        errors = []
+        writer.delete(dn, lambda dn, error: errors.append(error))
+        writer.delete(dn, lambda dn, error: errors.append(error))
+        writer.flush()
+        self.assertEqual(None, errors[0])
+        self.assertTrue(isinstance(errors[1], ldap.NO_SUCH_OBJECT))
+        self.assertEqual(None, self.directory.get(dn))
+    def testSync(self):
+        '''Run the sync tools against the stand-in from end to end on a small synthetic corpus.'''
+        results = runBenchmark(people=60, processes=0)
+        self.assertEqual(['generate'] + list(Benchmark.phases), [r.name for r in results])
+        byName = dict((r.name, r) for r in results)
+        self.assertEqual(60, byName['sync'].items)
+        self.assertEqual(60, byName['sync'].requests['add'])
+        self.assertEqual(0, byName['resync'].requests.get('add', 0))
+        self.assertEqual(1, byName['reconcile'].items)
+        self.assertEqual(0, byName['regroup'].requests.get('modify', 0) + byName['regroup'].requests.get('add', 0))
+        self.assertTrue(byName['passwords'].requests.get('modify', 0) > 0)
+        self.assertEqual([], regressions(results, [r.asDict() for r in results]))
+        slower = [dict(r.asDict(), rate=r.rate() * 2, roundTrips=r.roundTrips()) for r in results]
+        self.assertEqual(len(results), len(regressions(results, slower)))
+
+
+class MetricsTest(unittest.TestCase):
+    '''Test counting, timing, and reporting on sync runs.'''
+    def setUp(self):
+        super(MetricsTest, self).setUp()
+        self.tmpdir = tempfile.mkdtemp()
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+        super(MetricsTest, self).tearDown()
+    def testSummaries(self):
+        '''See if counters, histograms, and phases come out as JSON and in the Prometheus format.'''
+        m = Metrics()
+        m.count('ldap_requests', op='add')
+        m.count('ldap_requests', 2, op='add')
+        m.observe('ldap_round_trip_seconds', 0.003, op='add')
+        m.observe('ldap_round_trip_seconds', 20.0, op='add')
+        m.addTime('parse', 1.5)
+        with m.timing('parse'):
+            pass
+        self.assertEqual(3, m.get('ldap_requests', op='add'))
+        summary = m.asDict('dmccsync')
+        self.assertTrue(summary['phases']['parse'] >= 1.5)
+        histogram = summary['histograms'][0]
+        self.assertEqual(2, histogram['count'])
+        self.assertEqual([0.0025, 0], histogram['buckets'][2])
+        self.assertEqual([0.005, 1], histogram['buckets'][3])
+        self.assertEqual(1, histogram['buckets'][-1][1])
+        text = m.prometheus('dmccsync')
+        self.assertTrue('# TYPE edrn_sync_ldap_requests_total counter' in text)
+        self.assertTrue('edrn_sync_ldap_requests_total{op="add",tool="dmccsync"} 3\n' in text)
+        self.assertTrue('edrn_sync_ldap_round_trip_seconds_bucket{le="0.005",op="add",tool="dmccsync"} 1\n' in text)
+        self.assertTrue('edrn_sync_ldap_round_trip_seconds_bucket{le="+Inf",op="add",tool="dmccsync"} 2\n' in text)
+        self.assertTrue('edrn_sync_phase_seconds{phase="parse",tool="dmccsync"}' in text)
+    def testProgress(self):
+        '''Check the progress line shows the rate and, with a total, how long is left.'''
+        out = StringIO.StringIO()
+        progress = Progress(u'people', 100, out=out)
+        progress.started -= 10
+        progress.advance(50)
+        self.assertTrue(u'people: 50/100 (50%)' in out.getvalue())
+        self.assertTrue(u'ETA 0:00:10' in out.getvalue())
+        progress.finish()
+        self.assertTrue(out.getvalue().endswith(u'\n'))
+        quiet = StringIO.StringIO()
+        progress = Progress(u'people', enabled=False, out=quiet)
+        progress.advance()
+        progress.finish()
+        self.assertEqual(u'', quiet.getvalue())
+    def testRuns(self):
+        '''Run the sync tools and make sure their summaries count what they did.'''
+        users, sites, committees = generateCorpus(os.path.join(self.tmpdir, 'corpus'), 40)
+        directory = MemoryDirectory()
+        summary, textfile = os.path.join(self.tmpdir, 'sync.json'), os.path.join(self.tmpdir, 'groups.prom')
+        with directory.installed():
+            edrn.sync.dmccsync.main(['dmccsync', '-u', 'admin', '-p', 'secret', '-l', 'ldap://localhost',
+                '--metrics=' + summary, users])
+            edrn.sync.dmccmakegroups.main(['dmccgroupsync', '-u', 'admin', '-p', 'secret', '-l', 'ldap://localhost',
+                '--metrics', textfile, users, sites, committees])
+        with open(summary) as f:
+            run = json.load(f)
+        self.assertEqual(u'dmccsync', run['tool'])
+        counters = dict(((c['name'], tuple(sorted(c['labels'].items()))), c['value']) for c in run['counters'])
+        self.assertEqual(40, counters[(u'rdf_entities_parsed', ((u'kind', u'person'),))])
+        self.assertEqual(40, counters[(u'ldap_requests', ((u'op', u'add'),))])
+        self.assertEqual(0, counters[(u'run_failures', ())])
+        self.assertTrue(u'parse' in run['phases'] and u'ldap_write' in run['phases'])
+        with open(textfile) as f:
+            text = f.read()
+        self.assertTrue('edrn_sync_rdf_entities_parsed_total{kind="site",tool="dmccgroupsync"} 4\n' in text)
+        self.assertTrue('edrn_sync_phase_seconds{phase="resolve",tool="dmccgroupsync"}' in text)
+        self.assertFalse(metrics.showProgress)
+
+
+class LDIFExportTest(unittest.TestCase):
+    '''Test writing people and groups as LDIF.'''
+    def setUp(self):
+        super(LDIFExportTest, self).setUp()
+        self.tmpdir = tempfile.mkdtemp()
+        self.users, self.sites, self.committees = generateCorpus(os.path.join(self.tmpdir, 'corpus'), 50)
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+        super(LDIFExportTest, self).tearDown()
+    def _entries(self, text):
+        entries = []
+        for block in text.strip().split('\n\n'):
+            lines = [line.split(': ', 1) for line in block.split('\n')]
+            entries.append((lines[0][1], lines[1:]))
+        return entries
+    def testDirectory(self):
+        '''Make sure people come first, each once, and groups only name people that were written.'''
+        out = StringIO.StringIO()
+        people, groups = edrn.sync.dmccmakegroups.exportDirectory([self.users, self.users], self.sites,
+            self.committees, out)
+        entries = self._entries(out.getvalue())
+        self.assertEqual(50, people)
+        self.assertEqual(people + groups, len(entries))
+        dns = [dn for dn, attrs in entries]
+        self.assertEqual(len(dns), len(set(dns)))
+        self.assertTrue(all(dn.startswith('uid=') for dn in dns[:people]))
+        self.assertTrue(all(dn.startswith('cn=') for dn in dns[people:]))
+        members = set(value for dn, attrs in entries[people:] for name, value in attrs if name == 'uniquemember')
+        self.assertTrue(members)
+        self.assertTrue(members <= set(dns[:people]))
+        for dn, attrs in entries[people:]:
+            values = [value for name, value in attrs if name == 'uniquemember']
+            self.assertEqual(len(values), len(set(values)))
+    def testCommandLine(self):
+        '''Check the --ldif option writes without a server, to a file only its owner can read.'''
+        path = os.path.join(self.tmpdir, 'people.ldif')
+        edrn.sync.dmccsync.main(['dmccsync', '--ldif', path, self.users])
+        self.assertEqual(0600, os.stat(path).st_mode & 0777)
+        with open(path) as f:
+            entries = self._entries(f.read())
+        self.assertEqual(50, len(entries))
+        self.assertTrue(all(dn.startswith('uid=') for dn, attrs in entries))
+        self.assertEqual(2, edrn.sync.dmccsync.main(['dmccsync', '--ldif', path, '--reconcile', self.users]))
+
+
+class _FailingDirectory(MemoryDirectory):
+    '''A directory whose server goes away for good after ``adds`` adds.'''
+    def __init__(self, adds):
+        super(_FailingDirectory, self).__init__()
+        self.adds = adds
+    def add(self, dn, modlist):
+        if self.adds == 0: raise ldap.SERVER_DOWN({'desc': "Can't contact LDAP server", 'info': ''})
+        self.adds -= 1
+        super(_FailingDirectory, self).add(dn, modlist)
+
+
+class _FlakyDirectory(_FailingDirectory):
+    '''A directory whose server goes away once, after ``adds`` adds, and then comes back.'''
+    def add(self, dn, modlist):
+        try:
+            super(_FlakyDirectory, self).add(dn, modlist)
+        except ldap.SERVER_DOWN:
+            self.adds = -1
+            raise
+
+
+class JournalTest(unittest.TestCase):
+    '''Test resuming interrupted runs from a journal.'''
+    def setUp(self):
+        super(JournalTest, self).setUp()
+        self.tmpdir = tempfile.mkdtemp()
+        self.journals = os.path.join(self.tmpdir, 'journals')
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+        super(JournalTest, self).tearDown()
+    def testJournal(self):
+        '''Check keys survive reopening, a torn last line is dropped, and other fingerprints' journals go.'''
+        journal = Journal(self.journals, 'tool', 'abc')
+        journal.record(u'one')
+        journal.record(u'twó')
+        journal.close()
+        with open(journal.path, 'ab') as f:
+            f.write('thr')
+        journal = Journal(self.journals, 'tool', 'abc')
+        self.assertEqual(set([u'one', u'twó']), journal.completed)
+        self.assertEqual(2, journal.resumed)
+        journal.record(u'three')
+        journal.close()
+        self.assertEqual('one\ntw\xc3\xb3\nthree\n', open(journal.path).read())
+        other = Journal(self.journals, 'tool', 'def')
+        self.assertFalse(os.path.exists(journal.path))
+        other.finish()
+        self.assertEqual([], os.listdir(self.journals))
+    def testFingerprint(self):
+        '''A journal's fingerprint follows the parsed entities, in any order, and the server they're written to.'''
+        persons = SourceLoader().loadPersons([generateCorpus(os.path.join(self.tmpdir, 'corpus'), 5)[0]])
+        people = list(persons)
+        self.assertEqual(fingerprint(people, 'ldap://a'), fingerprint(reversed(people), 'ldap://a'))
+        self.assertNotEqual(fingerprint(people, 'ldap://a'), fingerprint(people, 'ldap://b'))
+        self.assertNotEqual(fingerprint(people, 'ldap://a'), fingerprint(people[1:], 'ldap://a'))
+        self.assertNotEqual(fingerprint(people, 'ldap://a'), fingerprint(people, 'ldap://a', True))
+    def testServers(self):
+        '''A run against one server leaves another server's journal alone but replaces its own stale one.'''
+        people = list(SourceLoader().loadPersons([generateCorpus(os.path.join(self.tmpdir, 'corpus'), 5)[0]]))
+        with self.assertRaises(ValueError):
+            with journaling(self.journals, 'tool', people, 'ldap://a') as journal:
+                journal.record(u'one')
+                raise ValueError()
+        with journaling(self.journals, 'tool', people, 'ldap://b') as journal:
+            self.assertEqual(2, len(os.listdir(self.journals)))
+        self.assertEqual(1, len(os.listdir(self.journals)))
+        with journaling(self.journals, 'tool', people[1:], 'ldap://a') as journal:
+            self.assertEqual(0, len(journal))
+            self.assertEqual(1, len(os.listdir(self.journals)))
+    def _run(self, tool, directory, *args):
+        with directory.installed():
+            return tool.main([tool.__name__, '-u', 'admin', '-p', 'secret', '-l', 'ldap://localhost', '--journal',
+                self.journals] + list(args))
+    def testResume(self):
+        '''Interrupt each tool part way and see the next run skip what the first finished.'''
+        users, sites, committees = generateCorpus(os.path.join(self.tmpdir, 'corpus'), 40)
+        failing = _FailingDirectory(25)
+        self.assertRaises(ldap.SERVER_DOWN, self._run, edrn.sync.dmccsync, failing, users)
+        self.assertEqual(1, len(os.listdir(self.journals)))
+        directory = MemoryDirectory()
+        directory.entries = failing.entries
+        self._run(edrn.sync.dmccsync, directory, '--metrics', os.path.join(self.tmpdir, 'm.json'), users)
+        self.assertEqual(25, metrics.get('journal_skipped'))
+        self.assertEqual(15, directory.requests['add'])
+        self.assertEqual(40, len(directory))
+        self.assertEqual([], os.listdir(self.journals))
+        failing = _FailingDirectory(3)
+        failing.entries = directory.entries
+        self.assertRaises(ldap.SERVER_DOWN, self._run, edrn.sync.dmccmakegroups, failing, users, sites, committees)
+        directory = MemoryDirectory()
+        directory.entries = failing.entries
+        self._run(edrn.sync.dmccmakegroups, directory, '--metrics', os.path.join(self.tmpdir, 'm.json'), users,
+            sites, committees)
+        self.assertEqual(3, metrics.get('journal_skipped'))
+        self.assertEqual([], os.listdir(self.journals))
+
+
+class WatcherTest(unittest.TestCase):
+    '''Test keeping the directory in step with the RDF continuously.'''
+    def setUp(self):
+        super(WatcherTest, self).setUp()
+        self.tmpdir = tempfile.mkdtemp()
+        self.corpus = os.path.join(self.tmpdir, 'corpus')
+        self.status = os.path.join(self.tmpdir, 'status.json')
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+        super(WatcherTest, self).tearDown()
+    def testCycles(self):
+        '''Check a cycle writes everything, an idle poll writes nothing, and changed RDF writes just the change.'''
+        users, sites, committees = generateCorpus(self.corpus, 30)
+        directory = MemoryDirectory()
+        with directory.installed():
+            watcher = Watcher([users], sites, committees, 'ldap://localhost', 'admin', 'secret',
+                SourceCache(os.path.join(self.tmpdir, 'cache')), statusFile=self.status)
+            try:
+                watcher.run(cycles=1)
+                self.assertEqual(30, len([dn for dn in directory.entries if dn.startswith('uid=')]))
+                self.assertEqual(1, watcher.status['applied'])
+                requests = sum(directory.requests.values())
+                self.assertEqual(None, watcher.cycle())
+                self.assertEqual(requests, sum(directory.requests.values()))
+                generateCorpus(self.corpus, 35)
+                changes = watcher.cycle()
+                self.assertEqual(5, len(changes.adds))
+            finally:
+                watcher.close()
+        status = json.load(open(self.status))
+        self.assertEqual('stopped', status['state'])
+        self.assertEqual(1, status['cycles'])
+        self.assertEqual(0, status['failures'])
+    def testStop(self):
+        '''Stopping before the first poll leaves the directory alone and the watcher stopped.'''
+        users, sites, committees = generateCorpus(self.corpus, 10)
+        directory = MemoryDirectory()
+        with directory.installed():
+            watcher = Watcher([users], sites, committees, 'ldap://localhost', 'admin', 'secret',
+                SourceCache(os.path.join(self.tmpdir, 'cache')), statusFile=self.status)
+            watcher.stop()
+            watcher.run()
+            watcher.close()
+        self.assertEqual(0, len(directory))
+        self.assertEqual('stopped', json.load(open(self.status))['state'])
+
+
+class SyncAllTest(unittest.TestCase):
+    '''Test running every stage in one process.'''
+    def setUp(self):
+        super(SyncAllTest, self).setUp()
+        self.tmpdir = tempfile.mkdtemp()
+        metrics.reset()
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+        super(SyncAllTest, self).tearDown()
+    def testStages(self):
+        '''Check stages run in order on one bind, and an unknown stage is refused.'''
+        self.assertEqual(('users', 'groups', 'passwords'), parseStages('passwords, Groups,users'))
+        self.assertRaises(ValueError, parseStages, 'users,nothing')
+        users, sites, committees = generateCorpus(self.tmpdir, 20)
+        directory = MemoryDirectory()
+        weak = 'uid=weak,dc=edrn,dc=jpl,dc=nasa,dc=gov'
+        directory.add(weak, [('objectClass', ['edrnPerson']), ('uid', ['weak']),
+            ('userPassword', ['{SHA}' + base64.b64encode(hashlib.sha1('changeme').digest())])])
+        with directory.installed():
+            syncAll(('passwords', 'groups', 'users'), [users], sites, committees, 'ldap://localhost', 'admin',
+                'secret', processes=0)
+        self.assertEqual(1, directory.requests['bind'])
+        people = directory.search('dc=edrn,dc=jpl,dc=nasa,dc=gov', ldap.SCOPE_ONELEVEL, '(objectClass=edrnPerson)',
+            ['1.1'])
+        self.assertEqual(21, len(people))
+        self.assertTrue(len(directory) > 21)
+        self.assertEqual(1, metrics.get('passwords_fixed'))
+    def testStore(self):
+        '''See if stages can take their people, sites, and committees from a store instead of RDF.'''
+        users, sites, committees = generateCorpus(self.tmpdir, 20)
+        store = EntityStore(os.path.join(self.tmpdir, 'store.db'))
+        store.save(*SourceLoader().load([users], [sites], [committees]))
+        directory = MemoryDirectory()
+        with directory.installed():
+            syncAll(('users', 'groups'), [], None, None, 'ldap://localhost', 'admin', 'secret', store=store)
+        store.close()
+        people = directory.search('dc=edrn,dc=jpl,dc=nasa,dc=gov', ldap.SCOPE_ONELEVEL, '(objectClass=edrnPerson)',
+            ['1.1'])
+        self.assertEqual(20, len(people))
+        self.assertTrue(len(directory) > 20)
+
+
+class ChangeFeedTest(unittest.TestCase):
+    '''Test writing only what changed in the RDF since the last run.'''
+    def setUp(self):
+        super(ChangeFeedTest, self).setUp()
+        self.tmpdir = tempfile.mkdtemp()
+        self.corpus = os.path.join(self.tmpdir, 'corpus')
+        self.state = os.path.join(self.tmpdir, 'changes.db')
+        self.directory = MemoryDirectory()
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+        super(ChangeFeedTest, self).tearDown()
+    def testFingerprintFields(self):
+        '''Fingerprints keep their fields apart, so moving text between fields or from None changes them.'''
+        first = RDFPerson(u'urn:p', u'urn:s', u'a@b.c', u'u1', None, u'a\x00b', u'555')
+        second = RDFPerson(u'urn:p', u'urn:s', u'a@b.c', u'u1', u'\x01a', u'b', u'555')
+        self.assertNotEqual(first.fingerprint(), second.fingerprint())
+        self.assertNotEqual(first.fingerprint(), RDFPerson(u'urn:p', u'urn:s', u'a@b.c', u'u1', u'', u'a\x00b',
+            u'555').fingerprint())
+    def _run(self, tool, *args):
+        with self.directory.installed():
+            tool.main([tool.__name__, '-u', 'admin', '-p', 'secret', '-l', 'ldap://localhost', '--changes',
+                self.state] + list(args))
+    def _people(self):
+        return len(self.directory.search('dc=edrn,dc=jpl,dc=nasa,dc=gov', ldap.SCOPE_ONELEVEL,
+            '(objectClass=edrnPerson)', ['1.1']))
+    def testLoadSubset(self):
+        '''See if just the named people and groups are read.'''
+        users, sites, committees = generateCorpus(self.corpus, 10)
+        with self.directory.installed():
+            syncAll(('users', 'groups'), [users], sites, committees, 'ldap://localhost', 'admin', 'secret')
+        persons, sites, committees = SourceLoader().load([users], [sites], [])
+        uid, group = persons[0].uid, edrn.sync.dmccmakegroups.piGroups(sites).keys()[0]
+        snapshot = edrn.sync.syncldap.DirectorySnapshot()
+        snapshot.loadSubset(self.directory.initialize('ldap://localhost'), [uid, u'nobody(*)'], [group])
+        self.assertEqual(set([uid.lower()]), snapshot.uids)
+        self.assertTrue(snapshot.groupExists(group))
+        self.assertTrue(len(snapshot.getMembers(group)) > 0)
+    def testSteadyState(self):
+        '''Check an unchanged feed contacts no server and a changed one writes only the change.'''
+        users, sites, committees = generateCorpus(self.corpus, 30)
+        self._run(edrn.sync.dmccsync, users)
+        self._run(edrn.sync.dmccmakegroups, users, sites, committees)
+        self.assertEqual(30, self._people())
+        groups = len(self.directory) - 30
+        self.assertTrue(groups > 0)
+        requests = dict(self.directory.requests)
+        self._run(edrn.sync.dmccsync, '--reconcile', '--deprovision', users)
+        self._run(edrn.sync.dmccmakegroups, users, sites, committees)
+        self.assertEqual(requests, dict(self.directory.requests))
+        generateCorpus(self.corpus, 35)
+        self._run(edrn.sync.dmccsync, users)
+        self.assertEqual(requests['add'] + 5, self.directory.requests['add'])
+        self.assertEqual(35, self._people())
+        generateCorpus(self.corpus, 32)
+        self._run(edrn.sync.dmccsync, '--reconcile', '--deprovision', users)
+        self.assertEqual(32, self._people())
+        state = FingerprintState(self.state)
+        self.assertEqual(32, state.count('person'))
+        self.assertTrue(state.count('site') > 0)
+        state.close()
+
+
+class ReplicasTest(unittest.TestCase):
+    '''Test writing to several LDAP servers at once.'''
+    def setUp(self):
+        super(ReplicasTest, self).setUp()
+        self.tmpdir = tempfile.mkdtemp()
+        self.users, self.sites, self.committees = generateCorpus(self.tmpdir, 20)
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+        super(ReplicasTest, self).tearDown()
+    def _run(self, tool, directories, *args):
+        servers = []
+        for url in sorted(directories): servers.extend(['-l', url])
+        with installedServers(directories):
+            return tool.main([tool.__name__, '-u', 'admin', '-p', 'secret'] + servers + list(args))
+    def _people(self, directory):
+        return len(directory.search('dc=edrn,dc=jpl,dc=nasa,dc=gov', ldap.SCOPE_ONELEVEL, '(objectClass=edrnPerson)',
+            ['1.1']))
+    def testFanOut(self):
+        '''Check each server gets just what it lacks, from RDF read once, with counters of its own.'''
+        primary, staging = MemoryDirectory(), MemoryDirectory()
+        persons = SourceLoader().loadPersons([self.users])
+        with staging.installed():
+            edrn.sync.dmccsync.sync(persons[:5], 'ldap://staging', 'admin', 'secret')
+        directories = {'ldap://primary': primary, 'ldap://staging': staging}
+        self.assertEqual(None, self._run(edrn.sync.dmccsync, directories, '--metrics',
+            os.path.join(self.tmpdir, 'm.json'), self.users))
+        self.assertEqual((20, 20), (self._people(primary), self._people(staging)))
+        self.assertEqual(20, metrics.get('ldap_requests', op='add', server='ldap://primary'))
+        self.assertEqual(15, metrics.get('ldap_requests', op='add', server='ldap://staging'))
+        self.assertEqual(0, metrics.get('rdf_cache_hits'))
+        self.assertEqual(None, self._run(edrn.sync.dmccmakegroups, directories, '--metrics',
+            os.path.join(self.tmpdir, 'm.json'), self.users, self.sites, self.committees))
+        self.assertTrue(len(primary) > 20)
+        self.assertEqual(sorted(primary.entries), sorted(staging.entries))
+    def testFailure(self):
+        '''One server failing leaves the others to finish and the run to report it.'''
+        failing, working = _FailingDirectory(5), MemoryDirectory()
+        directories = {'ldap://failing': failing, 'ldap://working': working}
+        self.assertEqual(1, self._run(edrn.sync.dmccsync, directories, '--metrics', os.path.join(self.tmpdir,
+            'm.json'), self.users))
+        self.assertEqual((5, 20), (self._people(failing), self._people(working)))
+        self.assertEqual(1, metrics.get('server_failures', server='ldap://failing'))
+        self.assertEqual(2, self._run(edrn.sync.dmccsync, directories, '--journal', self.tmpdir, self.users))
+
+
+class ShardsTest(unittest.TestCase):
+    '''Test syncing people in several shards at once.'''
+    def setUp(self):
+        super(ShardsTest, self).setUp()
+        metrics.reset()
+        self.tmpdir = tempfile.mkdtemp()
+        self.users, self.sites, self.committees = generateCorpus(self.tmpdir, 20)
+        self.persons = SourceLoader().loadPersons([self.users])
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+        super(ShardsTest, self).tearDown()
+    def testShardOf(self):
+        '''A uid lands in the same shard every time, whatever its case.'''
+        self.assertEqual(shardOf(u'jsmith', 4), shardOf(u'JSmith', 4))
+        shards = [shardOf(person.uid, 4) for person in self.persons]
+        self.assertEqual(shards, [shardOf(person.uid, 4) for person in self.persons])
+        self.assertTrue(len(set(shards)) > 1)
+    def testThreads(self):
+        '''Each shard writes its own people, with counters labeled by shard.'''
+        directory = MemoryDirectory()
+        with directory.installed():
+            failures = edrn.sync.dmccsync.syncShards(self.persons, 'ldap://localhost', 'admin', 'secret', 3,
+                processes=False)
+        self.assertEqual({}, failures)
+        self.assertEqual(20, len(directory.search('dc=edrn,dc=jpl,dc=nasa,dc=gov', ldap.SCOPE_ONELEVEL,
+            '(objectClass=edrnPerson)', ['1.1'])))
+        mine = len([person for person in self.persons if shardOf(person.uid, 3) == 0])
+        self.assertEqual(mine, metrics.get('ldap_requests', op='add', shard='0'))
+    def testProcesses(self):
+        '''Counters from worker processes are merged into this one's, and groups follow the people.'''
+        directory = MemoryDirectory()
+        with directory.installed():
+            syncAll(('users', 'groups'), [self.users], self.sites, self.committees, 'ldap://localhost', 'admin',
+                'secret', shards=2)
+        self.assertEqual(20, sum(metrics.get('ldap_requests', op='add', shard=str(i)) for i in range(2)))
+        self.assertTrue(len(directory) > 0)
+    def testFailure(self):
+        '''If a shard fails, groups aren't written.'''
+        directory = _FailingDirectory(0)
+        with directory.installed():
+            self.assertRaises(RuntimeError, syncAll, ('users', 'groups'), [self.users], self.sites,
+                self.committees, 'ldap://localhost', 'admin', 'secret', shards=2)
+        self.assertEqual(0, len(directory))
+        self.assertEqual(2, metrics.total('shard_failures'))
+
+
 class PasswordFunctionsTest(unittest.TestCase):
     u'''Test password generation'''
     def testPasswordGeneration(self):
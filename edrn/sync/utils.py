@@ -3,9 +3,37 @@
 u'''Utilities'''
 
 
-import random, string
+import contextlib, os, os.path, random, string, sys, tempfile
 
 
 def generatePassword():
     corpus = string.ascii_letters + string.digits + string.punctuation
     return ''.join(random.sample(corpus, 16))
+
+
+@contextlib.contextmanager
+def outputFile(path):
+    u'''Context manager that opens ``path`` for writing, readable only by its owner since what's written may
+    include passwords.  For ``-``, give standard output instead and send anything printed meanwhile to standard
+    error, so that it doesn't end up mixed into the output.'''
+    if path == '-':
+        stdout, sys.stdout = sys.stdout, sys.stderr
+        try:
+            yield stdout
+        finally:
+            sys.stdout = stdout
+            stdout.flush()
+        return
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0600)
+    os.fchmod(fd, 0600)
+    with os.fdopen(fd, 'wb') as out:
+        yield out
+
+
+def writeAtomically(path, data):
+    u'''Replace the file at ``path`` with ``data`` in one step, so that nobody reading it ever sees half.'''
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), prefix='.tmp')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+    os.chmod(tmp, 0644)
+    os.rename(tmp, path)
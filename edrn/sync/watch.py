@@ -0,0 +1,173 @@
+# encoding: utf-8
+# Copyright 2026 California Institute of Technology. ALL RIGHTS
+# RESERVED. U.S. Government Sponsorship acknowledged.
+
+u'''Keeping the EDRN directory in step with DMCC continuously.
+
+Rather than starting from nothing on every run, as ``dmccsync`` and ``dmccgroupsync`` do from cron, a
+``Watcher`` stays up: it keeps its LDAP connections bound, its snapshot of the directory up to date as it
+writes, and parsed RDF in a source cache.  Every so often it polls the RDF; when nothing changed it does
+nothing more, and when something did it reconciles people and groups with the snapshot, sending only what
+differs.  The snapshot is read afresh now and then, and after any failure, to catch changes made by others.
+
+Only one generation of parsed RDF is held at a time, so memory stays within what one run would need.  A
+status file says what the watcher is doing and how its last cycles went, for a supervisor to check, and
+SIGTERM or SIGINT stop it once the cycle under way is done.
+'''
+
+from dmccmakegroups import piGroups, collabGroups, writeGroups
+from dmccsync import reconcile, reconcileSnapshot
+from instrumentation import metrics
+from ldapwriter import defaultWindow, throttle
+from rdfcache import SourceCache
+from rdfloader import SourceLoader, defaultWorkers
+from syncldap import ConnectionPool
+from utils import writeAtomically
+import argparse, getpass, json, os, shutil, signal, sys, tempfile, threading, time, traceback
+
+# Default seconds between polls of the RDF, and between fresh reads of the whole directory
+defaultInterval = 300
+defaultRefresh = 3600
+
+
+class Watcher(object):
+    '''Keeps the people from ``userURLs`` and the groups from ``siteURL`` and ``committeeURL`` in the LDAP
+    server at ``ldapUrl`` in step with the RDF, polling every ``interval`` seconds.  ``cache`` (an
+    ``edrn.sync.rdfcache.SourceCache``) tells which sources changed; ``statusFile``, if given, is rewritten as
+    the watcher goes; ``metricsFile``, if given, gets a summary of each cycle as with ``--metrics``.  Writes in
+    each cycle adapt to the server as ``edrn.sync.ldapwriter.Throttle`` does, aiming for ``maxLatency`` and
+    sending at most ``maxRate`` a second if given.'''
+    def __init__(self, userURLs, siteURL, committeeURL, ldapUrl, adminUser, adminPass, cache, interval=defaultInterval,
+        refresh=defaultRefresh, window=defaultWindow, jobs=defaultWorkers, deprovision=False, pruneMembers=False,
+        statusFile=None, metricsFile=None, maxLatency=None, maxRate=None):
+        self.userURLs, self.siteURL, self.committeeURL = list(userURLs), siteURL, committeeURL
+        self.ldapUrl, self.adminUser, self.adminPass = ldapUrl, adminUser, adminPass
+        self.cache, self.interval, self.refresh = cache, interval, refresh
+        self.window, self.deprovision, self.pruneMembers = window, deprovision, pruneMembers
+        self.statusFile, self.metricsFile = statusFile, metricsFile
+        self.maxLatency, self.maxRate = maxLatency, maxRate
+        self.loader = SourceLoader(cache, workers=jobs)
+        self.pool = ConnectionPool(ldapUrl, adminUser, adminPass)
+        self.snapshot, self.snapshotTime = None, 0.0
+        self._stopping = threading.Event()
+        self._dirty = True
+        self.status = dict(pid=os.getpid(), state='starting', started=time.time(), cycles=0, applied=0,
+            failures=0, consecutiveFailures=0, lastPoll=None, lastChange=None, lastSuccess=None, lastError=None,
+            lastErrorTime=None, lastChanges=None, nextPoll=None)
+    def _update(self, **values):
+        self.status.update(values)
+        if self.statusFile: writeAtomically(self.statusFile, json.dumps(self.status, indent=2))
+    def _sources(self):
+        return self.loader.sources(self.userURLs, [self.siteURL], [self.committeeURL])
+    def cycle(self):
+        '''Poll the RDF once and, if it changed since the last cycle (or the last cycle failed), bring the
+        directory in line with it.  Return the ``ChangeSet`` applied to people, or None if nothing changed.'''
+        misses = self.cache.misses
+        records = self.loader.fetch(self._sources())
+        if self.cache.misses == misses and not self._dirty:
+            return None
+        # Failing part way leaves the directory and snapshot unknown, so the next cycle starts over
+        self._dirty = True
+        persons, sites, committees = self.loader.build(records, self.userURLs, [self.siteURL], [self.committeeURL])
+        del records
+        if self.snapshot is None or time.time() - self.snapshotTime >= self.refresh:
+            snapshot = reconcileSnapshot()
+            self.pool.run(snapshot.load)
+            self.snapshot, self.snapshotTime = snapshot, time.time()
+        changes = reconcile(persons, self.ldapUrl, self.adminUser, self.adminPass, pool=self.pool, window=self.window,
+            deprovision=self.deprovision, snapshot=self.snapshot)
+        writeGroups(piGroups(sites), self.ldapUrl, self.adminUser, self.adminPass, self.pool, self.snapshot,
+            self.window, self.pruneMembers)
+        writeGroups(collabGroups(committees), self.ldapUrl, self.adminUser, self.adminPass, self.pool, self.snapshot,
+            self.window, self.pruneMembers)
+        self._dirty = False
+        return changes
+    def run(self, cycles=None):
+        '''Poll and apply changes until stopped, or for just ``cycles`` cycles if given.'''
+        done = 0
+        while not self._stopping.is_set():
+            self._update(state='syncing', lastPoll=time.time(), nextPoll=None)
+            try:
+                with metrics.recording('dmccwatch', self.metricsFile), throttle.limiting(self.maxLatency, self.maxRate):
+                    changes = self.cycle()
+            except Exception, ex:
+                traceback.print_exc()
+                # Don't trust the snapshot after a failure
+                self.snapshot = None
+                self._update(failures=self.status['failures'] + 1,
+                    consecutiveFailures=self.status['consecutiveFailures'] + 1, lastError=unicode(ex) or repr(ex),
+                    lastErrorTime=time.time())
+            else:
+                values = dict(consecutiveFailures=0, lastSuccess=time.time())
+                if changes is not None:
+                    values.update(applied=self.status['applied'] + 1, lastChange=time.time(), lastChanges=str(changes))
+                self._update(**values)
+            done += 1
+            self._update(cycles=self.status['cycles'] + 1)
+            if cycles is not None and done >= cycles: break
+            self._update(state='idle', nextPoll=time.time() + self.interval)
+            self._stopping.wait(self.interval)
+        self._update(state='stopped', nextPoll=None)
+    def stop(self, *args):
+        '''Ask the watcher to stop once the cycle under way, if any, is done.  Takes the arguments of a signal
+        handler, so it can be one.'''
+        if not self._stopping.is_set(): self._update(state='stopping')
+        self._stopping.set()
+    def close(self):
+        '''Unbind our LDAP connections.'''
+        self.pool.close()
+
+
+_argParser = argparse.ArgumentParser(description=u'Keep EDRN LDAP in step with DMCC RDF, polling on a schedule')
+_argParser.add_argument('-u', '--user', required=True, help=u'LDAP DN of a user who may add and change entries')
+_argParser.add_argument('-p', '--password', help=u"That user's password; if not given, you'll be prompted")
+_argParser.add_argument('-l', '--ldapUrl', required=True, help=u'URL of the LDAP server to keep in step')
+_argParser.add_argument('-c', '--cache',
+    help=u'Directory in which to cache parsed RDF; default a temporary one removed on exit')
+_argParser.add_argument('-i', '--interval', type=float, default=defaultInterval,
+    help=u'Seconds between polls of the RDF; default %(default)s')
+_argParser.add_argument('-r', '--refresh', type=float, default=defaultRefresh,
+    help=u'Seconds between fresh reads of the whole directory; default %(default)s')
+_argParser.add_argument('-w', '--window', type=int, default=defaultWindow,
+    help=u'Most LDAP writes to keep in flight at once, adapting to the server; default %(default)s')
+_argParser.add_argument('-j', '--jobs', type=int, default=defaultWorkers,
+    help=u'How many RDF sources to fetch and parse at once; default %(default)s')
+_argParser.add_argument('--max-rate', type=float, metavar='OPS', help=u'Most LDAP writes to send a second')
+_argParser.add_argument('--max-latency', type=float, metavar='SECONDS',
+    help=u'Narrow the window of writes when they take longer than this; default four times the quickest seen')
+_argParser.add_argument('-d', '--deprovision', action='store_true',
+    help=u'Delete people who are no longer in the RDF')
+_argParser.add_argument('-m', '--prune-members', action='store_true',
+    help=u"Remove group members who aren't in the RDF")
+_argParser.add_argument('-s', '--status', help=u'File to keep up to date with the state of the watcher, as JSON')
+_argParser.add_argument('--metrics', metavar='FILE',
+    help=u'Save counts and timings of each cycle to FILE: Prometheus text format if it ends in .prom, JSON otherwise')
+_argParser.add_argument('-1', '--once', action='store_true', help=u'Run one cycle and exit')
+_argParser.add_argument('urls', nargs='+', metavar='URL',
+    help=u'One or more user RDF URLs, then the site RDF URL, then the committee RDF URL')
+
+
+def main():
+    args = _argParser.parse_args()
+    if len(args.urls) < 3: _argParser.error(u'Give at least one user RDF URL, a site RDF URL, and a committee RDF URL')
+    if args.interval <= 0 or args.window < 1 or args.jobs < 1:
+        _argParser.error(u'The interval, window, and jobs must all be positive')
+    if args.max_rate is not None and args.max_rate <= 0 or args.max_latency is not None and args.max_latency <= 0:
+        _argParser.error(u'The rate and latency must be positive')
+    password = args.password if args.password else getpass.getpass(u'LDAP password: ')
+    cacheDir = args.cache if args.cache else tempfile.mkdtemp(prefix='dmccwatch')
+    watcher = Watcher(args.urls[:-2], args.urls[-2], args.urls[-1], args.ldapUrl, args.user, password,
+        SourceCache(cacheDir), args.interval, args.refresh, args.window, args.jobs, args.deprovision,
+        args.prune_members, args.status, args.metrics, args.max_latency, args.max_rate)
+    signal.signal(signal.SIGTERM, watcher.stop)
+    signal.signal(signal.SIGINT, watcher.stop)
+    try:
+        watcher.run(1 if args.once else None)
+    finally:
+        watcher.close()
+        if not args.cache: shutil.rmtree(cacheDir, ignore_errors=True)
+    return watcher.status['consecutiveFailures'] == 0
+
+
+if __name__ == '__main__':
+    sys.exit(0 if main() else -1)
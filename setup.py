@@ -62,6 +62,11 @@ setup(
             'dmccsync = edrn.sync.dmccsync:main',
             'dmccgroupsync = edrn.sync.dmccmakegroups:main',
             'secureoldpasswords = edrn.sync.oldpasswords:main',
+            'dmcccorpus = edrn.sync.corpus:main',
+            'dmccbench = edrn.sync.benchmark:main',
+            'dmccwatch = edrn.sync.watch:main',
+            'dmccsyncall = edrn.sync.syncall:main',
+            'dmccstore = edrn.sync.store:main',
         ],
     }, 
     package_data = {